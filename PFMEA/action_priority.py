@@ -0,0 +1,89 @@
+# AIAG-VDA FMEAハンドブックの処置優先度（AP：H／M／L）
+# S・O・D（各1〜10）の組み合わせ1,000通りを事前に計算した表を持ち、
+# 1件ずつの判定は文字列の参照、まとめての判定はNumPy配列の参照で行う
+# S・O・Dのいずれかが1〜10の範囲外の場合はAPを判定しない（None。DBではNULLのまま残し、
+# database.find_inconsistent_records で範囲外として報告する）
+
+# 区分の境界：(下限, 上限)
+S_BANDS = [(9, 10), (7, 8), (4, 6), (2, 3), (1, 1)]
+O_BANDS = [(8, 10), (6, 7), (4, 5), (2, 3), (1, 1)]
+D_BANDS = [(7, 10), (5, 6), (2, 4), (1, 1)]
+
+# AP規則表：S区分 -> O区分 -> D区分（7-10, 5-6, 2-4, 1）の順
+RULES = {
+    (9, 10): {
+        (8, 10): "HHHH",
+        (6, 7):  "HHHH",
+        (4, 5):  "HHHM",
+        (2, 3):  "HMLL",
+        (1, 1):  "LLLL",
+    },
+    (7, 8): {
+        (8, 10): "HHHH",
+        (6, 7):  "HHHM",
+        (4, 5):  "HMMM",
+        (2, 3):  "MMLL",
+        (1, 1):  "LLLL",
+    },
+    (4, 6): {
+        (8, 10): "HHMM",
+        (6, 7):  "MMML",
+        (4, 5):  "MLLL",
+        (2, 3):  "LLLL",
+        (1, 1):  "LLLL",
+    },
+    (2, 3): {
+        (8, 10): "MMLL",
+        (6, 7):  "LLLL",
+        (4, 5):  "LLLL",
+        (2, 3):  "LLLL",
+        (1, 1):  "LLLL",
+    },
+    (1, 1): {
+        (8, 10): "LLLL",
+        (6, 7):  "LLLL",
+        (4, 5):  "LLLL",
+        (2, 3):  "LLLL",
+        (1, 1):  "LLLL",
+    },
+}
+
+def _band(value: int, bands: list[tuple[int, int]]) -> tuple[int, int]:
+    return next(b for b in bands if b[0] <= value <= b[1])
+
+def _build_table() -> str:
+    table = []
+    for s in range(1, 11):
+        for o in range(1, 11):
+            for d in range(1, 11):
+                row = RULES[_band(s, S_BANDS)][_band(o, O_BANDS)]
+                table.append(row[D_BANDS.index(_band(d, D_BANDS))])
+    return "".join(table)
+
+# 索引 (S-1)*100 + (O-1)*10 + (D-1) -> "H" / "M" / "L"
+AP_TABLE = _build_table()
+
+_ap_array = None
+
+def action_priority(severity: int, occurrence: int, detection: int) -> str | None:
+    """
+    1件分のAPを返す（S/O/Dのいずれかが範囲外なら None）
+    """
+    if not all(1 <= v <= 10 for v in (severity, occurrence, detection)):
+        return None
+    return AP_TABLE[(int(severity) - 1) * 100 + (int(occurrence) - 1) * 10 + (int(detection) - 1)]
+
+def action_priority_array(severity, occurrence, detection):
+    """
+    S・O・Dの配列（NumPy配列・pandasのSeries）からAPの配列をまとめて求める
+    S/O/Dのいずれかが範囲外の要素は None
+    """
+    import numpy as np
+
+    global _ap_array
+    if _ap_array is None:
+        _ap_array = np.array(list(AP_TABLE), dtype=object)
+    s, o, d = (np.asarray(v, dtype=np.int64) for v in (severity, occurrence, detection))
+    valid = (s >= 1) & (s <= 10) & (o >= 1) & (o <= 10) & (d >= 1) & (d <= 10)
+    idx = np.where(valid, (s - 1) * 100 + (o - 1) * 10 + (d - 1), 0)
+    return np.where(valid, _ap_array[idx], None)
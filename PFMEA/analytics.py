@@ -0,0 +1,64 @@
+import sqlite3
+
+from database import get_connection, build_where
+
+# 集計用の索引（初回のみ作成）
+# GROUP BY の列を先頭に置き、ステータス・業種での絞り込みも索引だけで処理できるようにする
+ANALYTICS_INDEXES = [
+    """CREATE INDEX IF NOT EXISTS idx_pfmea_fm_rpn ON pfmea_records (
+        failure_mode, status, industry, rpn
+    )""",
+    """CREATE INDEX IF NOT EXISTS idx_pfmea_proc_prod_scores ON pfmea_records (
+        process, product, status, industry, severity, occurrence, detection, rpn
+    )""",
+]
+
+def initialize_analytics():
+    with get_connection() as conn:
+        for sql in ANALYTICS_INDEXES:
+            conn.execute(sql)
+        conn.commit()
+
+def _query(sql: str, params: list) -> list[dict]:
+    with get_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(sql, params).fetchall()
+    return [dict(r) for r in rows]
+
+def rpn_pareto(filters: dict, limit: int = 30) -> tuple[list[dict], int]:
+    """
+    故障モード別のRPN合計の上位と、全体のRPN合計を返す
+    戻り値: ([{"failure_mode", "count", "sum_rpn", "avg_rpn", "max_rpn"}, ...], 全体のRPN合計)
+    """
+    where, params = build_where(**filters)
+    rows = _query(f"""
+        SELECT failure_mode,
+               COUNT(*)  AS count,
+               SUM(rpn)  AS sum_rpn,
+               AVG(rpn)  AS avg_rpn,
+               MAX(rpn)  AS max_rpn
+        FROM pfmea_records{where}
+        GROUP BY failure_mode
+        ORDER BY sum_rpn DESC
+        LIMIT ?
+    """, params + [limit])
+    total = _query(
+        f"SELECT COALESCE(SUM(rpn), 0) AS total FROM pfmea_records{where}", params
+    )[0]["total"]
+    return rows, total
+
+def score_matrix(filters: dict, threshold: int) -> list[dict]:
+    """
+    工程×製品ごとの件数、S/O/D平均、RPNが閾値以上の件数を返す
+    """
+    where, params = build_where(**filters)
+    return _query(f"""
+        SELECT process, product,
+               COUNT(*)                         AS count,
+               AVG(severity)                    AS avg_s,
+               AVG(occurrence)                  AS avg_o,
+               AVG(detection)                   AS avg_d,
+               SUM(rpn >= ?)                    AS over_threshold
+        FROM pfmea_records{where}
+        GROUP BY process, product
+    """, [threshold] + params)
@@ -1,57 +1,226 @@
-import json
+from __future__ import annotations
+
+import sys
 import streamlit as st
 from pathlib import Path
 
-from database import initialize_db, insert_records
+# 共通パッケージ ryuju（リポジトリ直下）を読み込めるようにする
+ROOT_DIR = str(Path(__file__).resolve().parents[1])
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from ryuju.auth import check_password
+from ryuju.lazy import lazy_import
+from ryuju.master import load_master
+
+from database import (
+    initialize_db, insert_records, build_insert_records,
+    save_draft, save_draft_fields, load_draft, delete_draft
+)
 from prompt_builder import build_prompt
-from parser import parse_llm_output, to_display_records, DISPLAY_NAMES
+from parser import parse_llm_output, to_display_records, diff_records, DISPLAY_NAMES
+from llm_cache import initialize_cache, get_cached_response, put_cached_response
+from timing import timed, show_timings
+from score_suggester import ScoreSuggester, initial_scores_from
+from action_priority import action_priority_array
+
+# 重い依存は最初に使う時点で読み込む（ログイン画面の表示を軽くする）
+pd = lazy_import("pandas")
+
+SCORE_KEYS = ["severity", "occurrence", "detection"]
+
+# 評点入力グリッドの列定義
+SCORE_COLUMN_CONFIG = {
+    "diff_status":  st.column_config.TextColumn("区分", help="再取り込み時の前回との比較（継続は評点を引き継ぎ）"),
+    "failure_mode": st.column_config.TextColumn("故障モード", width="large"),
+    "effect":       st.column_config.TextColumn("故障の影響", width="large"),
+    "severity":     st.column_config.NumberColumn("厳しさ（S）", min_value=1, max_value=10, step=1, required=True),
+    "occurrence":   st.column_config.NumberColumn("発生頻度（O）", min_value=1, max_value=10, step=1, required=True),
+    "detection":    st.column_config.NumberColumn("検出度（D）", min_value=1, max_value=10, step=1, required=True),
+    "rpn":          st.column_config.NumberColumn("RPN"),
+    "action_priority": st.column_config.TextColumn("AP", help="AIAG-VDAの処置優先度（H：高／M：中／L：低）"),
+    "remarks":      st.column_config.TextColumn("備考（任意）"),
+    "ref_id":       st.column_config.NumberColumn("参考No.", help="評点の初期値に使用した承認済みレコードのNo."),
+    "similarity":   st.column_config.NumberColumn("類似度", format="%.2f"),
+}
+
+@st.cache_resource
+def get_suggester() -> ScoreSuggester:
+    # 全セッション共通の索引。参照のたびに差分だけ追加する
+    return ScoreSuggester()
+
+def carry_over_scores(matches: list[tuple[str, int | None]], prev_df: pd.DataFrame, initial_scores: list[dict]) -> list[dict]:
+    """
+    diff_recordsの対応付け結果をもとに、継続レコードへ前回の評点・備考を引き継ぐ
+    変更・新規のレコードは評点候補（initial_scores）のまま
+    """
+    carried = []
+    for (status, prev_idx), init in zip(matches, initial_scores):
+        if status == "継続":
+            prev = prev_df.iloc[prev_idx]
+            init = {
+                "severity":    int(prev["severity"]),
+                "occurrence":  int(prev["occurrence"]),
+                "detection":   int(prev["detection"]),
+                "ref_id":      None if pd.isna(prev["ref_id"]) else int(prev["ref_id"]),
+                "similarity":  None if pd.isna(prev["similarity"]) else float(prev["similarity"]),
+                "remarks":     str(prev["remarks"]),
+            }
+        carried.append({**init, "diff_status": status})
+    return carried
+
+def build_score_df(records: list[dict], initial_scores: list[dict], fields: dict = None) -> pd.DataFrame:
+    """
+    パース済みレコードから評点入力用のDataFrameを生成する
+    initial_scores: 各レコードの評点初期値
+    fields: 下書きから復元する編集済みセル {(row_idx, field): value}
+    """
+    df = pd.DataFrame(records, columns=["failure_mode", "effect"])
+    for key in SCORE_KEYS:
+        df[key] = [init[key] for init in initial_scores]
+    df["remarks"] = [init.get("remarks", "") for init in initial_scores]
+    for (row, col), value in (fields or {}).items():
+        if row < len(df) and col in df.columns:
+            df.at[row, col] = value
+    df["rpn"] = df["severity"] * df["occurrence"] * df["detection"]
+    df["action_priority"] = action_priority_array(df["severity"], df["occurrence"], df["detection"])
+    df["ref_id"] = pd.array([init["ref_id"] for init in initial_scores], dtype="Int64")
+    df["similarity"] = [init["similarity"] for init in initial_scores]
+    df["diff_status"] = [init.get("diff_status", "新規") for init in initial_scores]
+    return df
+
+def apply_score_edits():
+    """
+    グリッドの編集内容をscore_dfに反映し、RPNをまとめて再計算する
+    エディタはバージョン付きキーで作り直し、再計算後のRPNを表示させる
+    変更されたセルのみを、編集のたびにそのまま下書きに書き込む
+    （1回の編集は数セルのUPSERTで済むため、間引かずに書き込んで再読み込み・タブを閉じた場合の取りこぼしを防ぐ）
+    """
+    ver = st.session_state["score_editor_ver"]
+    edits = st.session_state[f"score_editor_{ver}"]["edited_rows"]
+    old = st.session_state["score_df"]
+    df = old.copy()
+    for row, changes in edits.items():
+        for col, value in changes.items():
+            df.at[int(row), col] = value
+
+    df[SCORE_KEYS] = df[SCORE_KEYS].fillna(1).clip(1, 10).astype(int)
+    df["remarks"] = df["remarks"].fillna("")
+    df["rpn"] = df["severity"] * df["occurrence"] * df["detection"]
+    df["action_priority"] = action_priority_array(df["severity"], df["occurrence"], df["detection"])
+
+    changed = {}
+    for row, changes in edits.items():
+        row = int(row)
+        for col in changes:
+            if col in SCORE_KEYS:
+                value = int(df.at[row, col])
+            elif col == "remarks":
+                value = str(df.at[row, col])
+            else:
+                continue
+            if value != old.at[row, col]:
+                changed[(row, col)] = value
+
+    st.session_state["score_df"] = df
+    st.session_state["score_editor_ver"] = ver + 1
+    save_draft_fields(st.session_state["emp_id"], changed)
+
+def restore_draft(draft: dict):
+    st.session_state["parsed_records"] = draft["parsed_records"]
+    st.session_state["parse_meta"] = draft["parse_meta"]
+    st.session_state["score_df"] = build_score_df(
+        draft["parsed_records"], draft["initial_scores"], draft["fields"]
+    )
+    st.session_state["score_editor_ver"] = st.session_state.get("score_editor_ver", 0) + 1
 
-MASTER_PATH = Path(__file__).parent / "master_data.json"
+def discard_draft():
+    delete_draft(st.session_state["emp_id"])
 
-def load_master() -> dict:
-    with open(MASTER_PATH, encoding="utf-8") as f:
-        return json.load(f)
+def build_score_records(records: list[dict], df: pd.DataFrame, meta: dict) -> list[dict]:
+    """
+    評点入力済みのDataFrameとparse_metaから登録用レコードリストを生成する
+    """
+    return build_insert_records(records, df.to_dict("records"), meta)
 
-def check_password():
-    if "logged_in" not in st.session_state:
-        st.session_state.logged_in = False
+def criteria_to_df(criteria: list[dict]) -> pd.DataFrame:
+    return pd.DataFrame(criteria, columns=["rank", "summary", "detail"]).rename(
+        columns={"rank": "ランク", "summary": "概要", "detail": "詳細"}
+    )
 
-    if st.session_state.logged_in:
-        return True
+def clear_import_state():
+    for key in ("parsed_records", "parse_meta", "generated_prompt",
+                "cached_response", "score_df"):
+        st.session_state.pop(key, None)
+
+@st.fragment
+def scoring_section(master: dict):
+    """
+    評点入力・登録の区画
+    フラグメントとして、グリッドの編集時はこの区画のみ再実行する
+    """
+    with timed("④ 評点入力"):
+        st.divider()
+        st.header("④ 評点入力・登録")
+        st.caption("表の厳しさ（S）・発生頻度（O）・検出度（D）・備考を直接編集してください。RPNとAPは自動計算されます。")
+
+        meta = st.session_state["parse_meta"]
+
+        # 評価基準参照（全レコード共通で1回だけ表示）
+        criteria = master["evaluation_criteria"]
+        with st.expander("📋 評価基準を参照する"):
+            tab1, tab2, tab3 = st.tabs(["厳しさ（S）", "発生頻度（O）", "検出度（D）"])
+            for tab, name in zip((tab1, tab2, tab3), ("厳しさ", "発生頻度", "検出度")):
+                with tab:
+                    st.dataframe(
+                        criteria_to_df(criteria[name]),
+                        hide_index=True,
+                        use_container_width=True
+                    )
 
-    st.markdown("## 🔒 龍樹（P-FMEA）ログイン")
-    st.info("社員番号とパスワードを入力してください。")
+        ver = st.session_state["score_editor_ver"]
+        st.data_editor(
+            st.session_state["score_df"],
+            key=f"score_editor_{ver}",
+            on_change=apply_score_edits,
+            column_config=SCORE_COLUMN_CONFIG,
+            column_order=list(SCORE_COLUMN_CONFIG.keys()),
+            disabled=["diff_status", "failure_mode", "effect", "rpn", "action_priority", "ref_id", "similarity"],
+            hide_index=True,
+            use_container_width=True
+        )
 
-    col1, col2 = st.columns(2)
-    with col1:
-        input_emp_id = st.text_input("社員番号（数字4桁）", max_chars=4, placeholder="例：1234")
-    with col2:
-        input_password = st.text_input("パスワード", type="password")
-
-    if st.button("ログイン", type="primary"):
-        CORRECT_PASSWORD = "wako0001"
-        if not input_emp_id.isdigit() or len(input_emp_id) != 4:
-            st.error("❌ 社員番号は「数字4桁」で入力してください。")
-            return False
-        if input_password == CORRECT_PASSWORD:
-            st.session_state.logged_in = True
-            st.session_state.emp_id = input_emp_id
-            st.success("ログイン成功")
+        st.divider()
+        if st.button("データベースに登録する", type="primary"):
+            count = insert_records(build_score_records(
+                st.session_state["parsed_records"], st.session_state["score_df"], meta
+            ))
+            delete_draft(st.session_state["emp_id"])
+            st.success(f"{count}件をデータベースに登録しました。（ステータス：洗い出し中）")
+            clear_import_state()
             st.rerun()
-            return True
-        else:
-            st.error("❌ パスワードが違います。")
-            return False
-
-    return False
 
 def main():
     st.set_page_config(page_title="龍樹（P-FMEA）確認・出力", page_icon="🌳", layout="wide")
     initialize_db()
+    initialize_cache()
+    show_timings()
 
     st.title("龍樹（P-FMEA）洗い出しアプリ")
     master = load_master()
 
+    # 前回のセッションで入力途中だった下書きの再開
+    if "parsed_records" not in st.session_state:
+        draft = load_draft(st.session_state["emp_id"])
+        if draft:
+            st.info(
+                f"入力途中の下書きがあります。（{len(draft['parsed_records'])}件・"
+                f"最終更新 {draft['updated_at'][:16].replace('T', ' ')}）"
+            )
+            col_resume, col_discard = st.columns(2)
+            col_resume.button("下書きを再開する", on_click=restore_draft, args=(draft,), type="primary")
+            col_discard.button("下書きを破棄する", on_click=discard_draft)
+
     # ----------------------------------------
     # 区画1：対象情報入力
     # ----------------------------------------
@@ -105,6 +274,7 @@ def main():
         else:
             prompt = build_prompt(industry, product.strip(), process, params)
             st.session_state["generated_prompt"] = prompt
+            st.session_state["cached_response"] = get_cached_response(prompt)
 
     if "generated_prompt" in st.session_state:
         st.text_area(
@@ -115,6 +285,19 @@ def main():
         )
         st.info("⬆️ 上のテキストエリア内をクリックして全選択（Ctrl+A）→ コピー（Ctrl+C）し、ChatGPTに貼り付けて実行してください。")
 
+        cached = st.session_state.get("cached_response")
+        if cached:
+            st.success(
+                f"キャッシュヒット：同じプロンプトの出力が保存されています。"
+                f"（参照回数 {cached['hit_count']}回）ChatGPTを実行せずに取り込めます。"
+            )
+            st.button(
+                "保存済みの出力を貼り付ける",
+                on_click=lambda: st.session_state.update(llm_output=cached["response"])
+            )
+        else:
+            st.caption("キャッシュミス：このプロンプトの保存済み出力はありません。")
+
     # ----------------------------------------
     # 区画3：LLM出力の取り込み
     # ----------------------------------------
@@ -133,17 +316,52 @@ def main():
         else:
             records, error = parse_llm_output(llm_output)
             if error:
+                # 取り込み済みのレコードと評点はそのまま残す
                 st.error(error)
-                st.session_state.pop("parsed_records", None)
             else:
-                st.session_state["parsed_records"] = records
-                st.session_state["parse_meta"] = {
+                meta = {
                     "industry": industry,
                     "product": product.strip(),
                     "process": process,
                     "params": params
                 }
+                with timed("評点候補の検索"):
+                    suggester = get_suggester()
+                    suggester.refresh()
+                    suggestions = suggester.suggest_batch(
+                        process, [r["failure_mode"] for r in records]
+                    )
+                initial_scores = initial_scores_from(suggestions)
+
+                # 同じ対象への再取り込みなら、前回から内容が変わっていないレコードの評点を引き継ぐ
+                prev_meta = st.session_state.get("parse_meta")
+                if "score_df" in st.session_state and prev_meta and all(
+                    prev_meta[k] == meta[k] for k in ("industry", "product", "process")
+                ):
+                    matches, removed = diff_records(st.session_state["parsed_records"], records)
+                    initial_scores = carry_over_scores(
+                        matches, st.session_state["score_df"], initial_scores
+                    )
+                    counts = {label: sum(1 for m, _ in matches if m == label) for label in ("継続", "変更", "新規")}
+                    st.info(
+                        f"前回の取り込みと比較しました。継続 {counts['継続']}件（評点を引き継ぎ）・"
+                        f"変更 {counts['変更']}件・新規 {counts['新規']}件・削除 {removed}件"
+                    )
+
+                st.session_state["parsed_records"] = records
+                st.session_state["parse_meta"] = meta
+                st.session_state["score_df"] = build_score_df(records, initial_scores)
+                st.session_state["score_editor_ver"] = st.session_state.get("score_editor_ver", 0) + 1
+                save_draft(st.session_state["emp_id"], meta, records, initial_scores)
                 st.success(f"{len(records)}件の故障モードを取り込みました。")
+                matched = sum(1 for sug in suggestions if sug)
+                if matched:
+                    st.info(f"{matched}件に過去の承認済みレコードの評点を初期値として設定しました。（参考No.列を参照）")
+
+                # 検証済みの出力のみキャッシュに登録する
+                # キーは実際にコピーされたプロンプト（生成後に入力を変えても別のプロンプトで登録しない）
+                if "generated_prompt" in st.session_state:
+                    put_cached_response(st.session_state["generated_prompt"], llm_output)
 
     if "parsed_records" in st.session_state:
         st.dataframe(
@@ -155,87 +373,9 @@ def main():
     # 区画4：評点入力・登録
     # ----------------------------------------
     if "parsed_records" in st.session_state:
-        st.divider()
-        st.header("④ 評点入力・登録")
-        st.caption("各故障モードに対して厳しさ（S）・発生頻度（O）・検出度（D）を入力してください。")
-
-        records   = st.session_state["parsed_records"]
-        meta      = st.session_state["parse_meta"]
-        scores    = []
-        all_valid = True
-
-        for i, rec in enumerate(records):
-            with st.expander(f"{i + 1}. {rec['failure_mode']}", expanded=True):
-                c1, c2, c3, c4 = st.columns([3, 1, 1, 1])
-                with c1:
-                    st.markdown(f"**故障の影響：** {rec['effect']}")
-                with c2:
-                    s = st.number_input(
-                        "厳しさ（S）", min_value=1, max_value=10,
-                        key=f"s_{i}"
-                    )
-                with c3:
-                    o = st.number_input(
-                        "発生頻度（O）", min_value=1, max_value=10,
-                        key=f"o_{i}"
-                    )
-                with c4:
-                    d = st.number_input(
-                        "検出度（D）", min_value=1, max_value=10,
-                        key=f"d_{i}"
-                    )
-                rpn = s * o * d
-                st.metric("RPN", rpn)
-
-                # 評価基準参照
-                criteria = master["evaluation_criteria"]
-                with st.expander("📋 評価基準を参照する"):
-                    tab1, tab2, tab3 = st.tabs(["厳しさ（S）", "発生頻度（O）", "検出度（D）"])
-                    with tab1:
-                        for c in criteria["厳しさ"]:
-                            selected = "　◀ 現在の選択" if c["rank"] == s else ""
-                            st.markdown(f"**{c['rank']}　{c['summary']}**{selected}")
-                            st.caption(c["detail"])
-                    with tab2:
-                        for c in criteria["発生頻度"]:
-                            selected = "　◀ 現在の選択" if c["rank"] == o else ""
-                            st.markdown(f"**{c['rank']}　{c['summary']}**{selected}")
-                            st.caption(c["detail"])
-                    with tab3:
-                        for c in criteria["検出度"]:
-                            selected = "　◀ 現在の選択" if c["rank"] == d else ""
-                            st.markdown(f"**{c['rank']}　{c['summary']}**{selected}")
-                            st.caption(c["detail"])
-
-                remarks = st.text_input("備考（任意）", key=f"rem_{i}")
-
-                scores.append({
-                    **rec,
-                    "industry":  meta["industry"],
-                    "product":   meta["product"],
-                    "process":   meta["process"],
-                    "gate_type": meta["params"].get("ゲート方式"),
-                    "has_insert": (
-                        1 if meta["params"].get("インサート部品") == "あり"
-                        else 0 if meta["params"].get("インサート部品") == "なし"
-                        else None
-                    ),
-                    "severity":   s,
-                    "occurrence": o,
-                    "detection":  d,
-                    "rpn":        rpn,
-                    "remarks":    remarks
-                })
-
-        st.divider()
-        if st.button("データベースに登録する", type="primary"):
-            count = insert_records(scores)
-            st.success(f"{count}件をデータベースに登録しました。（ステータス：洗い出し中）")
-            st.session_state.pop("parsed_records", None)
-            st.session_state.pop("parse_meta", None)
-            st.session_state.pop("generated_prompt", None)
-            st.rerun()
+        scoring_section(master)
 
 if __name__ == "__main__":
-    if check_password():
-        main()
+    with timed("全体"):
+        if check_password("龍樹（P-FMEA）"):
+            main()
@@ -1,54 +1,35 @@
-import json
-import pandas as pd
+from __future__ import annotations
+
+import sys
 import streamlit as st
 from pathlib import Path
 
-from database import initialize_db, fetch_records, update_record
-from excel_output import build_excel, make_filename
-
-MASTER_PATH = Path(__file__).parent / "master_data.json"
-
-def load_master() -> dict:
-    with open(MASTER_PATH, encoding="utf-8") as f:
-        return json.load(f)
+# 共通パッケージ ryuju（リポジトリ直下）を読み込めるようにする
+ROOT_DIR = str(Path(__file__).resolve().parents[1])
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
 
-def check_password():
-    if "logged_in" not in st.session_state:
-        st.session_state.logged_in = False
+from ryuju.auth import check_password
+from ryuju.lazy import lazy_import
+from ryuju.master import load_master
 
-    if st.session_state.logged_in:
-        return True
-
-    st.markdown("## 🔒 龍樹（P-FMEA）ログイン")
-    st.info("社員番号とパスワードを入力してください。")
-
-    col1, col2 = st.columns(2)
-    with col1:
-        input_emp_id = st.text_input("社員番号（数字4桁）", max_chars=4, placeholder="例：1234")
-    with col2:
-        input_password = st.text_input("パスワード", type="password")
-
-    if st.button("ログイン", type="primary"):
-        CORRECT_PASSWORD = "wako0001"
-        if not input_emp_id.isdigit() or len(input_emp_id) != 4:
-            st.error("❌ 社員番号は「数字4桁」で入力してください。")
-            return False
-        if input_password == CORRECT_PASSWORD:
-            st.session_state.logged_in = True
-            st.session_state.emp_id = input_emp_id
-            st.success("ログイン成功")
-            st.rerun()
-            return True
-        else:
-            st.error("❌ パスワードが違います。")
-            return False
+from database import (
+    initialize_db, count_records, fetch_page, page_cursor, update_record, data_version,
+    fetch_ids, approve_records, return_records, fetch_history,
+    STATUS_DRAFT, STATUS_APPROVED
+)
+from excel_output import build_excel, make_filename
+from timing import timed, show_timings
+from action_priority import action_priority
 
-    return False
+# 重い依存は最初に使う時点で読み込む（ログイン画面の表示を軽くする）
+pd = lazy_import("pandas")
 
 # 表示列定義：(DBカラム名, 表示名)
 DISPLAY_COLUMNS = [
     ("id",                          "No."),
     ("created_at",                  "登録日時"),
+    ("status",                      "ステータス"),
     ("industry",                    "業種"),
     ("product",                     "製品名"),
     ("process",                     "工程の役割"),
@@ -61,24 +42,327 @@ DISPLAY_COLUMNS = [
     ("current_control_detection",   "故障の検出"),
     ("detection",                   "検出度（D）"),
     ("rpn",                         "RPN"),
+    ("action_priority",             "AP"),
     ("remarks",                     "備考"),
 ]
 
 DB_TO_DISPLAY = {db: disp for db, disp in DISPLAY_COLUMNS}
 DISPLAY_TO_DB = {disp: db for db, disp in DISPLAY_COLUMNS}
 
+# 一覧グリッドに表示する列
+RESULT_COLUMNS = ["No.", "ステータス", "登録日時", "業種", "製品名", "工程の役割", "故障モード",
+                  "厳しさ（S）", "発生頻度（O）", "検出度（D）", "RPN", "AP"]
+
+# 並び順：表示名 -> database.SORT_KEYS のキー
+SORT_OPTIONS = {
+    "No.（昇順）":         "id",
+    "RPN（高い順）":       "rpn",
+    "登録日時（新しい順）": "created_at",
+    "工程の役割":          "process",
+}
+
+PAGE_SIZES = [50, 100, 200]
+
+STATUS_OPTIONS = ["全て", STATUS_DRAFT, STATUS_APPROVED]
+
 def records_to_df(records: list[dict]) -> pd.DataFrame:
-    if not records:
-        return pd.DataFrame()
-    rows = []
-    for r in records:
-        row = {disp: r.get(db, "") for db, disp in DISPLAY_COLUMNS}
-        rows.append(row)
-    return pd.DataFrame(rows)
+    df = pd.DataFrame(records, columns=[db for db, _ in DISPLAY_COLUMNS])
+    return df.rename(columns=DB_TO_DISPLAY)
+
+def history_to_df(history: list[dict]) -> pd.DataFrame:
+    df = pd.DataFrame(history, columns=[
+        "record_id", "changed_at", "changed_by", "column_name", "old_value", "new_value"
+    ])
+    df["column_name"] = df["column_name"].map(lambda c: DB_TO_DISPLAY.get(c, c))
+    return df.rename(columns={
+        "record_id": "No.", "changed_at": "変更日時", "changed_by": "変更者",
+        "column_name": "項目", "old_value": "変更前", "new_value": "変更後",
+    })
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_count(filter_key: tuple, version: int) -> int:
+    """
+    件数をキャッシュする
+    version: database.data_version()。他セッションの書き込みで値が変わり、キャッシュが無効になる
+    """
+    return count_records(**dict(filter_key))
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_page(filter_key: tuple, sort: str, limit: int, cursor: tuple, offset: int, version: int) -> list[dict]:
+    return fetch_page(dict(filter_key), sort, limit, cursor=cursor, offset=offset)
+
+def reset_paging():
+    """
+    検索条件・並び順・表示件数の変更時に1ページ目へ戻す
+    page_cursors: ページ番号 -> そのページ先頭を取得するためのカーソル
+    """
+    st.session_state["page"] = 0
+    st.session_state["page_input"] = 1
+    st.session_state["page_cursors"] = {0: None}
+    st.session_state["table_nonce"] = st.session_state.get("table_nonce", 0) + 1
+
+def apply_bulk_status(status: str, record_ids: list[int] | None, filters: dict):
+    """
+    一括承認・差し戻しを実行し、反映件数をメッセージとして残す
+    ボタンの on_click で実行する（ページ番号の入力欄を作る前に1ページ目へ戻すため）
+    record_ids: None の場合は検索条件に該当する全件（押下時にIDを取得する）
+    """
+    if record_ids is None:
+        record_ids = fetch_ids(**filters)
+    if status == STATUS_APPROVED:
+        count = approve_records(record_ids, st.session_state.get("emp_id"))
+        label = "承認"
+    else:
+        count = return_records(record_ids, st.session_state.get("emp_id"))
+        label = "差し戻し"
+    st.session_state["bulk_message"] = (
+        f"{count}件を{label}しました。（対象 {len(record_ids)}件のうち、"
+        f"既に{status}だったものを除く）"
+    )
+    reset_paging()
+
+def go_to_page(page: int):
+    st.session_state["page"] = page
+    st.session_state["page_input"] = page + 1
+
+@st.fragment
+def selection_section(filters: dict):
+    """
+    一覧表示・行選択の区画
+    件数はCOUNT(*)、一覧は表示中の1ページ分のみをSQLで取得する
+    フラグメントとして、選択・ページ送りの変更時はこの区画（と編集区画）のみ再実行する
+    """
+    with timed("② レコード選択"):
+        st.divider()
+        st.header("② レコード選択")
+
+        # 検索条件とDBの変更世代が同じなら、前回の結果をメモリから返す
+        filter_key = tuple(sorted(filters.items()))
+        version    = data_version()
+        total      = cached_count(filter_key, version)
+        if total == 0:
+            st.warning("該当するレコードがありません。")
+            return
+
+        col_sort, col_size = st.columns(2)
+        with col_sort:
+            sort_label = st.selectbox(
+                "並び順", list(SORT_OPTIONS.keys()),
+                key="result_sort", on_change=reset_paging
+            )
+        with col_size:
+            page_size = st.selectbox(
+                "表示件数", PAGE_SIZES,
+                key="page_size", on_change=reset_paging
+            )
+        sort = SORT_OPTIONS[sort_label]
+
+        pages   = -(-total // page_size)
+        page    = min(st.session_state.get("page", 0), pages - 1)
+        cursors = st.session_state.setdefault("page_cursors", {0: None})
+
+        # 前ページから続けて移動した場合はキーセット、直接移動した場合はOFFSETで取得する
+        if page in cursors:
+            records = cached_page(filter_key, sort, page_size, cursors[page], 0, version)
+        else:
+            records = cached_page(filter_key, sort, page_size, None, page * page_size, version)
+        if records:
+            cursors[page + 1] = page_cursor(records[-1], sort)
+
+        st.caption(
+            f"{total}件 該当（{page + 1} / {pages}ページ）　　"
+            f"行を選択したレコードに対して編集・出力が行えます。"
+        )
+
+        df = records_to_df(records)
+
+        # 一覧は1つのグリッドで表示し、選択結果は行番号→No.に変換する
+        event = st.dataframe(
+            df,
+            # ページ・並び順の変更や更新後は選択を解除する
+            key=f"result_table_{sort}_{page_size}_{page}_{st.session_state.get('table_nonce', 0)}",
+            on_select="rerun",
+            selection_mode="multi-row",
+            column_order=RESULT_COLUMNS,
+            hide_index=True,
+            use_container_width=True
+        )
+        selected_ids = [int(rid) for rid in df["No."].iloc[event.selection.rows]]
+
+        # ページ送り
+        if st.session_state.get("page_input", 1) > pages:
+            st.session_state["page_input"] = pages
+        col_prev, col_page, col_next = st.columns([1, 2, 1])
+        with col_prev:
+            st.button(
+                "◀ 前へ", disabled=page == 0,
+                on_click=go_to_page, args=(page - 1,)
+            )
+        with col_page:
+            st.number_input(
+                "ページ", min_value=1, max_value=pages, step=1,
+                key="page_input", label_visibility="collapsed",
+                on_change=lambda: go_to_page(st.session_state["page_input"] - 1)
+            )
+        with col_next:
+            st.button(
+                "次へ ▶", disabled=page >= pages - 1,
+                on_click=go_to_page, args=(page + 1,)
+            )
+
+        st.session_state["selected_ids"] = selected_ids
+
+        # 一括ステータス変更
+        with st.expander("✅ 一括承認・差し戻し"):
+            scope = st.radio(
+                "対象", ["選択した行", "検索条件に該当する全件"],
+                horizontal=True, key="bulk_scope"
+            )
+            selected_only = scope == "選択した行"
+            st.caption(f"対象：{len(selected_ids) if selected_only else total}件")
+            target_ids = selected_ids if selected_only else None
+            col_approve, col_return = st.columns(2)
+            with col_approve:
+                st.button(
+                    "承認する", type="primary", disabled=selected_only and not selected_ids,
+                    on_click=apply_bulk_status, args=(STATUS_APPROVED, target_ids, filters)
+                )
+            with col_return:
+                st.button(
+                    "差し戻す", disabled=selected_only and not selected_ids,
+                    on_click=apply_bulk_status, args=(STATUS_DRAFT, target_ids, filters)
+                )
+            if "bulk_message" in st.session_state:
+                st.success(st.session_state.pop("bulk_message"))
+
+    # ----------------------------------------
+    # 区画3・4：選択レコードの編集・保存・出力
+    # ----------------------------------------
+    if selected_ids:
+        selected = set(selected_ids)
+        edit_section([r for r in records if r["id"] in selected])
+
+@st.fragment
+def edit_section(selected_records: list[dict]):
+    """
+    選択レコードの編集・保存・出力の区画
+    フラグメントとして、評点の変更時はこの区画のみ再実行する
+    """
+    with timed("③ 編集"):
+        st.divider()
+        st.header("③ 選択レコードの編集")
+        st.caption(f"{len(selected_records)}件を選択中")
+
+        edit_scores = {}
+
+        for record in selected_records:
+            with st.expander(
+                f"No.{record['id']}　{record['process']}　{record['failure_mode']}",
+                expanded=True
+            ):
+                st.markdown(f"**故障の影響：** {record.get('effect', '')}")
+                st.markdown(f"**故障原因：** {record.get('cause', '')}")
+
+                c1, c2, c3, c4 = st.columns([1, 1, 1, 1])
+                with c1:
+                    s = st.number_input(
+                        "厳しさ（S）", min_value=1, max_value=10,
+                        value=int(record.get("severity", 1)),
+                        key=f"es_{record['id']}"
+                    )
+                with c2:
+                    o = st.number_input(
+                        "発生頻度（O）", min_value=1, max_value=10,
+                        value=int(record.get("occurrence", 1)),
+                        key=f"eo_{record['id']}"
+                    )
+                with c3:
+                    d = st.number_input(
+                        "検出度（D）", min_value=1, max_value=10,
+                        value=int(record.get("detection", 1)),
+                        key=f"ed_{record['id']}"
+                    )
+                with c4:
+                    st.metric("RPN / AP", f"{s * o * d} / {action_priority(s, o, d)}")
+
+                remarks = st.text_input(
+                    "備考", value=record.get("remarks", "") or "",
+                    key=f"er_{record['id']}"
+                )
+
+                edit_scores[record["id"]] = {
+                    "severity": s, "occurrence": o, "detection": d,
+                    "rpn": s * o * d, "action_priority": action_priority(s, o, d),
+                    "remarks": remarks
+                }
+
+        st.session_state["edit_scores"] = edit_scores
+
+        if st.toggle("変更履歴を表示する", key="show_history"):
+            history = fetch_history([r["id"] for r in selected_records])
+            if history:
+                st.dataframe(
+                    history_to_df(history),
+                    hide_index=True,
+                    use_container_width=True
+                )
+            else:
+                st.caption("変更履歴はありません。")
+
+        # ----------------------------------------
+        # 区画4：保存・出力
+        # ----------------------------------------
+        st.divider()
+        st.header("④ 保存・出力")
+
+        col_save, col_excel = st.columns(2)
+
+        with col_save:
+            if st.button("編集内容を保存する", type="primary"):
+                save_count = 0
+                for rid, scores in st.session_state["edit_scores"].items():
+                    original = next(r for r in selected_records if r["id"] == rid)
+                    updated = {}
+                    for key in ["severity", "occurrence", "detection", "remarks"]:
+                        if str(scores[key]) != str(original.get(key, "")):
+                            updated[key] = scores[key]
+                    if updated:
+                        update_record(rid, updated, st.session_state.get("emp_id"))
+                        save_count += 1
+                if save_count > 0:
+                    st.success(f"{save_count}件の編集内容を保存しました。")
+                    reset_paging()
+                    st.session_state.pop("selected_ids", None)
+                    st.session_state.pop("edit_scores", None)
+                    st.rerun()
+                else:
+                    st.info("変更はありませんでした。")
+
+        with col_excel:
+            if st.button("選択したレコードをExcelで出力する"):
+                output_records = []
+                for record in selected_records:
+                    r = record.copy()
+                    if record["id"] in st.session_state.get("edit_scores", {}):
+                        r.update(st.session_state["edit_scores"][record["id"]])
+                    output_records.append(r)
+
+                industry_val = output_records[0].get("industry", "")
+                product_val  = output_records[0].get("product", "")
+                excel_bytes  = build_excel(output_records, industry_val, product_val)
+                filename     = make_filename(industry_val, product_val)
+
+                st.download_button(
+                    label    = f"📥 ダウンロード（{len(output_records)}件）",
+                    data     = excel_bytes,
+                    file_name= filename,
+                    mime     = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
 
 def main():
     st.set_page_config(page_title="龍樹（P-FMEA）確認・出力", page_icon="🌳", layout="wide")
     initialize_db()
+    show_timings()
 
     st.title("🌳 龍樹（P-FMEA）確認・出力アプリ")
 
@@ -113,167 +397,31 @@ def main():
             "工程名", ["（全て）"] + all_processes
         )
 
-    f_keyword = st.text_input("故障モード　キーワード検索")
+    col4, col5 = st.columns([1, 2])
+    with col4:
+        f_status = st.selectbox("ステータス", STATUS_OPTIONS)
+    with col5:
+        f_keyword = st.text_input("故障モード　キーワード検索")
 
     if st.button("検索する", type="primary"):
-        records = fetch_records(
-            industry = None if f_industry == "（全て）" else f_industry,
-            product  = None if f_product == "（全て）" else f_product,
-            process  = None if f_process == "（全て）" else f_process,
-            status   = None,
-            keyword  = f_keyword.strip() or None
-        )
-        st.session_state["search_results"] = records
+        st.session_state["search_filters"] = {
+            "industry": None if f_industry == "（全て）" else f_industry,
+            "product":  None if f_product == "（全て）" else f_product,
+            "process":  None if f_process == "（全て）" else f_process,
+            "status":   f_status,
+            "keyword":  f_keyword.strip() or None
+        }
+        reset_paging()
         st.session_state.pop("selected_ids", None)
         st.session_state.pop("edit_scores", None)
 
     # ----------------------------------------
-    # 区画2：一覧表示・チェックボックス選択
+    # 区画2：一覧表示・行選択
     # ----------------------------------------
-    if "search_results" in st.session_state:
-        records = st.session_state["search_results"]
-        st.divider()
-        st.header("② レコード選択")
-
-        if not records:
-            st.warning("該当するレコードがありません。")
-            return
-
-        st.caption(f"{len(records)}件 該当　　チェックを入れたレコードに対して編集・出力が行えます。")
-
-        # チェックボックス付き一覧
-        selected_ids = []
-        df = records_to_df(records)
-
-        # ヘッダー行
-        header_cols = st.columns([0.5, 1, 2, 2, 2, 3, 3, 1, 1, 1, 1])
-        headers = ["選択", "No.", "登録日時", "業種", "製品名", "工程の役割", "故障モード", "S", "O", "D", "RPN"]
-        for col, h in zip(header_cols, headers):
-            col.markdown(f"**{h}**")
-        st.divider()
-
-        for i, record in enumerate(records):
-            row_cols = st.columns([0.5, 1, 2, 2, 2, 3, 3, 1, 1, 1, 1])
-            checked = row_cols[0].checkbox("", key=f"chk_{record['id']}", label_visibility="collapsed")
-            row_cols[1].write(record.get("id", ""))
-            row_cols[2].write(str(record.get("created_at", ""))[:10])
-            row_cols[3].write(record.get("industry", ""))
-            row_cols[4].write(record.get("product", ""))
-            row_cols[5].write(record.get("process", ""))
-            row_cols[6].write(record.get("failure_mode", ""))
-            row_cols[7].write(record.get("severity", ""))
-            row_cols[8].write(record.get("occurrence", ""))
-            row_cols[9].write(record.get("detection", ""))
-            row_cols[10].write(record.get("rpn", ""))
-
-            if checked:
-                selected_ids.append(record["id"])
-
-        st.session_state["selected_ids"] = selected_ids
-
-        # ----------------------------------------
-        # 区画3：選択レコードの編集
-        # ----------------------------------------
-        if selected_ids:
-            st.divider()
-            st.header("③ 選択レコードの編集")
-            st.caption(f"{len(selected_ids)}件を選択中")
-
-            selected_records = [r for r in records if r["id"] in selected_ids]
-            edit_scores = {}
-
-            for record in selected_records:
-                with st.expander(
-                    f"No.{record['id']}　{record['process']}　{record['failure_mode']}",
-                    expanded=True
-                ):
-                    st.markdown(f"**故障の影響：** {record.get('effect', '')}")
-                    st.markdown(f"**故障原因：** {record.get('cause', '')}")
-
-                    c1, c2, c3, c4 = st.columns([1, 1, 1, 1])
-                    with c1:
-                        s = st.number_input(
-                            "厳しさ（S）", min_value=1, max_value=10,
-                            value=int(record.get("severity", 1)),
-                            key=f"es_{record['id']}"
-                        )
-                    with c2:
-                        o = st.number_input(
-                            "発生頻度（O）", min_value=1, max_value=10,
-                            value=int(record.get("occurrence", 1)),
-                            key=f"eo_{record['id']}"
-                        )
-                    with c3:
-                        d = st.number_input(
-                            "検出度（D）", min_value=1, max_value=10,
-                            value=int(record.get("detection", 1)),
-                            key=f"ed_{record['id']}"
-                        )
-                    with c4:
-                        st.metric("RPN", s * o * d)
-
-                    remarks = st.text_input(
-                        "備考", value=record.get("remarks", "") or "",
-                        key=f"er_{record['id']}"
-                    )
-
-                    edit_scores[record["id"]] = {
-                        "severity": s, "occurrence": o, "detection": d,
-                        "rpn": s * o * d, "remarks": remarks
-                    }
-
-            st.session_state["edit_scores"] = edit_scores
-
-            # ----------------------------------------
-            # 区画4：保存・出力
-            # ----------------------------------------
-            st.divider()
-            st.header("④ 保存・出力")
-
-            col_save, col_excel = st.columns(2)
-
-            with col_save:
-                if st.button("編集内容を保存する", type="primary"):
-                    save_count = 0
-                    for rid, scores in st.session_state["edit_scores"].items():
-                        original = next(r for r in records if r["id"] == rid)
-                        updated = {}
-                        for key in ["severity", "occurrence", "detection", "rpn", "remarks"]:
-                            if str(scores[key]) != str(original.get(key, "")):
-                                updated[key] = scores[key]
-                        if updated:
-                            update_record(rid, updated)
-                            save_count += 1
-                    if save_count > 0:
-                        st.success(f"{save_count}件の編集内容を保存しました。")
-                        st.session_state.pop("search_results", None)
-                        st.session_state.pop("selected_ids", None)
-                        st.session_state.pop("edit_scores", None)
-                        st.rerun()
-                    else:
-                        st.info("変更はありませんでした。")
-
-            with col_excel:
-                if st.button("選択したレコードをExcelで出力する"):
-                    output_records = []
-                    for record in selected_records:
-                        r = record.copy()
-                        if record["id"] in st.session_state.get("edit_scores", {}):
-                            r.update(st.session_state["edit_scores"][record["id"]])
-                        output_records.append(r)
-
-                    industry_val = output_records[0].get("industry", "")
-                    product_val  = output_records[0].get("product", "")
-                    excel_bytes  = build_excel(output_records, industry_val, product_val)
-                    filename     = make_filename(industry_val, product_val)
-
-                    st.download_button(
-                        label    = f"📥 ダウンロード（{len(output_records)}件）",
-                        data     = excel_bytes,
-                        file_name= filename,
-                        mime     = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
+    if "search_filters" in st.session_state:
+        selection_section(st.session_state["search_filters"])
 
 if __name__ == "__main__":
-    if check_password():
-        main()
+    with timed("全体"):
+        if check_password("龍樹（P-FMEA）"):
+            main()
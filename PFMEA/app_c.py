@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import sys
+import streamlit as st
+from pathlib import Path
+
+# 共通パッケージ ryuju（リポジトリ直下）を読み込めるようにする
+ROOT_DIR = str(Path(__file__).resolve().parents[1])
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from ryuju.auth import check_password
+from ryuju.lazy import lazy_import
+from ryuju.master import load_master
+
+from database import (
+    initialize_db, data_version, find_inconsistent_records, repair_action_priority,
+    STATUS_DRAFT, STATUS_APPROVED
+)
+from analytics import initialize_analytics, rpn_pareto, score_matrix
+from timing import timed, show_timings
+
+# 重い依存は最初に使う時点で読み込む（ログイン画面の表示を軽くする）
+pd = lazy_import("pandas")
+alt = lazy_import("altair")
+
+# ヒートマップの指標：表示名 -> 集計列
+HEATMAP_METRICS = {
+    "厳しさ（S）平均":   "avg_s",
+    "発生頻度（O）平均": "avg_o",
+    "検出度（D）平均":   "avg_d",
+    "件数":             "count",
+}
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def cached_pareto(filter_key: tuple, limit: int, version: int) -> pd.DataFrame:
+    """
+    故障モード別RPNパレートを集計し、累積比率を付与する
+    version: database.data_version()。DBが更新されるとキャッシュが無効になる
+    """
+    rows, total = rpn_pareto(dict(filter_key), limit)
+    df = pd.DataFrame(rows, columns=["failure_mode", "count", "sum_rpn", "avg_rpn", "max_rpn"])
+    df["share"]   = df["sum_rpn"] / total * 100 if total else 0.0
+    df["cum_pct"] = df["share"].cumsum()
+    return df
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def cached_matrix(filter_key: tuple, threshold: int, version: int) -> pd.DataFrame:
+    return pd.DataFrame(
+        score_matrix(dict(filter_key), threshold),
+        columns=["process", "product", "count", "avg_s", "avg_o", "avg_d", "over_threshold"]
+    )
+
+def weighted_by_process(df: pd.DataFrame, process_order: list[str]) -> pd.DataFrame:
+    """
+    工程×製品の集計から工程別の件数・閾値超過件数・S/O/D平均（件数加重）を求める
+    """
+    weighted = df[["avg_s", "avg_o", "avg_d"]].mul(df["count"], axis=0)
+    weighted[["process", "count", "over_threshold"]] = df[["process", "count", "over_threshold"]]
+    agg = weighted.groupby("process").sum()
+    agg[["avg_s", "avg_o", "avg_d"]] = agg[["avg_s", "avg_o", "avg_d"]].div(agg["count"], axis=0)
+    agg["over_pct"] = agg["over_threshold"] / agg["count"] * 100
+    order = [p for p in process_order if p in agg.index] + [p for p in agg.index if p not in process_order]
+    return agg.reindex(order)
+
+def main():
+    st.set_page_config(page_title="龍樹（P-FMEA）分析", page_icon="🌳", layout="wide")
+    initialize_db()
+    initialize_analytics()
+    show_timings()
+
+    st.title("🌳 龍樹（P-FMEA）RPN分析ダッシュボード")
+    master = load_master()
+    process_order = master["processes"]["段取"] + master["processes"]["成形"]
+
+    # ----------------------------------------
+    # 区画1：集計条件
+    # ----------------------------------------
+    st.header("① 集計条件")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        f_industry = st.selectbox("業種", ["（全て）"] + master["industries"])
+    with col2:
+        f_status = st.selectbox("ステータス", ["全て", STATUS_APPROVED, STATUS_DRAFT])
+    with col3:
+        threshold = st.number_input("RPN閾値", min_value=1, max_value=1000, value=100, step=10)
+
+    filters = {
+        "industry": None if f_industry == "（全て）" else f_industry,
+        "status":   f_status,
+    }
+    filter_key = tuple(sorted(filters.items()))
+    version    = data_version()
+
+    with timed("集計"):
+        pareto = cached_pareto(filter_key, 30, version)
+        matrix = cached_matrix(filter_key, threshold, version)
+
+    if matrix.empty:
+        st.warning("該当するレコードがありません。")
+        return
+
+    by_process = weighted_by_process(matrix, process_order)
+    total      = int(matrix["count"].sum())
+    over       = int(matrix["over_threshold"].sum())
+
+    c1, c2, c3 = st.columns(3)
+    c1.metric("対象件数", f"{total:,}")
+    c2.metric(f"RPN {threshold}以上", f"{over:,}")
+    c3.metric("閾値超過率", f"{over / total * 100:.1f}%")
+
+    # ----------------------------------------
+    # 区画2：故障モード別RPNパレート
+    # ----------------------------------------
+    st.divider()
+    st.header("② 故障モード別RPNパレート（上位30）")
+
+    base = alt.Chart(pareto).encode(
+        x=alt.X("failure_mode:N", sort=None, title="故障モード")
+    )
+    bars = base.mark_bar().encode(
+        y=alt.Y("sum_rpn:Q", title="RPN合計"),
+        tooltip=["failure_mode", "count", "sum_rpn", "avg_rpn", "max_rpn"]
+    )
+    line = base.mark_line(point=True, color="#C00000").encode(
+        y=alt.Y("cum_pct:Q", title="累積比率（%）", scale=alt.Scale(domain=[0, 100]))
+    )
+    st.altair_chart(
+        alt.layer(bars, line).resolve_scale(y="independent"),
+        use_container_width=True
+    )
+
+    # ----------------------------------------
+    # 区画3：工程×製品ヒートマップ
+    # ----------------------------------------
+    st.divider()
+    st.header("③ 工程×製品ヒートマップ")
+
+    metric_label = st.radio("指標", list(HEATMAP_METRICS.keys()), horizontal=True)
+    metric = HEATMAP_METRICS[metric_label]
+    heatmap = alt.Chart(matrix).mark_rect().encode(
+        x=alt.X("product:N", title="製品名"),
+        y=alt.Y("process:N", title="工程名", sort=process_order),
+        color=alt.Color(f"{metric}:Q", title=metric_label, scale=alt.Scale(scheme="orangered")),
+        tooltip=["process", "product", "count", "avg_s", "avg_o", "avg_d", "over_threshold"]
+    )
+    st.altair_chart(heatmap, use_container_width=True)
+
+    # ----------------------------------------
+    # 区画4：工程別の閾値超過件数
+    # ----------------------------------------
+    st.divider()
+    st.header(f"④ 工程別 RPN {threshold}以上の件数")
+
+    st.dataframe(
+        by_process.rename(columns={
+            "count": "件数", "over_threshold": f"RPN {threshold}以上",
+            "over_pct": "超過率（%）", "avg_s": "S平均", "avg_o": "O平均", "avg_d": "D平均",
+        }).round(2),
+        use_container_width=True
+    )
+
+    # ----------------------------------------
+    # 区画5：データ整合性チェック
+    # ----------------------------------------
+    st.divider()
+    with st.expander("⑤ データ整合性チェック"):
+        st.caption("全レコードのS/O/Dの範囲、RPN、APを一括で検証します。")
+        if st.button("整合性をチェックする"):
+            with timed("整合性チェック"):
+                st.session_state["consistency"] = find_inconsistent_records()
+
+        result = st.session_state.get("consistency")
+        if result is not None:
+            labels = {
+                "out_of_range":    "S/O/Dが範囲外（AP未判定）",
+                "rpn":             "RPNがS×O×Dと不一致",
+                "action_priority": "APが未設定・不一致",
+            }
+            if not any(result.values()):
+                st.success("不整合はありません。")
+            for key, label in labels.items():
+                ids = result[key]
+                if ids:
+                    shown = ", ".join(map(str, ids[:20])) + (" …" if len(ids) > 20 else "")
+                    st.warning(f"{label}：{len(ids):,}件（ID: {shown}）")
+            if result["action_priority"] and st.button("APを再判定する"):
+                count = repair_action_priority(result["action_priority"])
+                st.session_state.pop("consistency", None)
+                st.success(f"{count}件のAPを再判定しました。")
+
+if __name__ == "__main__":
+    with timed("全体"):
+        if check_password("龍樹（P-FMEA）"):
+            main()
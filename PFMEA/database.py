@@ -1,40 +1,256 @@
+import json
 import sqlite3
+import threading
 from pathlib import Path
 from datetime import datetime
 
+from action_priority import action_priority, action_priority_array
+from ryuju.db import connect
+
 DB_PATH = Path(__file__).parent / "data" / "pfmea_database.db"
 
+STATUS_DRAFT    = "洗い出し中"
+STATUS_APPROVED = "承認済み"
+
+# APの補完・再判定などシステムによる更新の実行者（変更履歴の changed_by）
+SYSTEM_USER = "system"
+
 def get_connection():
-    DB_PATH.parent.mkdir(exist_ok=True)
-    return sqlite3.connect(DB_PATH)
+    """
+    プロセス内で共有する接続プールから接続を借りる（with 文の終了時にコミットして返す）
+    """
+    return connect(DB_PATH)
+
+# PRAGMA data_version 監視専用の接続（プロセス内で共有）
+_version_conn = None
+_version_lock = threading.Lock()
+
+def data_version() -> int:
+    """
+    DBの変更世代を返す
+    監視用接続以外の接続（他セッション・他プロセスを含む）がコミットするたびに値が変わる
+    書き込みは全て get_connection() の接続で行うため、自プロセスの更新も検出できる
+    """
+    global _version_conn
+    with _version_lock:
+        if _version_conn is None:
+            DB_PATH.parent.mkdir(exist_ok=True)
+            _version_conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        return _version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+# pfmea_records の定義。rpn は S/O/D から算出する生成列（STORED）
+PFMEA_RECORDS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id                          INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at                  TEXT    NOT NULL,
+        status                      TEXT    NOT NULL DEFAULT '洗い出し中',
+        industry                    TEXT    NOT NULL,
+        product                     TEXT    NOT NULL,
+        process                     TEXT    NOT NULL,
+        gate_type                   TEXT,
+        has_insert                  INTEGER,
+        failure_mode                TEXT    NOT NULL,
+        effect                      TEXT    NOT NULL,
+        cause                       TEXT    NOT NULL,
+        current_control_prevention  TEXT    NOT NULL,
+        current_control_detection   TEXT    NOT NULL,
+        recommended_action          TEXT    NOT NULL,
+        severity                    INTEGER NOT NULL,
+        occurrence                  INTEGER NOT NULL,
+        detection                   INTEGER NOT NULL,
+        rpn                         INTEGER GENERATED ALWAYS AS (severity * occurrence * detection) STORED,
+        remarks                     TEXT,
+        approved_at                 TEXT,
+        updated_by                  TEXT,
+        action_priority             TEXT
+    )
+"""
 
 def initialize_db():
     with get_connection() as conn:
+        conn.execute(PFMEA_RECORDS_SCHEMA.format(table="pfmea_records"))
+        ensure_column(conn, "pfmea_records", "approved_at", "TEXT")
+        ensure_column(conn, "pfmea_records", "updated_by", "TEXT")
+        ensure_column(conn, "pfmea_records", "action_priority", "TEXT")
+        migrate_generated_rpn(conn)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_pfmea_approved_at ON pfmea_records (approved_at)"
+        )
+        # 一覧の並び順（キーセット方式のページ送り）用
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pfmea_rpn ON pfmea_records (rpn, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pfmea_created_at ON pfmea_records (created_at, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pfmea_process ON pfmea_records (process, id)")
+        # AP未設定のレコードだけを載せる部分索引（起動時の補完チェックを全件走査にしない）
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_pfmea_ap_missing ON pfmea_records (id) WHERE action_priority IS NULL"
+        )
+        # アプリAの取り込み途中データ（社員番号ごとに1件）
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS import_drafts (
+                emp_id          TEXT    PRIMARY KEY,
+                parse_meta      TEXT    NOT NULL,
+                parsed_records  TEXT    NOT NULL,
+                initial_scores  TEXT    NOT NULL,
+                updated_at      TEXT    NOT NULL
+            )
+        """)
+        # 取り込み後に編集されたセルのみを保持する
         conn.execute("""
-            CREATE TABLE IF NOT EXISTS pfmea_records (
-                id                          INTEGER PRIMARY KEY AUTOINCREMENT,
-                created_at                  TEXT    NOT NULL,
-                status                      TEXT    NOT NULL DEFAULT '洗い出し中',
-                industry                    TEXT    NOT NULL,
-                product                     TEXT    NOT NULL,
-                process                     TEXT    NOT NULL,
-                gate_type                   TEXT,
-                has_insert                  INTEGER,
-                failure_mode                TEXT    NOT NULL,
-                effect                      TEXT    NOT NULL,
-                cause                       TEXT    NOT NULL,
-                current_control_prevention  TEXT    NOT NULL,
-                current_control_detection   TEXT    NOT NULL,
-                recommended_action          TEXT    NOT NULL,
-                severity                    INTEGER NOT NULL,
-                occurrence                  INTEGER NOT NULL,
-                detection                   INTEGER NOT NULL,
-                rpn                         INTEGER NOT NULL,
-                remarks                     TEXT
+            CREATE TABLE IF NOT EXISTS draft_fields (
+                emp_id      TEXT    NOT NULL,
+                row_idx     INTEGER NOT NULL,
+                field       TEXT    NOT NULL,
+                value       TEXT,
+                updated_at  TEXT    NOT NULL,
+                PRIMARY KEY (emp_id, row_idx, field)
             )
         """)
+        create_history(conn)
         conn.commit()
 
+    # AP列の追加前に登録されたレコードを一度だけ補完する
+    backfill_action_priority()
+
+# 変更履歴の対象列
+HISTORY_COLUMNS = [
+    "status", "failure_mode", "effect", "cause",
+    "current_control_prevention", "current_control_detection", "recommended_action",
+    "severity", "occurrence", "detection", "rpn", "action_priority", "remarks",
+    "approved_at",
+]
+
+def create_history(conn):
+    """
+    変更履歴テーブルとトリガーを作成する
+    UPDATEのたびに、値が変わった列だけを (列名, 旧値, 新値) の1行として追記する
+    実行者は pfmea_records.updated_by から取得する。updated_by は同じUPDATE文で設定された場合だけ有効とし、
+    記録後にNULLへ戻す（設定しない更新を、前回の更新者の変更として記録しないため）
+    AP列の追加前のレコードへのAP補完（未設定→値、実行者 SYSTEM_USER）は変更ではないため記録しない
+    更新処理への追加コストは UPDATE+COMMIT 1回あたり25%以内を目安とする
+    （update_record でS・O・備考を更新×3,000回の計測で約+10%（計測ごとに3〜20%）、1回あたり約0.05ms。
+      接続プール導入前は呼び出しごとの接続でスキーマ解析が加わり約+60%だった）
+    対象列を変えた場合、既存DBのトリガーは次回の initialize_db で作り直される
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS pfmea_history (
+            id          INTEGER PRIMARY KEY,
+            record_id   INTEGER NOT NULL,
+            changed_at  TEXT    NOT NULL,
+            changed_by  TEXT,
+            column_name TEXT    NOT NULL,
+            old_value,
+            new_value
+        )
+    """)
+    # 「レコードXの履歴」と「期間内の変更」の検索用
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_history_record ON pfmea_history (record_id, changed_at)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_history_changed_at ON pfmea_history (changed_at)"
+    )
+    changes = "\n                UNION ALL ".join(
+        f"SELECT '{c}', OLD.{c}, NEW.{c}" for c in HISTORY_COLUMNS
+    )
+    trigger_sql = f"""
+        CREATE TRIGGER trg_pfmea_history
+        AFTER UPDATE ON pfmea_records
+        BEGIN
+            INSERT INTO pfmea_history (
+                record_id, changed_at, changed_by, column_name, old_value, new_value
+            )
+            SELECT NEW.id, strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime'),
+                   NEW.updated_by, c.name, c.old_value, c.new_value
+            FROM (
+                SELECT NULL AS name, NULL AS old_value, NULL AS new_value WHERE 0
+                UNION ALL {changes}
+            ) AS c
+            WHERE c.old_value IS NOT c.new_value
+              AND NOT (
+                  c.name = 'action_priority' AND c.old_value IS NULL
+                  AND NEW.updated_by IS '{SYSTEM_USER}'
+              );
+            UPDATE pfmea_records SET updated_by = NULL
+            WHERE id = NEW.id AND updated_by IS NOT NULL;
+        END
+    """.strip()
+    # 対象列を変えた場合のみ作り直す（毎回作り直すとスキーマが変わり、他の接続の文が無効になる）
+    current = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_pfmea_history'"
+    ).fetchone()
+    if current is None or current[0] != trigger_sql:
+        conn.execute("DROP TRIGGER IF EXISTS trg_pfmea_history")
+        conn.execute(trigger_sql)
+
+def migrate_generated_rpn(conn) -> bool:
+    """
+    rpn が通常の列として作成された既存DBを、生成列の定義に作り直す
+    rpn 以外の列をコピーするため、S/O/Dと食い違っていた rpn もこの時点で正しい値になる
+    索引・トリガーはテーブル削除で消えるため、initialize_db の後続処理で作り直される
+    戻り値: 移行を行ったかどうか
+    """
+    columns = {row[1]: row[6] for row in conn.execute("PRAGMA table_xinfo(pfmea_records)")}
+    # hidden = 3 が STORED の生成列
+    if columns.get("rpn") == 3:
+        return False
+
+    copy_columns = ", ".join(c for c in columns if c != "rpn")
+    conn.execute("DROP TABLE IF EXISTS pfmea_records_new")
+    conn.execute(PFMEA_RECORDS_SCHEMA.format(table="pfmea_records_new"))
+    conn.execute(f"""
+        INSERT INTO pfmea_records_new ({copy_columns})
+        SELECT {copy_columns} FROM pfmea_records
+    """)
+    conn.execute("DROP TABLE pfmea_records")
+    conn.execute("ALTER TABLE pfmea_records_new RENAME TO pfmea_records")
+    return True
+
+def schema_is_current() -> bool:
+    """
+    DBが作成済みで、pfmea_records が現在のスキーマ（追加列・rpn の生成列）になっているかを返す
+    DBファイルの作成・変更は行わない（読み取りのみの処理から呼ぶため）
+    """
+    if not DB_PATH.exists():
+        return False
+    with get_connection() as conn:
+        columns = {row[1]: row[6] for row in conn.execute("PRAGMA table_xinfo(pfmea_records)")}
+    required = ("approved_at", "updated_by", "action_priority")
+    return all(c in columns for c in required) and columns.get("rpn") == 3
+
+def ensure_column(conn, table: str, column: str, decl: str):
+    """
+    既存DBに列がなければ追加する（スキーマ変更前に作成されたDB向け）
+    """
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def build_insert_records(records: list[dict], scores: list[dict], meta: dict) -> list[dict]:
+    """
+    パース済みレコード・評点・取り込み条件（parse_meta）から insert_records 用のレコードリストを生成する
+    scores: レコードごとの {"severity", "occurrence", "detection", "remarks"}
+    meta: {"industry", "product", "process", "params"}
+    """
+    insert = meta["params"].get("インサート部品")
+    common = {
+        "industry":   meta["industry"],
+        "product":    meta["product"],
+        "process":    meta["process"],
+        "gate_type":  meta["params"].get("ゲート方式"),
+        "has_insert": 1 if insert == "あり" else 0 if insert == "なし" else None,
+    }
+    rows = []
+    for rec, score in zip(records, scores):
+        rows.append({
+            **rec,
+            **common,
+            "severity":   int(score["severity"]),
+            "occurrence": int(score["occurrence"]),
+            "detection":  int(score["detection"]),
+            "remarks":    score.get("remarks") or ""
+        })
+    return rows
+
 def insert_records(records: list[dict]) -> int:
     """
     records: parse済み・評点入力済みのレコードリスト
@@ -60,8 +276,8 @@ def insert_records(records: list[dict]) -> int:
             r["severity"],
             r["occurrence"],
             r["detection"],
-            r["severity"] * r["occurrence"] * r["detection"],
-            r.get("remarks", "")
+            r.get("remarks", ""),
+            action_priority(r["severity"], r["occurrence"], r["detection"])
         ))
     with get_connection() as conn:
         conn.executemany("""
@@ -70,23 +286,32 @@ def insert_records(records: list[dict]) -> int:
                 gate_type, has_insert,
                 failure_mode, effect, cause,
                 current_control_prevention, current_control_detection,
-                recommended_action, severity, occurrence, detection, rpn, remarks
+                recommended_action, severity, occurrence, detection, remarks,
+                action_priority
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, rows)
         conn.commit()
     return len(rows)
 
-def fetch_records(
+# 並び順キー -> (ORDER BY 対象列, 方向)。同値の場合は id を同じ方向で並べる
+SORT_KEYS = {
+    "id":         ("id",         "ASC"),
+    "rpn":        ("rpn",        "DESC"),
+    "created_at": ("created_at", "DESC"),
+    "process":    ("process",    "ASC"),
+}
+
+def build_where(
     industry: str = None,
     product: str = None,
     process: str = None,
     status: str = None,
     keyword: str = None
-) -> list[dict]:
+) -> tuple[str, list]:
     """
-    フィルタ条件に合致するレコードを返す
+    フィルタ条件からWHERE句とパラメータを生成する
     """
-    query = "SELECT * FROM pfmea_records WHERE 1=1"
+    query = " WHERE 1=1"
     params = []
     if industry:
         query += " AND industry = ?"
@@ -103,36 +328,393 @@ def fetch_records(
     if keyword:
         query += " AND failure_mode LIKE ?"
         params.append(f"%{keyword}%")
-    query += " ORDER BY id ASC"
+    return query, params
+
+def fetch_records(
+    industry: str = None,
+    product: str = None,
+    process: str = None,
+    status: str = None,
+    keyword: str = None
+) -> list[dict]:
+    """
+    フィルタ条件に合致するレコードを返す
+    """
+    where, params = build_where(industry, product, process, status, keyword)
+    query = "SELECT * FROM pfmea_records" + where + " ORDER BY id ASC"
+
+    with get_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(query, params).fetchall()
+    return [dict(r) for r in rows]
+
+def count_records(**filters) -> int:
+    """
+    フィルタ条件に合致するレコード件数を返す
+    filters: fetch_records と同じフィルタ条件
+    """
+    where, params = build_where(**filters)
+    with get_connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM pfmea_records" + where, params).fetchone()[0]
+
+def fetch_page(
+    filters: dict,
+    sort: str = "id",
+    limit: int = 50,
+    cursor: tuple = None,
+    offset: int = 0
+) -> list[dict]:
+    """
+    フィルタ条件に合致するレコードを1ページ分返す
+    sort: SORT_KEYS のキー
+    cursor: 前ページ最終行の (並び順の列の値, id)。指定時はキーセット方式で続きを取得する
+    offset: cursor が不明なページへ直接移動する場合のみ使用する
+    """
+    column, direction = SORT_KEYS[sort]
+    where, params = build_where(**filters)
+    if cursor is not None:
+        op = ">" if direction == "ASC" else "<"
+        if column == "id":
+            where += f" AND id {op} ?"
+            params.append(cursor[1])
+        else:
+            where += f" AND ({column}, id) {op} (?, ?)"
+            params.extend(cursor)
+        offset = 0
+
+    query = "SELECT * FROM pfmea_records" + where
+    if column == "id":
+        query += f" ORDER BY id {direction}"
+    else:
+        query += f" ORDER BY {column} {direction}, id {direction}"
+    query += " LIMIT ? OFFSET ?"
+    params.extend([limit, offset])
 
     with get_connection() as conn:
         conn.row_factory = sqlite3.Row
         rows = conn.execute(query, params).fetchall()
     return [dict(r) for r in rows]
 
-def update_record(record_id: int, updated: dict):
+def page_cursor(record: dict, sort: str) -> tuple:
+    """
+    fetch_page に渡すキーセットのカーソルをレコードから生成する
+    """
+    column, _ = SORT_KEYS[sort]
+    return (record[column], record["id"])
+
+def update_record(record_id: int, updated: dict, emp_id: str = None):
     """
     アプリBからの編集・承認を反映する
     updated: 更新するカラムと値のdict
+    emp_id: 更新者の社員番号（変更履歴に記録される）
     """
+    # rpn は生成列のため書き込まない
+    updated = {k: v for k, v in updated.items() if k != "rpn"}
     if not updated:
         return
-    set_clause = ", ".join([f"{k} = ?" for k in updated.keys()])
-    values = list(updated.values()) + [record_id]
+    updated = {**updated, "updated_by": emp_id}
     with get_connection() as conn:
+        # S/O/Dのいずれかが変わる場合はAPを再判定する
+        if any(k in updated for k in ("severity", "occurrence", "detection")):
+            current = conn.execute(
+                "SELECT severity, occurrence, detection FROM pfmea_records WHERE id = ?",
+                (record_id,)
+            ).fetchone()
+            if current is not None:
+                s = updated.get("severity", current[0])
+                o = updated.get("occurrence", current[1])
+                d = updated.get("detection", current[2])
+                updated["action_priority"] = action_priority(s, o, d)
+        set_clause = ", ".join([f"{k} = ?" for k in updated.keys()])
+        values = list(updated.values()) + [record_id]
         conn.execute(
             f"UPDATE pfmea_records SET {set_clause} WHERE id = ?",
             values
         )
         conn.commit()
 
-def approve_records(record_ids: list[int]):
+# APを判定できる（S/O/Dが全て1〜10の）レコードの条件
+VALID_SCORES = """
+    severity BETWEEN 1 AND 10 AND occurrence BETWEEN 1 AND 10 AND detection BETWEEN 1 AND 10
+"""
+
+def backfill_action_priority(batch_size: int = 50000) -> int:
     """
-    指定IDのステータスを承認済みに変更する
+    APが未設定のレコードについて、S/O/DからAPをまとめて求めて書き込む
+    AP未設定のレコードは部分索引 idx_pfmea_ap_missing から探すため、補完済みのDBでは即座に終わる
+    S/O/Dが範囲外のレコードはAPを判定できないためNULLのまま残す（find_inconsistent_records で報告する）
+    戻り値: 補完した件数
     """
     with get_connection() as conn:
+        count = 0
+        last_id = 0
+        while True:
+            rows = conn.execute(f"""
+                SELECT id, severity, occurrence, detection FROM pfmea_records
+                WHERE action_priority IS NULL AND id > ? AND {VALID_SCORES}
+                ORDER BY id LIMIT ?
+            """, (last_id, batch_size)).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            ids, s, o, d = zip(*rows)
+            ap = action_priority_array(s, o, d)
+            conn.executemany(
+                "UPDATE pfmea_records SET action_priority = ?, updated_by = ? WHERE id = ?",
+                [(value, SYSTEM_USER, rid) for value, rid in zip(ap.tolist(), ids)]
+            )
+            count += len(rows)
+        conn.commit()
+    return count
+
+def find_inconsistent_records(batch_size: int = 100000) -> dict:
+    """
+    S/O/D・RPN・APの整合性をまとめて検証する
+    チャンクごとにNumPy配列として読み込み、1回の走査で判定する
+    戻り値: {"out_of_range": [id, ...], "rpn": [id, ...], "action_priority": [id, ...]}
+    out_of_range: S/O/Dのいずれかが1〜10の範囲外（APは判定せずNULLのまま）
+    rpn: rpn が S×O×D と一致しない（生成列へ移行前のDB向け）
+    action_priority: AP が未設定、またはS/O/Dから求めた値と一致しない
+    """
+    import numpy as np
+
+    result = {"out_of_range": [], "rpn": [], "action_priority": []}
+    last_id = 0
+    with get_connection() as conn:
+        while True:
+            rows = conn.execute("""
+                SELECT id, severity, occurrence, detection, rpn, action_priority
+                FROM pfmea_records WHERE id > ? ORDER BY id LIMIT ?
+            """, (last_id, batch_size)).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            ids, s, o, d, rpn, ap = (np.array(col, dtype=object) for col in zip(*rows))
+            ids = ids.astype(np.int64)
+            scores = np.stack([s, o, d]).astype(np.int64)
+            valid = ((scores >= 1) & (scores <= 10)).all(axis=0)
+            result["out_of_range"].extend(ids[~valid].tolist())
+
+            ids, scores, rpn, ap = ids[valid], scores[:, valid], rpn[valid], ap[valid]
+            expected_rpn = scores.prod(axis=0)
+            result["rpn"].extend(ids[rpn.astype(np.int64) != expected_rpn].tolist())
+            expected_ap = action_priority_array(*scores)
+            result["action_priority"].extend(ids[ap != expected_ap].tolist())
+    return result
+
+def repair_action_priority(record_ids: list[int]) -> int:
+    """
+    指定IDのAPをS/O/Dから求め直し、値が変わるものだけを書き込む（実行者 SYSTEM_USER として履歴に残る）
+    S/O/Dが範囲外のレコードはAPをNULLにする
+    戻り値: 再判定して書き換えた件数
+    """
+    count = 0
+    with get_connection() as conn:
+        for i in range(0, len(record_ids), 500):
+            chunk = record_ids[i:i + 500]
+            rows = conn.execute(f"""
+                SELECT id, severity, occurrence, detection FROM pfmea_records
+                WHERE id IN ({", ".join("?" * len(chunk))})
+            """, chunk).fetchall()
+            if not rows:
+                continue
+            ids, s, o, d = zip(*rows)
+            ap = action_priority_array(s, o, d)
+            for value, rid in zip(ap.tolist(), ids):
+                count += conn.execute("""
+                    UPDATE pfmea_records SET action_priority = ?, updated_by = ?
+                    WHERE id = ? AND action_priority IS NOT ?
+                """, (value, SYSTEM_USER, rid, value)).rowcount
+        conn.commit()
+    return count
+
+def set_status(record_ids: list[int], status: str, emp_id: str = None) -> int:
+    """
+    指定IDのステータスをまとめて変更する
+    IDは一時テーブルに投入し、1回のUPDATE（一時テーブルとの結合）で反映する
+    承認時は approved_at を記録し、差し戻し時は消去する
+    戻り値: 実際にステータスが変わった件数
+    """
+    approved_at = datetime.now().isoformat() if status == STATUS_APPROVED else None
+    with get_connection() as conn:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS target_ids (id INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM target_ids")
         conn.executemany(
-            "UPDATE pfmea_records SET status = '承認済み' WHERE id = ?",
+            "INSERT OR IGNORE INTO target_ids (id) VALUES (?)",
             [(rid,) for rid in record_ids]
         )
+        cur = conn.execute("""
+            UPDATE pfmea_records SET status = ?, approved_at = ?, updated_by = ?
+            WHERE id IN (SELECT id FROM target_ids) AND status != ?
+        """, (status, approved_at, emp_id, status))
+        conn.execute("DELETE FROM target_ids")
+        conn.commit()
+    return cur.rowcount
+
+def approve_records(record_ids: list[int], emp_id: str = None) -> int:
+    """
+    指定IDのステータスを承認済みに変更する
+    戻り値: 承認した件数
+    """
+    return set_status(record_ids, STATUS_APPROVED, emp_id)
+
+def return_records(record_ids: list[int], emp_id: str = None) -> int:
+    """
+    指定IDのステータスを洗い出し中に差し戻す
+    戻り値: 差し戻した件数
+    """
+    return set_status(record_ids, STATUS_DRAFT, emp_id)
+
+def fetch_ids(**filters) -> list[int]:
+    """
+    フィルタ条件に合致するレコードのIDを返す（一括操作用）
+    """
+    where, params = build_where(**filters)
+    with get_connection() as conn:
+        rows = conn.execute("SELECT id FROM pfmea_records" + where, params).fetchall()
+    return [r[0] for r in rows]
+
+def fetch_scores(record_ids: list[int]) -> dict:
+    """
+    指定IDの現在のステータスと評点を返す
+    戻り値: {id: {"status", "severity", "occurrence", "detection"}}（存在しないIDは含まない）
+    """
+    if not record_ids:
+        return {}
+    placeholders = ", ".join("?" * len(record_ids))
+    with get_connection() as conn:
+        rows = conn.execute(f"""
+            SELECT id, status, severity, occurrence, detection
+            FROM pfmea_records WHERE id IN ({placeholders})
+        """, list(record_ids)).fetchall()
+    return {
+        rid: {"status": status, "severity": s, "occurrence": o, "detection": d}
+        for rid, status, s, o, d in rows
+    }
+
+def fetch_history(record_ids: list[int]) -> list[dict]:
+    """
+    指定IDの変更履歴を新しい順に返す
+    """
+    if not record_ids:
+        return []
+    placeholders = ", ".join("?" * len(record_ids))
+    with get_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(f"""
+            SELECT * FROM pfmea_history
+            WHERE record_id IN ({placeholders})
+            ORDER BY changed_at DESC, id DESC
+        """, list(record_ids)).fetchall()
+    return [dict(r) for r in rows]
+
+def fetch_changes(start: str, end: str) -> list[dict]:
+    """
+    期間内（start以上・end未満、ISO形式の日時文字列）の変更履歴を古い順に返す
+    """
+    with get_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute("""
+            SELECT * FROM pfmea_history
+            WHERE changed_at >= ? AND changed_at < ?
+            ORDER BY changed_at ASC, id ASC
+        """, (start, end)).fetchall()
+    return [dict(r) for r in rows]
+
+def fetch_approved_since(since: str = None) -> list[dict]:
+    """
+    評点候補の索引用に、承認済みレコードのうち指定日時より後に承認されたものを返す
+    since: approved_at の下限（Noneなら承認済み全件）
+    """
+    query = """
+        SELECT id, process, failure_mode, severity, occurrence, detection, approved_at
+        FROM pfmea_records WHERE status = ?
+    """
+    params = [STATUS_APPROVED]
+    if since:
+        query += " AND approved_at > ?"
+        params.append(since)
+    query += " ORDER BY approved_at ASC, id ASC"
+
+    with get_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(query, params).fetchall()
+    return [dict(r) for r in rows]
+
+
+def save_draft(emp_id: str, parse_meta: dict, parsed_records: list[dict], initial_scores: list[dict]):
+    """
+    取り込み直後の状態を下書きとして保存する（既存の下書きは置き換える）
+    initial_scores: 各レコードの評点初期値（評点候補による事前入力を含む）
+    """
+    now = datetime.now().isoformat()
+    with get_connection() as conn:
+        conn.execute("DELETE FROM draft_fields WHERE emp_id = ?", (emp_id,))
+        conn.execute("""
+            INSERT OR REPLACE INTO import_drafts (
+                emp_id, parse_meta, parsed_records, initial_scores, updated_at
+            ) VALUES (?, ?, ?, ?, ?)
+        """, (
+            emp_id,
+            json.dumps(parse_meta, ensure_ascii=False),
+            json.dumps(parsed_records, ensure_ascii=False),
+            json.dumps(initial_scores, ensure_ascii=False),
+            now
+        ))
+        conn.commit()
+
+def save_draft_fields(emp_id: str, changes: dict):
+    """
+    編集されたセルのみを下書きに書き込む
+    changes: {(row_idx, field): value, ...}
+    """
+    if not changes:
+        return
+    now = datetime.now().isoformat()
+    with get_connection() as conn:
+        conn.executemany("""
+            INSERT INTO draft_fields (emp_id, row_idx, field, value, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (emp_id, row_idx, field) DO UPDATE SET
+                value = excluded.value, updated_at = excluded.updated_at
+        """, [
+            (emp_id, row_idx, field, json.dumps(value, ensure_ascii=False), now)
+            for (row_idx, field), value in changes.items()
+        ])
+        conn.execute(
+            "UPDATE import_drafts SET updated_at = ? WHERE emp_id = ?",
+            (now, emp_id)
+        )
+        conn.commit()
+
+def load_draft(emp_id: str) -> dict | None:
+    """
+    下書きを返す
+    戻り値: {"parse_meta", "parsed_records", "initial_scores", "fields", "updated_at"}
+    fields: {(row_idx, field): value}
+    """
+    with get_connection() as conn:
+        row = conn.execute("""
+            SELECT parse_meta, parsed_records, initial_scores, updated_at
+            FROM import_drafts WHERE emp_id = ?
+        """, (emp_id,)).fetchone()
+        if row is None:
+            return None
+        fields = conn.execute(
+            "SELECT row_idx, field, value FROM draft_fields WHERE emp_id = ?",
+            (emp_id,)
+        ).fetchall()
+    return {
+        "parse_meta":     json.loads(row[0]),
+        "parsed_records": json.loads(row[1]),
+        "initial_scores": json.loads(row[2]),
+        "updated_at":     row[3],
+        "fields":         {(r, f): json.loads(v) for r, f, v in fields},
+    }
+
+def delete_draft(emp_id: str):
+    with get_connection() as conn:
+        conn.execute("DELETE FROM draft_fields WHERE emp_id = ?", (emp_id,))
+        conn.execute("DELETE FROM import_drafts WHERE emp_id = ?", (emp_id,))
         conn.commit()
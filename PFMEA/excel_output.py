@@ -1,9 +1,5 @@
 import io
 from datetime import datetime
-import openpyxl
-from openpyxl.styles import (
-    Font, Alignment, PatternFill, Border, Side
-)
 
 # 列定義：(列記号, ヘッダー表示名, DBカラム名 or None)
 COLUMNS = [
@@ -20,21 +16,9 @@ COLUMNS = [
     ("L", "故障の検出",         "current_control_detection"),
     ("M", "検出度（D）",        "detection"),
     ("N", "RPN",              "rpn"),
+    ("O", "AP",               "action_priority"),
 ]
 
-# スタイル定義
-HEADER_FILL  = PatternFill("solid", fgColor="1F4E79")
-HEADER_FONT  = Font(name="Arial", bold=True, color="FFFFFF", size=10)
-DATA_FONT    = Font(name="Arial", size=10)
-WRAP_ALIGN   = Alignment(wrap_text=True, vertical="top")
-CENTER_ALIGN = Alignment(horizontal="center", vertical="center")
-
-THIN_SIDE    = Side(style="thin", color="AAAAAA")
-THIN_BORDER  = Border(
-    top=THIN_SIDE, bottom=THIN_SIDE,
-    left=THIN_SIDE, right=THIN_SIDE
-)
-
 # 列幅定義（文字数相当）
 COL_WIDTHS = {
     "B": 6,
@@ -50,6 +34,7 @@ COL_WIDTHS = {
     "L": 30,
     "M": 8,
     "N": 8,
+    "O": 6,
 }
 
 def build_excel(
@@ -59,7 +44,26 @@ def build_excel(
 ) -> bytes:
     """
     レコードリストからExcelファイルを生成し、bytesで返す
+    openpyxl は出力時にだけ読み込む（アプリの起動を軽くする）
     """
+    import openpyxl
+    from openpyxl.styles import (
+        Font, Alignment, PatternFill, Border, Side
+    )
+
+    # スタイル定義
+    header_fill  = PatternFill("solid", fgColor="1F4E79")
+    header_font  = Font(name="Arial", bold=True, color="FFFFFF", size=10)
+    data_font    = Font(name="Arial", size=10)
+    wrap_align   = Alignment(wrap_text=True, vertical="top")
+    center_align = Alignment(horizontal="center", vertical="center")
+
+    thin_side    = Side(style="thin", color="AAAAAA")
+    thin_border  = Border(
+        top=thin_side, bottom=thin_side,
+        left=thin_side, right=thin_side
+    )
+
     wb = openpyxl.Workbook()
     ws = wb.active
 
@@ -68,21 +72,21 @@ def build_excel(
     ws.title = sheet_name
 
     # 行1：タイトル行
-    ws.merge_cells("B1:N1")
+    ws.merge_cells("B1:O1")
     title_cell = ws["B1"]
     title_cell.value = f"PFMEA　{industry}　{product}　出力日：{datetime.now().strftime('%Y-%m-%d')}"
     title_cell.font  = Font(name="Arial", bold=True, size=12, color="1F4E79")
-    title_cell.alignment = CENTER_ALIGN
+    title_cell.alignment = center_align
     ws.row_dimensions[1].height = 20
 
     # 行2：ヘッダー行
     for col_letter, header, _ in COLUMNS:
         cell = ws[f"{col_letter}2"]
         cell.value     = header
-        cell.font      = HEADER_FONT
-        cell.fill      = HEADER_FILL
-        cell.alignment = CENTER_ALIGN
-        cell.border    = THIN_BORDER
+        cell.font      = header_font
+        cell.fill      = header_fill
+        cell.alignment = center_align
+        cell.border    = thin_border
     ws.row_dimensions[2].height = 20
 
     # 行3以降：データ行
@@ -94,14 +98,14 @@ def build_excel(
             else:
                 cell.value = record.get(db_key, "")
 
-            cell.font   = DATA_FONT
-            cell.border = THIN_BORDER
+            cell.font   = data_font
+            cell.border = thin_border
 
             # 数値列はセンタリング
-            if col_letter in ("B", "G", "H", "J", "M", "N"):
-                cell.alignment = CENTER_ALIGN
+            if col_letter in ("B", "G", "H", "J", "M", "N", "O"):
+                cell.alignment = center_align
             else:
-                cell.alignment = WRAP_ALIGN
+                cell.alignment = wrap_align
 
         # 行の高さを自動調整（折り返しテキスト対応）
         ws.row_dimensions[row_idx].height = 45
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import time
+import unicodedata
+from pathlib import Path
+
+from ryuju.db import connect
+
+CACHE_PATH = Path(__file__).parent / "data" / "llm_cache.db"
+
+# 有効期限（秒）と最大保持件数
+CACHE_TTL_SECONDS = 60 * 60 * 24 * 30
+CACHE_MAX_ENTRIES = 2000
+
+# 手動貼り付け（ChatGPT画面）時のモデル設定
+DEFAULT_SETTINGS = {"model": "chatgpt-web"}
+
+def get_connection():
+    return connect(CACHE_PATH)
+
+def initialize_cache():
+    with get_connection() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                cache_key       TEXT    PRIMARY KEY,
+                prompt          TEXT    NOT NULL,
+                settings        TEXT    NOT NULL,
+                response        TEXT    NOT NULL,
+                created_at      REAL    NOT NULL,
+                last_accessed   REAL    NOT NULL,
+                hit_count       INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache (last_accessed)"
+        )
+        conn.commit()
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    全角・半角の揺れ、行末空白、空行の違いを吸収したプロンプト文字列を返す
+    """
+    text = unicodedata.normalize("NFKC", prompt)
+    lines = [line.strip() for line in text.strip().splitlines()]
+    return "\n".join(line for line in lines if line)
+
+def make_cache_key(prompt: str, settings: dict = None) -> str:
+    """
+    正規化したプロンプトとモデル設定からキャッシュキー（SHA-256）を生成する
+    """
+    settings = settings or DEFAULT_SETTINGS
+    payload = normalize_prompt(prompt) + "\0" + json.dumps(
+        settings, ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get_cached_response(prompt: str, settings: dict = None) -> dict | None:
+    """
+    キャッシュから応答を取得する
+    戻り値: ヒット時 {"response", "created_at", "hit_count"}、ミス時 None
+    有効期限切れのエントリはミス扱いとし、その場で削除する
+    """
+    key = make_cache_key(prompt, settings)
+    now = time.time()
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT response, created_at, hit_count FROM llm_cache WHERE cache_key = ?",
+            (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        response, created_at, hit_count = row
+        if now - created_at > CACHE_TTL_SECONDS:
+            conn.execute("DELETE FROM llm_cache WHERE cache_key = ?", (key,))
+            conn.commit()
+            return None
+        conn.execute(
+            "UPDATE llm_cache SET last_accessed = ?, hit_count = hit_count + 1 WHERE cache_key = ?",
+            (now, key)
+        )
+        conn.commit()
+    return {"response": response, "created_at": created_at, "hit_count": hit_count + 1}
+
+def put_cached_response(prompt: str, response: str, settings: dict = None):
+    """
+    応答をキャッシュに登録し、期限切れ・上限超過分を削除する
+    """
+    settings = settings or DEFAULT_SETTINGS
+    key = make_cache_key(prompt, settings)
+    now = time.time()
+    with get_connection() as conn:
+        conn.execute("""
+            INSERT INTO llm_cache (
+                cache_key, prompt, settings, response, created_at, last_accessed
+            ) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (cache_key) DO UPDATE SET
+                response = excluded.response,
+                created_at = excluded.created_at,
+                last_accessed = excluded.last_accessed
+        """, (
+            key, prompt, json.dumps(settings, ensure_ascii=False, sort_keys=True),
+            response, now, now
+        ))
+        _evict(conn, now)
+        conn.commit()
+
+def _evict(conn, now: float):
+    conn.execute(
+        "DELETE FROM llm_cache WHERE created_at < ?",
+        (now - CACHE_TTL_SECONDS,)
+    )
+    # 上限超過分は最終参照が古い順に削除する
+    conn.execute("""
+        DELETE FROM llm_cache WHERE cache_key IN (
+            SELECT cache_key FROM llm_cache
+            ORDER BY last_accessed DESC
+            LIMIT -1 OFFSET ?
+        )
+    """, (CACHE_MAX_ENTRIES,))
+
+def cached_call(
+    prompt: str,
+    backend,
+    settings: dict = None,
+    validate=None
+) -> tuple[str, bool]:
+    """
+    キャッシュを経由してLLMバックエンドを呼び出す
+    backend: プロンプト文字列を受け取り応答文字列を返す関数
+    validate: 応答を検証する関数（エラー時にメッセージを返す）。エラーの応答はキャッシュしない
+    戻り値: (応答文字列, キャッシュヒットかどうか)
+    """
+    cached = get_cached_response(prompt, settings)
+    if cached is not None:
+        return cached["response"], True
+
+    response = backend(prompt)
+    if validate is None or validate(response) is None:
+        put_cached_response(prompt, response, settings)
+    return response, False
+
+def cache_stats() -> dict:
+    """
+    キャッシュの件数と累計ヒット数を返す
+    """
+    with get_connection() as conn:
+        entries, hits = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(hit_count), 0) FROM llm_cache"
+        ).fetchone()
+    return {"entries": entries, "hits": hits}
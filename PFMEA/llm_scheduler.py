@@ -0,0 +1,141 @@
+import heapq
+import random
+import time
+
+from parser import parse_llm_output
+from llm_cache import cached_call
+
+# 再試行設定
+MAX_ATTEMPTS    = 4
+BACKOFF_BASE    = 2.0     # 秒
+BACKOFF_MAX     = 60.0    # 秒
+
+# レート制限（トークンバケット）
+RATE_PER_MINUTE = 20
+BURST           = 5
+
+FEEDBACK_TEMPLATE = """
+
+【前回の出力エラー】
+前回の出力は以下の理由で取り込めませんでした。
+{error}
+上記を修正し、出力ルールに従ってJSON配列のみを再出力してください。"""
+
+class TokenBucket:
+    """
+    トークンバケット方式のレート制限
+    rate: 1秒あたりの補充トークン数
+    capacity: バケットの最大トークン数（連続実行できる回数）
+    """
+    def __init__(self, rate: float, capacity: int, clock=time.monotonic, sleep=time.sleep):
+        self.rate     = rate
+        self.capacity = capacity
+        self.tokens   = float(capacity)
+        self.clock    = clock
+        self.sleep    = sleep
+        self.updated  = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """
+        トークンを1つ消費する。不足している場合は補充されるまで待機する
+        """
+        self._refill()
+        while self.tokens < 1:
+            self.sleep((1 - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= 1
+
+def backoff_delay(attempt: int) -> float:
+    """
+    指数バックオフ（ジッター付き）の待機秒数を返す
+    attempt: 失敗回数（1始まり）
+    """
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (attempt - 1)))
+    return delay * random.uniform(0.5, 1.0)
+
+def with_feedback(prompt: str, error: str) -> str:
+    """
+    パースエラーのメッセージを元のプロンプトに付け加える
+    """
+    return prompt + FEEDBACK_TEMPLATE.format(error=error)
+
+def run_batch(
+    jobs: list[dict],
+    backend,
+    settings: dict = None,
+    max_attempts: int = MAX_ATTEMPTS,
+    bucket: TokenBucket = None,
+    clock=time.monotonic,
+    sleep=time.sleep,
+    on_progress=None
+) -> dict:
+    """
+    プロンプトのバッチをLLMバックエンドで実行する
+    jobs: [{"id": 識別子, "prompt": プロンプト文字列}, ...]
+    backend: プロンプト文字列を受け取り応答文字列を返す関数（通信エラー時は例外を送出）
+    on_progress: 1件完了ごとに (job_id, result) で呼ばれる関数
+    戻り値: {job_id: {"records", "error", "attempts", "cache_hit"}}
+
+    パース失敗時はエラーメッセージを付け加えて再実行し、
+    バックエンドの例外時は指数バックオフ後に同じプロンプトで再実行する
+    （バックオフ中も他のジョブの処理は続ける）
+    """
+    if bucket is None:
+        bucket = TokenBucket(RATE_PER_MINUTE / 60, BURST, clock=clock, sleep=sleep)
+
+    results = {}
+    # (実行可能時刻, 投入順, job_id, 元のプロンプト, 今回送るプロンプト, 試行回数)
+    queue = [(0.0, i, job["id"], job["prompt"], job["prompt"], 0) for i, job in enumerate(jobs)]
+    heapq.heapify(queue)
+    seq = len(queue)
+
+    while queue:
+        ready_at, _, job_id, original, prompt, attempts = heapq.heappop(queue)
+        # バックオフ中のジョブしか残っていない場合のみ待機する
+        wait = ready_at - clock()
+        if wait > 0:
+            sleep(wait)
+        attempts += 1
+
+        bucket.acquire()
+        try:
+            response, hit = cached_call(
+                prompt, backend, settings,
+                validate=lambda r: parse_llm_output(r)[1]
+            )
+        except Exception as e:
+            error = f"バックエンドの呼び出しに失敗しました: {e}"
+            if attempts < max_attempts:
+                seq += 1
+                heapq.heappush(queue, (
+                    clock() + backoff_delay(attempts), seq,
+                    job_id, original, prompt, attempts
+                ))
+                continue
+            results[job_id] = {
+                "records": None, "error": error,
+                "attempts": attempts, "cache_hit": False
+            }
+        else:
+            records, error = parse_llm_output(response)
+            if error and attempts < max_attempts:
+                seq += 1
+                heapq.heappush(queue, (
+                    0.0, seq, job_id, original,
+                    with_feedback(original, error), attempts
+                ))
+                continue
+            results[job_id] = {
+                "records": records, "error": error,
+                "attempts": attempts, "cache_hit": hit
+            }
+
+        if on_progress is not None:
+            on_progress(job_id, results[job_id])
+
+    return results
@@ -1,4 +1,7 @@
+import hashlib
 import json
+import re
+import unicodedata
 
 REQUIRED_KEYS = [
     "failure_mode",
@@ -74,3 +77,59 @@ def to_display_records(records: list[dict]) -> list[dict]:
     for r in records:
         result.append({DISPLAY_NAMES[k]: r[k] for k in REQUIRED_KEYS if k in r})
     return result
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", "", unicodedata.normalize("NFKC", text)).lower()
+
+def record_key(record: dict) -> str:
+    """
+    レコードの同一性キー（正規化した故障モード）を返す
+    再取り込み時に同じ故障モードを対応付けるために使う
+    """
+    return _normalize(record["failure_mode"])
+
+def content_hash(record: dict) -> str:
+    """
+    必須キー全ての内容から算出したハッシュを返す（内容の変更検出用）
+    """
+    payload = "\0".join(_normalize(record[key]) for key in REQUIRED_KEYS)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def diff_records(old_records: list[dict], new_records: list[dict]) -> tuple[list[tuple[str, int | None]], int]:
+    """
+    再取り込みしたレコードを前回のレコードと対応付ける
+    戻り値: ([(区分, 前回のインデックス), ...], 削除件数)
+    区分: "継続"（内容が同一）／"変更"（故障モードが同一で内容が異なる）／"新規"
+    新規の場合、前回のインデックスは None
+    """
+    by_hash = {}
+    by_key  = {}
+    for i, r in enumerate(old_records):
+        by_hash.setdefault(content_hash(r), []).append(i)
+        by_key.setdefault(record_key(r), []).append(i)
+
+    used   = set()
+    result = [None] * len(new_records)
+
+    # 内容が完全に一致するものを先に対応付ける
+    for j, r in enumerate(new_records):
+        for i in by_hash.get(content_hash(r), []):
+            if i not in used:
+                used.add(i)
+                result[j] = ("継続", i)
+                break
+
+    # 残りは故障モードのみで対応付ける
+    for j, r in enumerate(new_records):
+        if result[j] is not None:
+            continue
+        for i in by_key.get(record_key(r), []):
+            if i not in used:
+                used.add(i)
+                result[j] = ("変更", i)
+                break
+        else:
+            result[j] = ("新規", None)
+
+    return result, len(old_records) - len(used)
@@ -0,0 +1,383 @@
+"""
+P-FMEA のバッチ処理（ブラウザを使わずに夜間バッチなどで実行する）
+使い方:
+  python pfmea_cli.py prompts JOBS OUT_DIR              ジョブごとにプロンプトを生成する（build_prompt）
+  python pfmea_cli.py parse   RESPONSES_DIR [--out DIR]  LLMの出力ファイルを検証する（parse_llm_output）
+  python pfmea_cli.py generate JOBS RESPONSES_DIR --backend-cmd CMD
+                                                         LLMを呼び出して出力ファイルを作る（llm_scheduler.run_batch）
+  python pfmea_cli.py import  JOBS RESPONSES_DIR        検証済みの出力をDBに登録する（insert_records）
+  python pfmea_cli.py excel   OUT_DIR [--status 承認済み] 業種・製品ごとにExcelを出力する（build_excel）
+共通オプション: --workers N（並列に処理するプロセス数。既定はCPU数）
+
+ジョブファイル（JSON配列。params を省略したパラメータは画面の初期値＝先頭の選択肢）:
+  [{"id": "0001", "industry": "自動車", "product": "エアクリーナ", "process": "射出成形",
+    "params": {"ゲート方式": "ピン"}}, ...]
+LLMの出力は <id>.json（または <id>.txt）として RESPONSES_DIR に置き、ジョブの id で対応付ける
+generate の CMD はプロンプトを標準入力で受け取り、LLMの応答を標準出力に書くコマンド
+（応答キャッシュを経由し、パースエラー時の再指示・失敗時の指数バックオフ・レート制限を行う）
+評点は画面（アプリA）と同じく、承認済みレコードの評点候補（なければ全て1）で登録する
+終了コード: 全件成功で0、失敗が1件でもあれば1
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+# 共通パッケージ ryuju（リポジトリ直下）を読み込めるようにする
+ROOT_DIR = str(Path(__file__).resolve().parents[1])
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from ryuju.master import load_master
+
+from database import initialize_db, insert_records, build_insert_records, fetch_records, schema_is_current
+from prompt_builder import build_prompt
+from parser import parse_llm_output
+from llm_cache import initialize_cache, put_cached_response
+from score_suggester import ScoreSuggester, initial_scores_from
+from excel_output import build_excel, make_filename
+from llm_scheduler import run_batch, TokenBucket, MAX_ATTEMPTS, RATE_PER_MINUTE, BURST
+
+RESPONSE_SUFFIXES = (".json", ".txt")
+
+# ==========================================
+# ジョブの読み込み・検証
+# ==========================================
+def load_jobs(path: str) -> list[dict]:
+    """
+    ジョブファイルを読み込む（id がないジョブには連番を振る）
+    """
+    with open(path, encoding="utf-8") as f:
+        jobs = json.load(f)
+    if not isinstance(jobs, list):
+        raise ValueError("ジョブファイルはJSON配列にしてください。")
+    return [{**job, "id": str(job.get("id") or f"{i + 1:04d}")} for i, job in enumerate(jobs)]
+
+def normalize_job(job: dict, master: dict) -> tuple[dict | None, str | None]:
+    """
+    ジョブを画面と同じ選択肢で検証し、取り込み条件（parse_meta と同じ形）にする
+    params は画面と同じ順に並べ、省略されたものは画面の初期値（先頭の選択肢）で補う
+    戻り値: (meta, エラーメッセージ)
+    """
+    industry = str(job.get("industry", "")).strip()
+    product  = str(job.get("product", "")).strip()
+    process  = str(job.get("process", "")).strip()
+    errors = []
+    if industry not in master["industries"]:
+        errors.append(f"業種「{industry}」はマスタにありません。")
+    if not product:
+        errors.append("製品名を入力してください。")
+    if not any(process in procs for procs in master["processes"].values()):
+        errors.append(f"工程名「{process}」はマスタにありません。")
+
+    given = job.get("params") or {}
+    param_defs = master["parameters"].get(process, [])
+    unknown = [name for name in given if name not in {p["name"] for p in param_defs}]
+    if unknown:
+        errors.append(f"工程「{process}」にないパラメータです：{', '.join(unknown)}")
+    params = {}
+    for p in param_defs:
+        value = given.get(p["name"], p["options"][0])
+        if value not in p["options"]:
+            errors.append(f"パラメータ「{p['name']}」の値「{value}」は選択肢にありません。")
+        params[p["name"]] = value
+
+    if errors:
+        return None, "\n".join(errors)
+    return {"industry": industry, "product": product, "process": process, "params": params}, None
+
+def find_response(responses_dir: Path, job_id: str) -> Path | None:
+    for suffix in RESPONSE_SUFFIXES:
+        path = responses_dir / f"{job_id}{suffix}"
+        if path.exists():
+            return path
+    return None
+
+def safe_filename(name: str) -> str:
+    return "".join("_" if c in '\\/:*?"<>|' else c for c in name)
+
+# ==========================================
+# ワーカープロセスで実行する処理
+# 戻り値はいずれも {"name", "ok", "message", ...}
+# ==========================================
+def prompt_task(job: dict, out_dir: str) -> dict:
+    meta, error = normalize_job(job, load_master())
+    if error:
+        return {"name": job["id"], "ok": False, "message": error}
+    prompt = build_prompt(meta["industry"], meta["product"], meta["process"], meta["params"])
+    path = Path(out_dir) / f"{safe_filename(job['id'])}.prompt.txt"
+    path.write_text(prompt, encoding="utf-8")
+    return {"name": job["id"], "ok": True, "message": f"{path.name}（{len(prompt)}文字）"}
+
+def parse_task(path: str, out_dir: str = None, name: str = None) -> dict:
+    path = Path(path)
+    name = name or path.name
+    raw_text = path.read_text(encoding="utf-8-sig")
+    records, error = parse_llm_output(raw_text)
+    if error:
+        return {"name": name, "ok": False, "message": error}
+    if out_dir:
+        out_path = Path(out_dir) / f"{path.stem}.records.json"
+        out_path.write_text(json.dumps(records, ensure_ascii=False, indent=2), encoding="utf-8")
+    return {"name": name, "ok": True, "message": f"{len(records)}件", "records": records, "raw_text": raw_text}
+
+def excel_task(records: list[dict], industry: str, product: str, out_dir: str) -> dict:
+    path = Path(out_dir) / safe_filename(make_filename(industry, product))
+    path.write_bytes(build_excel(records, industry, product))
+    return {"name": path.name, "ok": True, "message": f"{len(records)}件"}
+
+# ==========================================
+# 並列実行と結果の表示
+# ==========================================
+def run_parallel(func, tasks: list[tuple[str, tuple]], workers: int) -> dict:
+    """
+    tasks: [(名前, 引数のタプル), ...] を別プロセスで並列に実行し、完了した順に結果を表示する
+    戻り値: {名前: 結果}
+    """
+    results = {}
+    if not tasks:
+        return results
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        futures = {executor.submit(func, *args): name for name, args in tasks}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"name": name, "ok": False, "message": f"{type(e).__name__}: {e}"}
+            results[name] = result
+            report(result)
+    return results
+
+def report(result: dict):
+    mark = "OK" if result["ok"] else "NG"
+    message = result["message"].replace("\n", "\n       ")
+    print(f"[{mark}] {result['name']}: {message}", flush=True)
+
+def summarize(results: list[dict], started: float) -> int:
+    """
+    成功・失敗の件数を表示する
+    戻り値: 終了コード（失敗が1件でもあれば1）
+    """
+    failed = [r for r in results if not r["ok"]]
+    print("-" * 40)
+    print(f"成功 {len(results) - len(failed)}件／失敗 {len(failed)}件（{time.perf_counter() - started:.1f}秒）")
+    for r in failed:
+        print(f"  失敗: {r['name']}")
+    return 1 if failed else 0
+
+# ==========================================
+# サブコマンド
+# ==========================================
+def cmd_prompts(args) -> int:
+    started = time.perf_counter()
+    jobs = load_jobs(args.jobs)
+    os.makedirs(args.out_dir, exist_ok=True)
+    results = run_parallel(prompt_task, [(job["id"], (job, args.out_dir)) for job in jobs], args.workers)
+    return summarize(list(results.values()), started)
+
+def cmd_parse(args) -> int:
+    started = time.perf_counter()
+    paths = sorted(p for p in Path(args.responses_dir).iterdir() if p.suffix in RESPONSE_SUFFIXES)
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+    results = run_parallel(parse_task, [(p.name, (str(p), args.out)) for p in paths], args.workers)
+    return summarize(list(results.values()), started)
+
+def command_backend(command: str, timeout: float):
+    """
+    外部コマンドをLLMバックエンドとして呼び出す関数を返す
+    プロンプトを標準入力に渡し、標準出力を応答とする（終了コードが0以外なら例外）
+    """
+    def call(prompt: str) -> str:
+        proc = subprocess.run(
+            command, shell=True, input=prompt, capture_output=True,
+            text=True, encoding="utf-8", timeout=timeout
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"終了コード {proc.returncode}: {proc.stderr.strip()[:200]}")
+        return proc.stdout
+    return call
+
+def cmd_generate(args) -> int:
+    """
+    ジョブごとのプロンプトをLLMバックエンドで実行し、検証済みの出力を <id>.json として書き出す
+    実行は llm_scheduler.run_batch に任せる（レート制限があるため並列プロセスは使わない）
+    """
+    started = time.perf_counter()
+    jobs = load_jobs(args.jobs)
+    master = load_master()
+    os.makedirs(args.responses_dir, exist_ok=True)
+
+    results, batch = [], []
+    for job in jobs:
+        meta, error = normalize_job(job, master)
+        if error:
+            results.append({"name": job["id"], "ok": False, "message": error})
+            report(results[-1])
+            continue
+        batch.append({
+            "id": job["id"],
+            "prompt": build_prompt(meta["industry"], meta["product"], meta["process"], meta["params"])
+        })
+
+    def on_progress(job_id: str, result: dict):
+        attempts = f"試行 {result['attempts']}回" + ("・キャッシュ" if result["cache_hit"] else "")
+        if result["error"]:
+            results.append({"name": job_id, "ok": False, "message": f"{result['error']}（{attempts}）"})
+        else:
+            path = Path(args.responses_dir) / f"{safe_filename(job_id)}.json"
+            path.write_text(json.dumps(result["records"], ensure_ascii=False, indent=2), encoding="utf-8")
+            results.append({"name": job_id, "ok": True, "message": f"{len(result['records'])}件（{attempts}）"})
+        report(results[-1])
+
+    initialize_cache()
+    run_batch(
+        batch,
+        command_backend(args.backend_cmd, args.timeout),
+        settings={"backend": args.backend_cmd},
+        max_attempts=args.max_attempts,
+        bucket=TokenBucket(args.rate_per_minute / 60, args.burst),
+        on_progress=on_progress
+    )
+    return summarize(results, started)
+
+def cmd_import(args) -> int:
+    """
+    出力ファイルの検証は並列に行い、評点候補の検索とDBへの登録はジョブの順に1プロセスで行う
+    （評点候補の索引を1つで済ませ、登録順をジョブファイルの順にそろえる）
+    --dry-run ではDB・キャッシュの作成やスキーマ更新も行わない（DBが未作成・旧スキーマならエラー）
+    """
+    if args.dry_run and not schema_is_current():
+        print(
+            "エラー: DBが未作成か、スキーマが古いため --dry-run では評点候補を検索できません。"
+            "アプリを起動するか --dry-run なしで実行してDBを更新してください。",
+            file=sys.stderr
+        )
+        return 1
+    started = time.perf_counter()
+    jobs = load_jobs(args.jobs)
+    master = load_master()
+    responses_dir = Path(args.responses_dir)
+
+    failures, metas, tasks = [], {}, []
+    for job in jobs:
+        meta, error = normalize_job(job, master)
+        path = find_response(responses_dir, job["id"])
+        if error is None and path is None:
+            error = f"出力ファイル（{job['id']}.json または .txt）がありません。"
+        if error:
+            failures.append({"name": job["id"], "ok": False, "message": error})
+            report(failures[-1])
+            continue
+        metas[job["id"]] = meta
+        tasks.append((job["id"], (str(path), None, job["id"])))
+    parsed = run_parallel(parse_task, tasks, args.workers)
+
+    if not args.dry_run:
+        initialize_db()
+        initialize_cache()
+    suggester = ScoreSuggester()
+    suggester.refresh()
+
+    print("-" * 40)
+    imported = []
+    for job in jobs:
+        result = parsed.get(job["id"])
+        if result is None or not result["ok"]:
+            continue
+        meta, records = metas[job["id"]], result["records"]
+        try:
+            suggestions = suggester.suggest_batch(meta["process"], [r["failure_mode"] for r in records])
+            rows = build_insert_records(records, initial_scores_from(suggestions), meta)
+            if not args.dry_run:
+                insert_records(rows)
+                # 画面と同じく、検証済みの出力をキャッシュに登録する
+                put_cached_response(
+                    build_prompt(meta["industry"], meta["product"], meta["process"], meta["params"]),
+                    result["raw_text"]
+                )
+        except Exception as e:
+            failures.append({"name": job["id"], "ok": False, "message": f"登録に失敗しました: {e}"})
+            report(failures[-1])
+            continue
+        matched = sum(1 for sug in suggestions if sug)
+        imported.append({
+            "name": job["id"], "ok": True,
+            "message": f"{len(rows)}件を{'登録できます（--dry-run）' if args.dry_run else '登録しました'}"
+                       f"（評点候補あり {matched}件）"
+        })
+        report(imported[-1])
+
+    failed_parse = [r for r in parsed.values() if not r["ok"]]
+    return summarize(imported + failures + failed_parse, started)
+
+def cmd_excel(args) -> int:
+    started = time.perf_counter()
+    records = fetch_records(
+        industry=args.industry, product=args.product, process=args.process,
+        status=args.status, keyword=args.keyword
+    )
+    # 業種・製品ごとに1ファイル（画面の出力と同じくシート名・ファイル名に使う）
+    groups = {}
+    for r in records:
+        groups.setdefault((r["industry"], r["product"]), []).append(r)
+    os.makedirs(args.out_dir, exist_ok=True)
+    tasks = [
+        (f"{industry}_{product}", (group, industry, product, args.out_dir))
+        for (industry, product), group in groups.items()
+    ]
+    results = run_parallel(excel_task, tasks, args.workers)
+    if not records:
+        print("条件に合うレコードはありません。")
+    return summarize(list(results.values()), started)
+
+def main(argv: list[str] = None) -> int:
+    arg_parser = argparse.ArgumentParser(description="P-FMEA のバッチ処理（プロンプト生成・LLM呼び出し・出力の検証・DB登録・Excel出力）")
+    arg_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="並列に処理するプロセス数")
+    sub = arg_parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("prompts", help="ジョブごとにプロンプトを生成する")
+    p.add_argument("jobs", help="ジョブファイル（JSON配列）")
+    p.add_argument("out_dir", help="プロンプトの出力先フォルダ")
+    p.set_defaults(func=cmd_prompts)
+
+    p = sub.add_parser("parse", help="LLMの出力ファイル（.json／.txt）を検証する")
+    p.add_argument("responses_dir", help="出力ファイルのフォルダ")
+    p.add_argument("--out", help="検証済みレコードを <名前>.records.json として書き出すフォルダ")
+    p.set_defaults(func=cmd_parse)
+
+    p = sub.add_parser("generate", help="LLMを呼び出して出力ファイル（<id>.json）を作る")
+    p.add_argument("jobs", help="ジョブファイル（JSON配列）")
+    p.add_argument("responses_dir", help="出力ファイルの書き出し先フォルダ（import の入力になる）")
+    p.add_argument("--backend-cmd", required=True, help="プロンプトを標準入力で受け取り、応答を標準出力に書くコマンド")
+    p.add_argument("--timeout", type=float, default=300, help="1回の呼び出しのタイムアウト（秒）")
+    p.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS, help="1ジョブあたりの最大試行回数")
+    p.add_argument("--rate-per-minute", type=float, default=RATE_PER_MINUTE, help="1分あたりの呼び出し回数の上限")
+    p.add_argument("--burst", type=int, default=BURST, help="連続して呼び出せる回数")
+    p.set_defaults(func=cmd_generate)
+
+    p = sub.add_parser("import", help="検証済みの出力をDBに登録する（ステータス：洗い出し中）")
+    p.add_argument("jobs", help="ジョブファイル（JSON配列）")
+    p.add_argument("responses_dir", help="出力ファイル（<id>.json／<id>.txt）のフォルダ")
+    p.add_argument("--dry-run", action="store_true", help="検証と評点候補の検索のみ行い、登録しない")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("excel", help="業種・製品ごとにExcelを出力する")
+    p.add_argument("out_dir", help="Excelの出力先フォルダ")
+    p.add_argument("--industry")
+    p.add_argument("--product", help="部分一致")
+    p.add_argument("--process")
+    p.add_argument("--status", default="全て", help="洗い出し中／承認済み／全て")
+    p.add_argument("--keyword", help="故障モードの部分一致")
+    p.set_defaults(func=cmd_excel)
+
+    args = arg_parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,4 @@
-import json
-from pathlib import Path
-
-MASTER_PATH = Path(__file__).parent / "master_data.json"
-
-def load_master() -> dict:
-    with open(MASTER_PATH, encoding="utf-8") as f:
-        return json.load(f)
+from ryuju.master import load_master
 
 def get_additional_risks(process: str, params: dict) -> list[str]:
     """
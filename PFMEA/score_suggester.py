@@ -0,0 +1,155 @@
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+from database import fetch_approved_since, fetch_scores, STATUS_APPROVED
+
+NGRAM_SIZE     = 2
+MIN_SIMILARITY = 0.3
+SCORE_KEYS     = ("severity", "occurrence", "detection")
+
+_STRIP_PATTERN = re.compile(r"[\s\W_]+")
+
+def normalize_text(text: str) -> str:
+    """
+    全角・半角、大文字・小文字、空白・記号の違いを吸収した文字列を返す
+    """
+    return _STRIP_PATTERN.sub("", unicodedata.normalize("NFKC", text).lower())
+
+def ngrams(text: str, n: int = NGRAM_SIZE) -> set[str]:
+    text = normalize_text(text)
+    if len(text) < n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+class ScoreSuggester:
+    """
+    承認済みレコードの故障モードを工程ごとに文字n-gramで索引化し、
+    新しい故障モードに最も近い過去レコードの評点を返す
+    索引は approved_at をもとに差分だけ追加する
+    """
+    def __init__(self):
+        self.docs     = {}                                        # id -> 評点と故障モード
+        self.postings = defaultdict(lambda: defaultdict(set))     # process -> n-gram -> {id}
+        self.sizes    = {}                                        # id -> n-gram数
+        self.last_approved_at = None
+        self.lock = threading.Lock()
+
+    def add(self, record: dict):
+        rid = record["id"]
+        if rid in self.docs:
+            # 再承認されたレコードは評点のみ更新する
+            for key in SCORE_KEYS:
+                self.docs[rid][key] = record[key]
+            return
+        grams = ngrams(record["failure_mode"])
+        if not grams:
+            return
+        self.docs[rid] = {
+            "id":           rid,
+            "failure_mode": record["failure_mode"],
+            "severity":     record["severity"],
+            "occurrence":   record["occurrence"],
+            "detection":    record["detection"],
+        }
+        self.sizes[rid] = len(grams)
+        index = self.postings[record["process"]]
+        for g in grams:
+            index[g].add(rid)
+
+    def remove(self, rid: int):
+        doc = self.docs.pop(rid, None)
+        if doc is None:
+            return
+        self.sizes.pop(rid, None)
+        for index in self.postings.values():
+            for g in ngrams(doc["failure_mode"]):
+                index.get(g, set()).discard(rid)
+
+    def refresh(self):
+        """
+        前回以降に承認されたレコードを索引に追加する
+        """
+        with self.lock:
+            for record in fetch_approved_since(self.last_approved_at):
+                self.add(record)
+                if record["approved_at"]:
+                    self.last_approved_at = max(self.last_approved_at or "", record["approved_at"])
+
+    def suggest(self, process: str, failure_mode: str) -> dict | None:
+        """
+        同一工程の承認済みレコードから最も類似した故障モードの評点を返す
+        戻り値: {"id", "failure_mode", "severity", "occurrence", "detection", "similarity"}
+        類似度（Dice係数）が MIN_SIMILARITY 未満なら None
+        """
+        with self.lock:
+            return self._suggest(process, failure_mode)
+
+    def _suggest(self, process: str, failure_mode: str) -> dict | None:
+        # self.lock を保持して呼び出す（refresh・remove と索引を同時に触らないため）
+        grams = ngrams(failure_mode)
+        index = self.postings.get(process)
+        if not grams or not index:
+            return None
+
+        shared = Counter()
+        for g in grams:
+            shared.update(index.get(g, ()))
+        if not shared:
+            return None
+
+        best_id, best_score = None, 0.0
+        for rid, count in shared.items():
+            score = 2 * count / (len(grams) + self.sizes[rid])
+            # 同点なら新しいレコードを優先する
+            if score > best_score or (score == best_score and rid > best_id):
+                best_id, best_score = rid, score
+
+        if best_score < MIN_SIMILARITY:
+            return None
+        return {**self.docs[best_id], "similarity": round(best_score, 2)}
+
+    def suggest_batch(self, process: str, failure_modes: list[str]) -> list[dict | None]:
+        """
+        複数の故障モードの評点候補をまとめて返す
+        候補の評点はDBの現在値に置き換える（承認後にアプリBで評点が編集された場合に備える）
+        候補が差し戻し等で承認済みでなくなっていた場合は索引から除いて選び直す
+        """
+        while True:
+            with self.lock:
+                results = [self._suggest(process, fm) for fm in failure_modes]
+            ids = {r["id"] for r in results if r}
+            current = fetch_scores(list(ids))
+            stale = [
+                rid for rid in ids
+                if current.get(rid, {}).get("status") != STATUS_APPROVED
+            ]
+            with self.lock:
+                for rid in stale:
+                    self.remove(rid)
+                if not stale:
+                    for rid in ids:
+                        if rid in self.docs:
+                            self.add({"id": rid, **current[rid]})
+                    return [
+                        {**r, **{k: current[r["id"]][k] for k in SCORE_KEYS}} if r else None
+                        for r in results
+                    ]
+
+def initial_scores_from(suggestions: list[dict | None]) -> list[dict]:
+    """
+    評点候補から各レコードの評点初期値を生成する（候補なしは全て1）
+    """
+    initial = []
+    for sug in suggestions:
+        initial.append({
+            "severity":   sug["severity"] if sug else 1,
+            "occurrence": sug["occurrence"] if sug else 1,
+            "detection":  sug["detection"] if sug else 1,
+            "ref_id":     sug["id"] if sug else None,
+            "similarity": sug["similarity"] if sug else None,
+            "remarks":    "",
+            "diff_status": "新規",
+        })
+    return initial
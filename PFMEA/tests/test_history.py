@@ -0,0 +1,73 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+APP_DIR = Path(__file__).resolve().parents[1]
+for path in (APP_DIR, APP_DIR.parent):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+import database
+from database import SYSTEM_USER
+
+RECORD = {
+    "industry": "自動車", "product": "ドアトリム", "process": "射出成形",
+    "failure_mode": "ショートショット", "effect": "外観不良", "cause": "射出圧不足",
+    "current_control_prevention": "条件管理", "current_control_detection": "外観検査",
+    "recommended_action": "圧力監視", "severity": 8, "occurrence": 5, "detection": 4,
+}
+
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", tmp_path / "pfmea_database.db")
+    database.initialize_db()
+
+def insert_record() -> int:
+    database.insert_records([dict(RECORD)])
+    with database.get_connection() as conn:
+        return conn.execute("SELECT MAX(id) FROM pfmea_records").fetchone()[0]
+
+def history(record_id: int) -> list[tuple]:
+    with database.get_connection() as conn:
+        return conn.execute("""
+            SELECT changed_by, column_name, old_value, new_value FROM pfmea_history
+            WHERE record_id = ? ORDER BY id
+        """, (record_id,)).fetchall()
+
+def test_edit_is_attributed_to_editor():
+    rid = insert_record()
+    database.update_record(rid, {"remarks": "確認済み"}, emp_id="1234")
+    assert history(rid) == [("1234", "remarks", "", "確認済み")]
+
+def test_update_without_updated_by_is_not_attributed_to_last_editor():
+    rid = insert_record()
+    database.update_record(rid, {"remarks": "確認済み"}, emp_id="1234")
+    with database.get_connection() as conn:
+        conn.execute("UPDATE pfmea_records SET remarks = '再確認' WHERE id = ?", (rid,))
+    assert history(rid)[-1] == (None, "remarks", "確認済み", "再確認")
+
+def test_backfill_records_no_history():
+    rid = insert_record()
+    database.update_record(rid, {"remarks": "確認済み"}, emp_id="1234")
+    with database.get_connection() as conn:
+        # AP列の追加前に登録されたレコードを再現する（トリガーを通さない）
+        conn.execute("DROP TRIGGER trg_pfmea_history")
+        conn.execute("UPDATE pfmea_records SET action_priority = NULL WHERE id = ?", (rid,))
+        database.create_history(conn)
+    assert database.backfill_action_priority() == 1
+    assert history(rid) == [("1234", "remarks", "", "確認済み")]
+
+def test_repair_is_attributed_to_system():
+    rid = insert_record()
+    database.update_record(rid, {"remarks": "確認済み"}, emp_id="1234")
+    with database.get_connection() as conn:
+        conn.execute("DROP TRIGGER trg_pfmea_history")
+        conn.execute("UPDATE pfmea_records SET action_priority = 'L' WHERE id = ?", (rid,))
+        database.create_history(conn)
+    assert database.find_inconsistent_records()["action_priority"] == [rid]
+    assert database.repair_action_priority([rid]) == 1
+    assert history(rid)[-1] == (SYSTEM_USER, "action_priority", "L", "M")
+    assert database.find_inconsistent_records()["action_priority"] == []
+    # 変更のないレコードは書き換えない
+    assert database.repair_action_priority([rid]) == 0
@@ -0,0 +1,152 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+APP_DIR = Path(__file__).resolve().parents[1]
+for path in (APP_DIR, APP_DIR.parent):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+import llm_cache
+import llm_scheduler
+from llm_scheduler import TokenBucket, backoff_delay, run_batch
+
+VALID_RESPONSE = json.dumps([{
+    "failure_mode": "ショートショット", "effect": "外観不良", "cause": "射出圧不足",
+    "current_control_prevention": "条件管理", "current_control_detection": "外観検査",
+    "recommended_action": "圧力監視",
+}], ensure_ascii=False)
+
+class FakeClock:
+    """
+    sleep で時刻が進むだけの時計（実際には待たない）
+    """
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "CACHE_PATH", tmp_path / "llm_cache.db")
+    llm_cache.initialize_cache()
+
+@pytest.fixture
+def max_jitter(monkeypatch):
+    # ジッターを上限（係数1.0）に固定する
+    monkeypatch.setattr(llm_scheduler.random, "uniform", lambda low, high: high)
+
+def test_backoff_delay_doubles_up_to_max(max_jitter):
+    assert [backoff_delay(n) for n in range(1, 8)] == [2.0, 4.0, 8.0, 16.0, 32.0, 60.0, 60.0]
+
+def test_backoff_delay_jitter_range(monkeypatch):
+    monkeypatch.setattr(llm_scheduler.random, "uniform", lambda low, high: low)
+    assert backoff_delay(3) == 4.0
+
+def test_bucket_allows_burst_then_waits_for_refill():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=0.5, capacity=2, clock=clock, sleep=clock.sleep)
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == []
+    bucket.acquire()
+    assert sum(clock.sleeps) == pytest.approx(2.0)
+
+def test_bucket_refill_is_capped_at_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1.0, capacity=2, clock=clock, sleep=clock.sleep)
+    bucket.acquire()
+    bucket.acquire()
+    clock.now += 100
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == []
+    bucket.acquire()
+    assert sum(clock.sleeps) == pytest.approx(1.0)
+
+def test_run_batch_backs_off_without_blocking_other_jobs(max_jitter):
+    clock = FakeClock()
+    failures = {"a": 2}
+    calls = []
+
+    def backend(prompt: str) -> str:
+        job_id = prompt[0]
+        calls.append((job_id, clock.now))
+        if failures.get(job_id, 0) > 0:
+            failures[job_id] -= 1
+            raise ConnectionError("timeout")
+        return VALID_RESPONSE
+
+    progress = []
+    bucket = TokenBucket(rate=1000, capacity=1000, clock=clock, sleep=clock.sleep)
+    results = run_batch(
+        [{"id": "a", "prompt": "a: prompt"}, {"id": "b", "prompt": "b: prompt"}],
+        backend, bucket=bucket, clock=clock, sleep=clock.sleep,
+        on_progress=lambda job_id, result: progress.append(job_id)
+    )
+
+    # b は a のバックオフを待たずに処理され、a は 2秒・4秒の間隔で再試行される
+    assert progress == ["b", "a"]
+    assert calls == [("a", 0.0), ("b", 0.0), ("a", 2.0), ("a", 6.0)]
+    assert clock.sleeps == [2.0, 4.0]
+    assert results["a"]["attempts"] == 3
+    assert results["a"]["error"] is None
+
+def test_run_batch_gives_up_after_max_attempts(max_jitter):
+    clock = FakeClock()
+
+    def backend(prompt: str) -> str:
+        raise ConnectionError("timeout")
+
+    bucket = TokenBucket(rate=1000, capacity=1000, clock=clock, sleep=clock.sleep)
+    results = run_batch(
+        [{"id": "a", "prompt": "a"}], backend, max_attempts=3,
+        bucket=bucket, clock=clock, sleep=clock.sleep
+    )
+    assert results["a"]["attempts"] == 3
+    assert results["a"]["records"] is None
+    assert "timeout" in results["a"]["error"]
+    assert clock.sleeps == [2.0, 4.0]
+
+def test_run_batch_retries_parse_errors_with_feedback():
+    clock = FakeClock()
+    prompts = []
+
+    def backend(prompt: str) -> str:
+        prompts.append(prompt)
+        return "not json" if len(prompts) == 1 else VALID_RESPONSE
+
+    bucket = TokenBucket(rate=1000, capacity=1000, clock=clock, sleep=clock.sleep)
+    results = run_batch(
+        [{"id": "a", "prompt": "元のプロンプト"}], backend,
+        bucket=bucket, clock=clock, sleep=clock.sleep
+    )
+    assert results["a"]["attempts"] == 2
+    assert len(results["a"]["records"]) == 1
+    assert prompts[1].startswith("元のプロンプト")
+    assert "【前回の出力エラー】" in prompts[1]
+    # パースエラーの再指示はバックオフしない
+    assert clock.sleeps == []
+
+def test_run_batch_rate_limits_calls():
+    clock = FakeClock()
+    calls = []
+
+    def backend(prompt: str) -> str:
+        calls.append(clock.now)
+        return VALID_RESPONSE
+
+    bucket = TokenBucket(rate=1.0, capacity=2, clock=clock, sleep=clock.sleep)
+    run_batch(
+        [{"id": str(i), "prompt": f"prompt {i}"} for i in range(4)], backend,
+        bucket=bucket, clock=clock, sleep=clock.sleep
+    )
+    assert calls == pytest.approx([0.0, 0.0, 1.0, 2.0])
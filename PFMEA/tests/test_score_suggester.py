@@ -0,0 +1,49 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+APP_DIR = Path(__file__).resolve().parents[1]
+for path in (APP_DIR, APP_DIR.parent):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+import database
+from score_suggester import ScoreSuggester
+
+RECORD = {
+    "industry": "自動車", "product": "ドアトリム", "process": "射出成形",
+    "failure_mode": "ショートショット", "effect": "外観不良", "cause": "射出圧不足",
+    "current_control_prevention": "条件管理", "current_control_detection": "外観検査",
+    "recommended_action": "圧力監視", "severity": 8, "occurrence": 5, "detection": 4,
+}
+
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", tmp_path / "pfmea_database.db")
+    database.initialize_db()
+
+@pytest.fixture
+def approved_id() -> int:
+    database.insert_records([dict(RECORD)])
+    with database.get_connection() as conn:
+        rid = conn.execute("SELECT MAX(id) FROM pfmea_records").fetchone()[0]
+    database.approve_records([rid], "1234")
+    return rid
+
+def test_suggest_batch_uses_scores_edited_after_approval(approved_id):
+    suggester = ScoreSuggester()
+    suggester.refresh()
+    database.update_record(approved_id, {"severity": 9}, emp_id="1234")
+
+    [sug] = suggester.suggest_batch("射出成形", ["ショートショット"])
+    assert (sug["id"], sug["severity"], sug["occurrence"]) == (approved_id, 9, 5)
+    assert suggester.suggest("射出成形", "ショートショット")["severity"] == 9
+
+def test_suggest_batch_drops_returned_records(approved_id):
+    suggester = ScoreSuggester()
+    suggester.refresh()
+    database.return_records([approved_id], "1234")
+
+    assert suggester.suggest_batch("射出成形", ["ショートショット"]) == [None]
+    assert approved_id not in suggester.docs
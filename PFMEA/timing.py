@@ -0,0 +1,38 @@
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+# 区画ごとに保持する計測回数
+HISTORY_SIZE = 20
+
+@contextmanager
+def timed(scope: str):
+    """
+    ブロックの処理時間（ミリ秒）を区画名ごとにセッションへ記録する
+    例：scope="全体" は画面全体の再実行、フラグメント名はその区画のみの再実行
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        timings = st.session_state.setdefault("timings", {})
+        history = timings.setdefault(scope, [])
+        history.append(elapsed)
+        del history[:-HISTORY_SIZE]
+
+def show_timings():
+    """
+    サイドバーに区画ごとの直近・平均処理時間を表示する
+    """
+    timings = st.session_state.get("timings", {})
+    with st.sidebar.expander("⏱ 操作ごとの処理時間"):
+        if not timings:
+            st.caption("計測データはまだありません。")
+            return
+        for scope, history in timings.items():
+            st.caption(
+                f"{scope}：直近 {history[-1]:.0f} ms ／ "
+                f"平均 {sum(history) / len(history):.0f} ms（{len(history)}回）"
+            )
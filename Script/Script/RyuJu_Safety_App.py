@@ -1,8 +1,20 @@
 import streamlit as st
-import pandas as pd
 import datetime
 import os
-import uuid
+import sys
+from pathlib import Path
+
+# 共通パッケージ ryuju（リポジトリ直下）を読み込めるようにする
+ROOT_DIR = str(Path(__file__).resolve().parents[2])
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from ryuju.auth import check_password, logout_button
+from ryuju.storage import ensure_data_dir, save_fact, migrate_legacy_data_dir
+from fact_log import FactStore, new_case_id
+from fact_similar import SimilarCases, format_similar_cases
+from analysis_parser import parse_analysis
+import analysis_db
 
 # ==========================================
 # 設定・定数定義
@@ -14,98 +26,80 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-DATA_DIR = "data"
-LOG_FILE = os.path.join(DATA_DIR, "safety_fact_log.csv")
+# アプリのフォルダ直下（起動時の作業フォルダによらず、統合版 ryuju_app.py からも同じ場所）
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(APP_DIR, "data")
+LOG_FILE = os.path.join(DATA_DIR, "safety_fact_log.csv")  # 旧形式のCSVログ（初回起動時に取り込む）
+LOG_STORE = FactStore(os.path.join(DATA_DIR, "safety_fact_log"))
+SIMILAR_TOP_K = 3  # プロンプト生成時に表示する類似の過去事例の件数
 
 # ==========================================
-# 認証・ログイン関連処理 (追加機能)
+# 関数定義 (既存機能)
 # ==========================================
-def check_password():
+
+@st.cache_resource
+def get_similar_cases(log_path: str):
     """
-    ログイン認証を行う関数。
-    セッションステートを使用してログイン状態を保持する。
+    類似事例検索の TF-IDF 行列（プロセス内で共有し、保存のたびに追記分だけ反映する）
+    log_path: ログの保存先。統合版では Safety と Quality が同じプロセスで動くため、キャッシュをログごとに分ける
     """
-    # セッションステートの初期化（未定義ならFalseに設定）
-    if 'logged_in' not in st.session_state:
-        st.session_state.logged_in = False
-
-    # ログイン済みなら何もしない（メイン処理へ進む）
-    if st.session_state.logged_in:
-        return True
-
-    # --- ログイン画面のUI ---
-    st.markdown("## 🔒 労働安全・ヒヤリハット分析ツール ログイン")
-    st.info("社員番号とパスワードを入力してください。")
-
-    col1, col2 = st.columns(2)
-    with col1:
-        # 社員番号入力（最大文字数を指定して誤入力を防ぐ）
-        input_emp_id = st.text_input("社員番号 (数字4桁)", max_chars=4, placeholder="例: 1234")
-    with col2:
-        # パスワード入力（type='password'で伏せ字にする）
-        input_password = st.text_input("パスワード", type="password")
-
-    if st.button("ログイン", type="primary"):
-        # --- 認証ロジック ---
-        CORRECT_PASSWORD = "wako0001"
-
-        # バリデーション：数字4桁かチェック
-        if not input_emp_id.isdigit() or len(input_emp_id) != 4:
-            st.error("❌ 社員番号は「数字4桁」で入力してください。")
-            return False
-        
-        # パスワードチェック
-        if input_password == CORRECT_PASSWORD:
-            st.session_state.logged_in = True
-            st.session_state.emp_id = input_emp_id  # 社員番号を記録（後でログに使える）
-            st.success("ログイン成功")
-            st.rerun()  # 画面を再読み込みしてメインアプリを表示
-            return True
-        else:
-            st.error("❌ パスワードが違います。")
-            return False
-    
-    return False
-
-# ==========================================
-# 関数定義 (既存機能)
-# ==========================================
+    return SimilarCases(FactStore(log_path))
 
-def ensure_data_dir():
-    if not os.path.exists(DATA_DIR):
-        try:
-            os.makedirs(DATA_DIR)
-        except Exception as e:
-            st.error(f"【システムエラー】フォルダ作成に失敗しました: {e}")
+@st.cache_resource(show_spinner=False)
+def prepare_log_store() -> list[str]:
+    """
+    保存先の移行・旧ログの取り込み・事例IDの移行をプロセスごとに1回だけ行う
+    （いずれもログのファイルロックを取るため、再実行のたびには行わない。失敗時はキャッシュされず次回に再試行する）
+    戻り値: 表示するメッセージ
+    """
+    messages = []
+    # 作業フォルダ基準だった旧保存先にログ・DBが残っていれば移す
+    moved = migrate_legacy_data_dir(DATA_DIR, ["safety_fact_log", "analysis.db"])
+    if moved:
+        messages.append(f"旧保存先から{len(moved)}個のファイルを移しました。")
+    # 単一ファイル形式のログを月別セグメントへ分ける（初回のみ）
+    LOG_STORE.migrate_layout()
+    imported = LOG_STORE.import_csv(LOG_FILE)
+    if imported:
+        messages.append(f"旧CSVログから{imported}件を取り込みました。")
+    # 旧形式（8桁）の事例IDをULIDへ振り直す（旧IDでも引けるよう残す）
+    migrated = LOG_STORE.migrate_case_ids()
+    if migrated:
+        messages.append(f"{migrated}件の事例IDを新形式に更新しました。")
+    return messages
+
+@st.cache_resource(show_spinner=False)
+def init_analysis_db():
+    """
+    分析結果DBのテーブルを作成する（プロセスごとに1回）
+    """
+    analysis_db.initialize_db()
 
 def save_to_csv(fact_text):
-    ensure_data_dir()
-    now = datetime.datetime.now()
-    case_id = str(uuid.uuid4())[:8]
-    
-    # ログイン中の社員番号を取得（未ログイン時はUnknown）
-    recorder_id = st.session_state.get('emp_id', 'Unknown')
-    
-    new_data = {
-        "timestamp": now.strftime("%Y-%m-%d %H:%M:%S"),
-        "case_id": case_id,
-        "recorder_id": recorder_id, # 記録者IDを追加
-        "raw_facts": fact_text
-    }
-    
-    df = pd.DataFrame([new_data])
-    
-    try:
-        if not os.path.exists(LOG_FILE):
-            df.to_csv(LOG_FILE, index=False, encoding="utf-8-sig")
-        else:
-            df.to_csv(LOG_FILE, mode='a', header=False, index=False, encoding="utf-8-sig")
-        return True
-    except Exception as e:
-        st.error(f"【ログ保存エラー】CSVへの書き込みに失敗しました: {e}")
-        return False
+    """
+    入力された事実をログに保存し、類似事例の検索対象にも加える。
+    戻り値: 事例ID（作成時刻順に並ぶULID、失敗時は False）
+    """
+    return save_fact(LOG_STORE, fact_text, new_case_id(), get_similar_cases(LOG_STORE.base_path))
 
-def generate_prompt_template(facts):
+def save_analysis_result(case_id, raw_text):
+    """
+    AIの回答（なぜなぜ分析）を読み取り、事例に紐づけて分析結果DBへ保存する
+    戻り値: (分析結果, エラーメッセージ)
+    """
+    fact = LOG_STORE.get(case_id.strip())
+    if fact is None:
+        return None, f"事例ID「{case_id}」のログが見つかりません。"
+    analysis, error = parse_analysis(raw_text, "safety")
+    if error:
+        return None, error
+    analysis_db.save_analysis(
+        "safety", fact["case_id"], fact["timestamp"], raw_text, analysis,
+        st.session_state.get('emp_id', 'Unknown')
+    )
+    return analysis, None
+
+def generate_prompt_template(facts, similar_cases=None):
     """
     【安全・ヒヤリハット分析版（強化型）】
     論理的連鎖（Chain of Logic）に加え、逆検証（Reverse Verification）を強制するプロンプト
@@ -118,7 +112,7 @@ def generate_prompt_template(facts):
 
 ## 1. 発生事象と事実
 {facts}
-
+{format_similar_cases(similar_cases)}
 ## 2. 分析プロセス指示
 
 ### Step 1: リスクと要因の整理
@@ -184,6 +178,22 @@ def generate_prompt_template(facts):
 # メイン処理 (UI構築)
 # ==========================================
 def main():
+    # 旧形式のCSVログがあれば、初回のみログ保存先へ取り込む
+    ensure_data_dir(DATA_DIR)
+    try:
+        # 初回のみ表示する（キャッシュ済みの結果は再実行のたびに返るため）
+        messages = prepare_log_store()
+        if not st.session_state.get("safety_storage_notified"):
+            st.session_state["safety_storage_notified"] = True
+            for message in messages:
+                st.toast(message)
+    except Exception as e:
+        st.error(f"【ログ取り込みエラー】旧ログの取り込み・移行に失敗しました: {e}")
+    try:
+        init_analysis_db()
+    except Exception as e:
+        st.error(f"【システムエラー】分析結果DBの初期化に失敗しました: {e}")
+
     # --- CSS注入（フォントサイズ調整） ---
     st.markdown("""
     <style>
@@ -200,11 +210,7 @@ def main():
         st.markdown('<h1><span style="color: #008000;">✙</span> 安全・ヒヤリ入力</h1>', unsafe_allow_html=True)
         
         # ログイン情報の表示
-        current_user = st.session_state.get('emp_id', 'Unknown')
-        st.caption(f"ログイン中: 社員番号 {current_user}")
-        if st.button("ログアウト", type="secondary"):
-            st.session_state.logged_in = False
-            st.rerun()
+        logout_button()
 
         st.write("---")
         
@@ -214,10 +220,32 @@ def main():
         input_when_detail = st.text_input("いつ（詳細時刻）", placeholder="例：午前10時、残業時間帯")
         input_where = st.text_input("どこで", placeholder="例：出荷バース、第2倉庫")
         
+        st.write("---")
+        include_similar = st.checkbox(
+            "類似の過去事例をプロンプトに含める", value=True,
+            help="過去ログから似ている事例を探し、再発でないか照合するようAIに指示します。"
+        )
+
         st.write("---")
         st.header("💡 安全分析のヒント")
         st.info("不安全な「行動」だけでなく、それを許した「環境や管理」の事実を書いてください。ヒヤリハットは宝の山です。")
 
+        st.write("---")
+        with st.expander("📥 ログのCSV出力（Excel用）"):
+            export_from = st.date_input("開始日", datetime.date.today() - datetime.timedelta(days=30), key="safety_export_from")
+            export_to = st.date_input("終了日", datetime.date.today(), key="safety_export_to")
+            if st.button("CSVを作成する"):
+                st.session_state["safety_export_csv"] = LOG_STORE.export_csv(
+                    str(export_from), str(export_to + datetime.timedelta(days=1))
+                )
+            if "safety_export_csv" in st.session_state:
+                st.download_button(
+                    "CSVをダウンロード",
+                    data=st.session_state["safety_export_csv"],
+                    file_name=f"safety_fact_log_{export_from}_{export_to}.csv",
+                    mime="text/csv"
+                )
+
     # メイン画面
     col_title, col_logo = st.columns([5, 1])
     with col_title:
@@ -225,8 +253,9 @@ def main():
         st.markdown('## <span style="color: #008000;">✙</span> 労災・ヒヤリハット論理分析支援ツール「🐉 龍樹 RyuJu -Safety-」', unsafe_allow_html=True)
 
     with col_logo:
-        if os.path.exists("header_logo.png"):
-            st.image("header_logo.png", use_container_width=True)
+        logo_path = os.path.join(APP_DIR, "header_logo.png")
+        if os.path.exists(logo_path):
+            st.image(logo_path, use_container_width=True)
     
     # 【UI修正】フォントサイズ統一と赤文字注意喚起
     st.markdown("#### サイドバーの基本情報に加え、以下の欄に詳細な事実や気づきを入力してください。")
@@ -271,10 +300,22 @@ def main():
         if not input_how:
             st.warning("⚠️ サイドバーの「どうした」は必須入力項目です。")
         else:
-            if save_to_csv(combined_facts):
+            case_id = save_to_csv(combined_facts)
+            if case_id:
                 st.success("✅ 安全・ヒヤリログを記録しました。")
+                st.session_state["safety_last_case_id"] = case_id
+            
+            # 類似の過去事例（今回保存した事例は除く）
+            similar_cases = get_similar_cases(LOG_STORE.base_path).query(combined_facts, SIMILAR_TOP_K, exclude_case_id=case_id)
+            if similar_cases:
+                with st.expander(f"🔁 類似の過去事例（{len(similar_cases)}件）", expanded=True):
+                    for c in similar_cases:
+                        st.markdown(f"**{c['timestamp']}　ID: {c['case_id']}　類似度 {c['similarity']:.2f}**")
+                        st.text(c["raw_facts"].strip())
             
-            generated_text = generate_prompt_template(combined_facts)
+            generated_text = generate_prompt_template(
+                combined_facts, similar_cases if include_similar else None
+            )
             
             st.markdown("---")
             st.subheader("🤖 AIへの指令書（安全・ヒヤリ分析版）")
@@ -297,7 +338,34 @@ def main():
             3. **精神論の排除:** 「気をつける」等の対策を禁止し、物理対策を提案させます。
             """)
 
+    # AIの回答を貼り戻し、根本原因・対策を集計できる形で保存する
+    st.markdown("---")
+    st.subheader("📥 AIの回答を保存する（根本原因・対策の集計用）")
+    st.info("💡 AIの回答を**そのまま全文**貼り付けてください。根本原因のID・対策の「対象ID」「区分」を読み取って保存します。")
+    analysis_case_id = st.text_input("事例ID", value=st.session_state.get("safety_last_case_id", ""))
+    analysis_text = st.text_area("AIの回答", height=300, label_visibility="collapsed")
+    if st.button("分析結果を保存する"):
+        if not analysis_case_id.strip():
+            st.warning("⚠️ 事例IDを入力してください。")
+        else:
+            try:
+                analysis, error = save_analysis_result(analysis_case_id, analysis_text)
+            except Exception as e:
+                analysis, error = None, f"【保存エラー】分析結果DBへの書き込みに失敗しました: {e}"
+            if error:
+                st.error(error)
+            else:
+                st.success(f"✅ 根本原因{len(analysis['root_causes'])}件・対策{len(analysis['countermeasures'])}件を保存しました。")
+                st.table([
+                    {"ID": c["cause_id"], "種別": c["kind"], "根本原因": c["text"]}
+                    for c in analysis["root_causes"]
+                ])
+                st.table([
+                    {"対策": cm["text"], "対象ID": ", ".join(cm["target_ids"]), "区分": cm["category"]}
+                    for cm in analysis["countermeasures"]
+                ])
+
 if __name__ == "__main__":
     # パスワード認証チェック
-    if check_password():
+    if check_password("労働安全・ヒヤリハット分析ツール"):
         main()
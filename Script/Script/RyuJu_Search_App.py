@@ -0,0 +1,178 @@
+import streamlit as st
+import datetime
+import os
+import sys
+import time
+from pathlib import Path
+
+# 共通パッケージ ryuju（リポジトリ直下）を読み込めるようにする
+ROOT_DIR = str(Path(__file__).resolve().parents[2])
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from ryuju.auth import check_password, logout_button
+from ryuju.storage import migrate_legacy_data_dir
+from fact_log import FactStore
+from fact_search import FactSearch
+import analysis_db
+
+# ==========================================
+# 設定・定数定義
+# ==========================================
+st.set_page_config(
+    page_title="過去事例検索 龍樹(Search)",
+    page_icon="🔎",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
+
+# Safety／Quality アプリと同じ保存先を参照する
+# アプリのフォルダ直下（起動時の作業フォルダによらず、統合版 ryuju_app.py からも同じ場所）
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(APP_DIR, "data")
+LOGS = {
+    "品質不具合":       FactStore(os.path.join(DATA_DIR, "quality_fact_log")),
+    "安全・ヒヤリハット": FactStore(os.path.join(DATA_DIR, "safety_fact_log")),
+}
+# 分析結果DB（analysis_db）でのアプリ名
+ANALYSIS_APPS = {
+    "品質不具合":       "quality",
+    "安全・ヒヤリハット": "safety",
+}
+
+# ==========================================
+# 関数定義
+# ==========================================
+@st.cache_resource
+def get_searchers() -> dict:
+    """
+    ログごとの検索索引（プロセス内で共有）
+    """
+    return {name: FactSearch(store) for name, store in LOGS.items()}
+
+@st.cache_resource(show_spinner=False)
+def init_analysis_db():
+    """
+    分析結果DBのテーブルを作成する（プロセスごとに1回）
+    """
+    analysis_db.initialize_db()
+
+def search_logs(targets: list[str], query: str, limit: int, start: str, end: str) -> list[dict]:
+    """
+    選択したログを検索し、スコアの高い順にまとめて返す
+    検索の前に、前回以降に追記された分だけを索引に加える
+    """
+    searchers = get_searchers()
+    results = []
+    for name in targets:
+        searcher = searchers[name]
+        if not searcher.store.exists():
+            continue
+        searcher.update()
+        for hit in searcher.search(query, limit, start, end):
+            results.append({"log": name, **hit})
+    results.sort(key=lambda r: r["score"], reverse=True)
+    return results[:limit]
+
+def show_search(targets, limit, date_from, date_to):
+    """
+    検索語で過去事例を検索し、スコアの高い順に表示する
+    """
+    query = st.text_input("検索語", placeholder="例：コンベア 指 挟まれ")
+
+    if not query.strip():
+        st.caption("検索語を入力してください。")
+        return
+    if not targets:
+        st.warning("⚠️ 検索対象を選択してください。")
+        return
+
+    started = time.perf_counter()
+    results = search_logs(
+        targets, query, limit,
+        str(date_from), str(date_to + datetime.timedelta(days=1))
+    )
+    elapsed = (time.perf_counter() - started) * 1000
+
+    st.caption(f"{len(results)}件（{elapsed:.0f} ms）")
+    if not results:
+        st.info("該当する事例はありません。")
+        return
+
+    for r in results:
+        with st.expander(
+            f"【{r['log']}】{r['timestamp']}　ID: {r['case_id']}　"
+            f"一致率 {r['matched'] * 100:.0f}%　スコア {r['score']:.2f}"
+        ):
+            st.caption(f"記録者: 社員番号 {r['recorder_id']}")
+            st.text(r["raw_facts"])
+
+def show_category_summary(targets, date_from, date_to):
+    """
+    保存済みのAI分析結果から、対策の区分別件数を月ごとに表示する
+    """
+    st.caption("Safety／Quality アプリで保存したAIの回答（なぜなぜ分析）を集計します。")
+    if not targets:
+        st.warning("⚠️ 検索対象を選択してください。")
+        return
+    try:
+        init_analysis_db()
+    except Exception as e:
+        st.error(f"【システムエラー】分析結果DBの初期化に失敗しました: {e}")
+        return
+
+    for name in targets:
+        rows = analysis_db.category_by_month(
+            ANALYSIS_APPS[name], date_from.strftime("%Y-%m"), date_to.strftime("%Y-%m")
+        )
+        st.markdown(f"#### {name}")
+        if not rows:
+            st.info("保存された分析結果はありません。")
+            continue
+        # 月 × 区分 の件数表に組み替える
+        categories = sorted({r["category"] for r in rows})
+        table = {}
+        for r in rows:
+            table.setdefault(r["month"], {"月": r["month"], **{c: 0 for c in categories}})[r["category"]] = r["count"]
+        st.table(list(table.values()))
+
+# ==========================================
+# メイン処理 (UI構築)
+# ==========================================
+@st.cache_resource(show_spinner=False)
+def prepare_data_dir():
+    """
+    作業フォルダ基準だった旧保存先にログ・DBが残っていれば移す（プロセスごとに1回）
+    """
+    migrate_legacy_data_dir(DATA_DIR, ["quality_fact_log", "safety_fact_log", "analysis.db"])
+
+def main():
+    try:
+        prepare_data_dir()
+    except Exception as e:
+        st.error(f"【システムエラー】旧保存先からの移行に失敗しました: {e}")
+
+    with st.sidebar:
+        st.title("🔎 過去事例検索")
+        logout_button()
+
+        st.write("---")
+        targets = st.multiselect("検索対象", list(LOGS.keys()), default=list(LOGS.keys()))
+        date_from = st.date_input("開始日", datetime.date.today() - datetime.timedelta(days=365 * 3))
+        date_to = st.date_input("終了日", datetime.date.today())
+        limit = st.number_input("表示件数", min_value=5, max_value=100, value=20, step=5)
+
+        st.write("---")
+        st.header("💡 検索のヒント")
+        st.info("設備名・部品名・現象（例：挟まれ、異品、バリ）など、事実の記述に含まれる言葉で検索してください。表記の揺れ（全角・半角）は吸収されます。")
+
+    st.markdown("## 🔎 品質不具合・ヒヤリハット 過去事例検索")
+    tab_search, tab_summary = st.tabs(["事例検索", "対策の区分別集計"])
+    with tab_search:
+        show_search(targets, int(limit), date_from, date_to)
+    with tab_summary:
+        show_category_summary(targets, date_from, date_to)
+
+if __name__ == "__main__":
+    if check_password("過去事例検索"):
+        main()
@@ -0,0 +1,179 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+from ryuju.db import connect
+
+# Safety／Quality 共通の分析結果DB
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "analysis.db")
+
+@contextmanager
+def get_connection():
+    """
+    分析結果DBへの接続（プロセス内で共有するプールから借り、終了時にコミットして返す）
+    """
+    with connect(DB_PATH) as conn:
+        conn.execute("PRAGMA foreign_keys = ON")
+        yield conn
+
+def initialize_db():
+    with get_connection() as conn:
+        # 1事例につき1件（貼り直した場合は置き換える）
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS analyses (
+                id          INTEGER PRIMARY KEY,
+                app         TEXT    NOT NULL,
+                case_id     TEXT    NOT NULL,
+                month       TEXT    NOT NULL,
+                created_at  TEXT    NOT NULL,
+                created_by  TEXT,
+                raw_text    TEXT    NOT NULL,
+                UNIQUE (app, case_id)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS why_steps (
+                analysis_id INTEGER NOT NULL REFERENCES analyses (id) ON DELETE CASCADE,
+                chain_no    INTEGER NOT NULL,
+                level       INTEGER NOT NULL,
+                event       TEXT,
+                why         TEXT,
+                answer      TEXT
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS root_causes (
+                analysis_id INTEGER NOT NULL REFERENCES analyses (id) ON DELETE CASCADE,
+                cause_id    TEXT    NOT NULL,
+                kind        TEXT    NOT NULL,
+                chain_no    INTEGER,
+                text        TEXT    NOT NULL,
+                PRIMARY KEY (analysis_id, cause_id)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS countermeasures (
+                id          INTEGER PRIMARY KEY,
+                analysis_id INTEGER NOT NULL REFERENCES analyses (id) ON DELETE CASCADE,
+                no          INTEGER NOT NULL,
+                kind        TEXT,
+                category    TEXT    NOT NULL,
+                text        TEXT    NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS countermeasure_targets (
+                countermeasure_id INTEGER NOT NULL REFERENCES countermeasures (id) ON DELETE CASCADE,
+                cause_id          TEXT    NOT NULL,
+                PRIMARY KEY (countermeasure_id, cause_id)
+            )
+        """)
+        # 月別の集計（アプリ・月で絞り、区分で数える）用
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_app_month ON analyses (app, month, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_case ON analyses (case_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_why_steps_analysis ON why_steps (analysis_id, chain_no, level)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cm_analysis_category ON countermeasures (analysis_id, category, kind)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cm_category ON countermeasures (category)")
+
+def save_analysis(app: str, case_id: str, case_timestamp: str, raw_text: str,
+                  analysis: dict, emp_id: str = None) -> int:
+    """
+    parse_analysis の結果を保存する。同じ事例の分析が既にあれば置き換える
+    case_timestamp: 事実ログの記録日時（集計の「月」に使う）
+    戻り値: analyses.id
+    """
+    with get_connection() as conn:
+        conn.execute("DELETE FROM analyses WHERE app = ? AND case_id = ?", (app, case_id))
+        analysis_id = conn.execute("""
+            INSERT INTO analyses (app, case_id, month, created_at, created_by, raw_text)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (
+            app, case_id, case_timestamp[:7],
+            datetime.now().isoformat(timespec="seconds"), emp_id, raw_text
+        )).lastrowid
+
+        conn.executemany("""
+            INSERT INTO why_steps (analysis_id, chain_no, level, event, why, answer)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [
+            (analysis_id, chain["chain_no"], step["level"], chain["event"], step["why"], step["answer"])
+            for chain in analysis["chains"]
+            for step in chain["steps"]
+        ])
+        conn.executemany("""
+            INSERT INTO root_causes (analysis_id, cause_id, kind, chain_no, text)
+            VALUES (?, ?, ?, ?, ?)
+        """, [
+            (analysis_id, c["cause_id"], c["kind"], c["chain_no"], c["text"])
+            for c in analysis["root_causes"]
+        ])
+        for cm in analysis["countermeasures"]:
+            cm_id = conn.execute("""
+                INSERT INTO countermeasures (analysis_id, no, kind, category, text)
+                VALUES (?, ?, ?, ?, ?)
+            """, (analysis_id, cm["no"], cm["kind"], cm["category"], cm["text"])).lastrowid
+            conn.executemany(
+                "INSERT OR IGNORE INTO countermeasure_targets (countermeasure_id, cause_id) VALUES (?, ?)",
+                [(cm_id, t) for t in cm["target_ids"]]
+            )
+    return analysis_id
+
+def fetch_analysis(app: str, case_id: str) -> dict | None:
+    """
+    事例の分析結果を返す（未登録の場合は None）
+    戻り値: {"analysis", "root_causes", "countermeasures"}
+    """
+    with get_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        analysis = conn.execute(
+            "SELECT * FROM analyses WHERE app = ? AND case_id = ?", (app, case_id)
+        ).fetchone()
+        if analysis is None:
+            return None
+        causes = conn.execute(
+            "SELECT cause_id, kind, text FROM root_causes WHERE analysis_id = ? ORDER BY chain_no, cause_id",
+            (analysis["id"],)
+        ).fetchall()
+        measures = conn.execute("""
+            SELECT c.no, c.kind, c.category, c.text, GROUP_CONCAT(t.cause_id, ', ') AS target_ids
+            FROM countermeasures c
+            LEFT JOIN countermeasure_targets t ON t.countermeasure_id = c.id
+            WHERE c.analysis_id = ?
+            GROUP BY c.id
+            ORDER BY c.no
+        """, (analysis["id"],)).fetchall()
+    return {
+        "analysis":        dict(analysis),
+        "root_causes":     [dict(r) for r in causes],
+        "countermeasures": [dict(r) for r in measures],
+    }
+
+def category_by_month(app: str = None, start_month: str = None, end_month: str = None) -> list[dict]:
+    """
+    対策の区分別件数を月ごとに集計する
+    start_month/end_month: "YYYY-MM"（両端を含む）
+    戻り値: [{"month", "category", "count"}, ...]
+    """
+    conds, params = [], []
+    if app:
+        conds.append("a.app = ?")
+        params.append(app)
+    if start_month:
+        conds.append("a.month >= ?")
+        params.append(start_month)
+    if end_month:
+        conds.append("a.month <= ?")
+        params.append(end_month)
+    where = " WHERE " + " AND ".join(conds) if conds else ""
+    with get_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(f"""
+            SELECT a.month, c.category, COUNT(*) AS count
+            FROM analyses a
+            JOIN countermeasures c ON c.analysis_id = a.id
+            {where}
+            GROUP BY a.month, c.category
+            ORDER BY a.month, c.category
+        """, params).fetchall()
+    return [dict(r) for r in rows]
@@ -0,0 +1,185 @@
+import re
+import unicodedata
+
+# アプリごとの対策の「区分」の選択肢（プロンプトの出力形式と同じ）
+CATEGORIES = {
+    "safety":  ["設備対策", "管理対策", "暫定処置"],
+    "quality": ["恒久対策", "暫定対策"],
+}
+
+# 根本原因IDの接頭辞 -> 要因の種別（品質：発生／流出、安全：区別なし）
+CAUSE_KINDS = {"発": "発生", "流": "流出", "R": "根本原因"}
+
+# 行の判定に使う正規表現（太字・箇条書き記号・引用記号は事前に除く）
+RE_EVENT   = re.compile(r"^\[?事象\]?\s*[:：]\s*(.+)$")
+RE_WHY     = re.compile(r"^Why\s*(\d+)\s*[:：]\s*(.+)$", re.IGNORECASE)
+RE_ANS     = re.compile(r"^Ans\s*(\d+)\s*(?:[（(][^）)]*[）)])?\s*[:：]\s*(.+)$", re.IGNORECASE)
+RE_CAUSE_ID = re.compile(r"[（(]\s*ID\s*[:：]\s*([^）)]+?)\s*[）)]", re.IGNORECASE)
+RE_MEASURE = re.compile(r"^(?:対策案\s*(\d+)|(\d+)\s*[.．]\s*対策内容)\s*[:：]\s*(.+)$")
+RE_TARGET  = re.compile(r"^対象ID\s*[:：]\s*(.+)$")
+RE_CATEGORY = re.compile(r"^区分\s*[:：]\s*(.+)$")
+RE_SECTION = re.compile(r"【\s*[AB][.．]?\s*(発生|流出)対策\s*】")
+RE_ID_TOKEN = re.compile(r"(?:R|発|流)\s*[-－ー‐]\s*\d+")
+
+def normalize_id(cause_id: str) -> str:
+    """
+    IDの表記揺れ（全角・ハイフンの種類・空白）をそろえる。例：「発－１」→「発-1」
+    """
+    text = unicodedata.normalize("NFKC", cause_id)
+    text = re.sub(r"[‐－ー−]", "-", text)
+    return re.sub(r"\s+", "", text).upper()
+
+def clean_line(line: str) -> str:
+    """
+    Markdownの装飾（太字・箇条書き・引用・見出し）を除く
+    """
+    line = line.strip()
+    line = re.sub(r"^(?:>\s*)+", "", line)
+    line = re.sub(r"^#{1,6}\s*", "", line)
+    line = re.sub(r"^[-*・]\s+", "", line)
+    line = line.replace("**", "").replace("__", "")
+    return line.strip()
+
+def cause_kind(cause_id: str) -> str:
+    return CAUSE_KINDS.get(cause_id[:1], "根本原因")
+
+def parse_analysis(raw_text: str, app: str) -> tuple[dict | None, str | None]:
+    """
+    なぜなぜ分析（Safety／Quality のプロンプトに対するLLMの回答）を読み取って検証する
+    app: "safety" または "quality"
+    戻り値: (分析結果, エラーメッセージ)
+    成功時: ({"chains": [...], "root_causes": [...], "countermeasures": [...]}, None)
+    失敗時: (None, エラーメッセージ)
+    chains:          [{"chain_no", "event", "steps": [{"level", "why", "answer"}]}, ...]
+    root_causes:     [{"cause_id", "kind", "text", "chain_no"}, ...]
+    countermeasures: [{"no", "kind", "category", "text", "target_ids": [...]}, ...]
+    """
+    text = raw_text.strip()
+    if not text:
+        return None, "回答が空です。AIの回答をそのまま貼り付けてください。"
+
+    chains, root_causes, countermeasures = [], [], []
+    chain, measure = None, None
+    section_kind = None
+    last_answer = None
+
+    for raw_line in text.splitlines():
+        section = RE_SECTION.search(raw_line)
+        if section:
+            section_kind = section.group(1)
+            continue
+
+        line = clean_line(raw_line)
+        if not line:
+            continue
+
+        m = RE_EVENT.match(line)
+        if m:
+            chain = {"chain_no": len(chains) + 1, "event": m.group(1).strip(), "steps": []}
+            chains.append(chain)
+            measure = None
+            continue
+
+        m = RE_WHY.match(line)
+        if m and chain is not None:
+            chain["steps"].append({"level": int(m.group(1)), "why": m.group(2).strip(), "answer": ""})
+            continue
+
+        m = RE_ANS.match(line)
+        if m and chain is not None:
+            answer = m.group(2).strip()
+            id_match = RE_CAUSE_ID.search(answer)
+            answer = RE_CAUSE_ID.sub("", answer).strip()
+            level = int(m.group(1))
+            step = next((s for s in reversed(chain["steps"]) if s["level"] == level), None)
+            if step is None:
+                step = {"level": level, "why": "", "answer": ""}
+                chain["steps"].append(step)
+            step["answer"] = answer
+            last_answer = answer
+            if id_match:
+                for cause_id in RE_ID_TOKEN.findall(id_match.group(1)):
+                    cause_id = normalize_id(cause_id)
+                    root_causes.append({
+                        "cause_id": cause_id,
+                        "kind":     cause_kind(cause_id),
+                        "text":     answer,
+                        "chain_no": chain["chain_no"],
+                    })
+            continue
+
+        m = RE_MEASURE.match(line)
+        if m:
+            measure = {
+                "no":         len(countermeasures) + 1,
+                "kind":       section_kind,
+                "category":   None,
+                "text":       m.group(3).strip(),
+                "target_ids": [],
+            }
+            countermeasures.append(measure)
+            continue
+
+        m = RE_TARGET.match(line)
+        if m and measure is not None:
+            measure["target_ids"] = [normalize_id(t) for t in RE_ID_TOKEN.findall(m.group(1))]
+            continue
+
+        m = RE_CATEGORY.match(line)
+        if m and measure is not None:
+            measure["category"] = m.group(1).strip()
+            continue
+
+        # 「(ID: R-1)」が回答の次の行に書かれた場合
+        id_match = RE_CAUSE_ID.search(line)
+        if id_match and chain is not None and last_answer:
+            for cause_id in RE_ID_TOKEN.findall(id_match.group(1)):
+                cause_id = normalize_id(cause_id)
+                root_causes.append({
+                    "cause_id": cause_id,
+                    "kind":     cause_kind(cause_id),
+                    "text":     last_answer,
+                    "chain_no": chain["chain_no"],
+                })
+
+    # 検証
+    if not chains:
+        return None, "なぜなぜ分析（[事象] → Why → Ans）が見つかりません。AIの回答をそのまま貼り付けてください。"
+    if not root_causes:
+        return None, "根本原因のID（例：(ID: R-1)）が見つかりません。AIの回答を再確認してください。"
+    if not countermeasures:
+        return None, "対策案が見つかりません。AIの回答を再確認してください。"
+
+    known_ids = {c["cause_id"] for c in root_causes}
+    allowed = CATEGORIES[app]
+    errors = []
+    for cm in countermeasures:
+        if not cm["target_ids"]:
+            errors.append(f"対策{cm['no']}：「対象ID」がありません。")
+        unknown = [t for t in cm["target_ids"] if t not in known_ids]
+        if unknown:
+            errors.append(f"対策{cm['no']}：対象ID {', '.join(unknown)} が分析中にありません。")
+        category = next((c for c in allowed if cm["category"] and c in cm["category"]), None)
+        # 「設備対策 / 管理対策」のように選択肢が残ったままのものは区分未確定とみなす
+        if category is None or sum(c in (cm["category"] or "") for c in allowed) > 1:
+            errors.append(f"対策{cm['no']}：「区分」は {' / '.join(allowed)} のいずれか1つにしてください。")
+        else:
+            cm["category"] = category
+        if cm["kind"] is None and cm["target_ids"]:
+            cm["kind"] = cause_kind(cm["target_ids"][0])
+
+    if errors:
+        error_msg = "以下の項目を確認してください。\n"
+        error_msg += "\n".join(errors)
+        return None, error_msg
+
+    # 同じIDが複数の箇所に書かれた場合は最初のものを使う
+    unique_causes = {}
+    for c in root_causes:
+        unique_causes.setdefault(c["cause_id"], c)
+
+    return {
+        "chains":          chains,
+        "root_causes":     list(unique_causes.values()),
+        "countermeasures": countermeasures,
+    }, None
@@ -0,0 +1,673 @@
+import bisect
+import csv
+import gzip
+import io
+import json
+import mmap
+import os
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+
+from ryuju.db import connect
+
+# 事実ログの列順（CSV出力もこの順）
+# legacy_id: 旧形式（uuid4 の先頭8桁）の case_id。ULID へ移行した行のみ値を持つ
+LOG_COLUMNS = ["timestamp", "case_id", "recorder_id", "raw_facts", "legacy_id"]
+
+# Excelでの文字化け防止のため、ファイル先頭にBOMを付ける（utf-8-sig 相当）
+BOM = "\ufeff"
+
+@contextmanager
+def file_lock(path: str):
+    """
+    ログファイルと同じ場所に置いたロック用ファイルで排他ロックを取る（アドバイザリロック）
+    ログ本体を他のツールで開いていてもロックが競合しないよう、本体とは別ファイルにする
+    """
+    lock_path = path + ".lock"
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        if os.name == "nt":
+            import msvcrt
+            # LK_LOCK は取得できるまで再試行する（約10秒で例外）
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+# ULID（時刻48bit＋乱数80bit、Crockford Base32 の26文字）
+ULID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+ULID_PATTERN  = re.compile(r"^[0-9A-HJKMNP-TV-Z]{26}$")
+
+_ulid_lock = threading.Lock()
+_ulid_last = (0, 0)
+
+def new_case_id(ms: int = None) -> str:
+    """
+    作成時刻順に文字列として並ぶ一意なID（ULID）を返す
+    同じミリ秒内で複数発行した場合は乱数部を1ずつ増やし、発行順に並ぶようにする
+    ms: 時刻（UNIXエポックからのミリ秒）。省略時は現在時刻
+    """
+    global _ulid_last
+    if ms is None:
+        ms = time.time_ns() // 1_000_000
+    with _ulid_lock:
+        last_ms, last_rand = _ulid_last
+        if ms == last_ms:
+            rand = (last_rand + 1) & ((1 << 80) - 1)
+        else:
+            rand = secrets.randbits(80)
+        _ulid_last = (ms, rand)
+    value = (ms << 80) | rand
+    return "".join(ULID_ALPHABET[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+def is_ulid(case_id: str) -> bool:
+    return bool(ULID_PATTERN.match(case_id or ""))
+
+def format_rows(rows: list[dict], header: bool = False) -> bytes:
+    """
+    行をCSVのバイト列にする。複数行の raw_facts は引用符で囲まれる
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if header:
+        writer.writerow(LOG_COLUMNS)
+    for row in rows:
+        writer.writerow([row.get(col, "") for col in LOG_COLUMNS])
+    text = buf.getvalue()
+    return ((BOM if header else "") + text).encode("utf-8")
+
+def _timestamp_ms(timestamp: str) -> int:
+    """
+    ログの timestamp（"%Y-%m-%d %H:%M:%S" など）をミリ秒に変換する。読めない場合は現在時刻
+    """
+    try:
+        return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+    except ValueError:
+        return time.time_ns() // 1_000_000
+
+@lru_cache(maxsize=4)
+def _decompressed(path: str, mtime: float) -> bytes:
+    """
+    圧縮済みセグメントの中身（直近に読んだ数セグメント分をプロセス内で保持する）
+    mtime はキャッシュのキー。同名で作り直されたファイルを古い内容で読まないため
+    """
+    with gzip.open(path, "rb") as f:
+        return f.read()
+
+def _encode(row: dict) -> bytes:
+    return (json.dumps({col: row.get(col, "") for col in LOG_COLUMNS}, ensure_ascii=False) + "\n").encode("utf-8")
+
+class FactStore:
+    """
+    事実ログの保存先
+    ・本体は追記専用のJSONL（1行1件）を月ごとのセグメントに分けて持つ
+      書き込み中の月（アクティブ）は <名前>.<年月>.<連番>.jsonl、閉じた月は gzip 圧縮した .jsonl.gz
+    ・<名前>.manifest.json に各セグメントの期間（最初と最後の timestamp）と、
+      全セグメントを連結したときの開始位置（base）を記録する
+    ・索引は同名の .index.db（SQLite）に、各行の位置（連結後のバイトオフセット・長さ）と
+      timestamp・case_id・recorder_id を持つ。検索は索引で行を絞ってから本体を読む
+    ・索引は本体から作り直せるため、書き込み途中で索引だけが欠けても sync_index で追いつく
+    """
+
+    def __init__(self, base_path: str):
+        self.base_path     = base_path
+        self.name          = os.path.basename(base_path)
+        self.dir           = os.path.dirname(base_path)
+        self.manifest_path = base_path + ".manifest.json"
+        self.index_path    = base_path + ".index.db"
+        # 月別セグメント導入前の単一ファイル（migrate_layout で分割する）
+        self.legacy_log_path = base_path + ".jsonl"
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self):
+        """
+        索引DBへの接続（プロセス内で共有するプールから借り、終了時にコミットして返す）
+        """
+        with connect(self.index_path) as conn:
+            if not self._initialized:
+                self._create_tables(conn)
+            yield conn
+
+    def _create_tables(self, conn):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS facts (
+                id          INTEGER PRIMARY KEY,
+                timestamp   TEXT    NOT NULL,
+                case_id     TEXT    NOT NULL,
+                recorder_id TEXT,
+                offset      INTEGER NOT NULL,
+                length      INTEGER NOT NULL,
+                legacy_id   TEXT
+            )
+        """)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(facts)")]
+        if "legacy_id" not in columns:
+            conn.execute("ALTER TABLE facts ADD COLUMN legacy_id TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_facts_timestamp ON facts (timestamp)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_facts_case_id ON facts (case_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_facts_legacy_id ON facts (legacy_id) WHERE legacy_id IS NOT NULL")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_facts_recorder ON facts (recorder_id, timestamp)")
+        # 取り込み済みCSVなどの管理情報
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key     TEXT PRIMARY KEY,
+                value   TEXT
+            )
+        """)
+        self._initialized = True
+
+    @staticmethod
+    def _index_entry(row: dict, offset: int, length: int) -> tuple:
+        return (
+            row["timestamp"], row["case_id"], row.get("recorder_id"),
+            offset, length, row.get("legacy_id") or None
+        )
+
+    def _insert_entries(self, conn, entries: list[tuple]):
+        conn.executemany("""
+            INSERT INTO facts (timestamp, case_id, recorder_id, offset, length, legacy_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, entries)
+
+    def epoch(self) -> int:
+        """
+        本体の世代番号。本体を書き換える移行（migrate_layout・migrate_case_ids）のたびに増える
+        オフセットで差分を追う側は、値が変わったら最初から読み直す
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()
+        return int(row[0]) if row else 0
+
+    # ----------------------------------------
+    # セグメント・マニフェスト
+    # ----------------------------------------
+    def _path(self, file_name: str) -> str:
+        return os.path.join(self.dir, file_name)
+
+    def load_manifest(self) -> dict:
+        """
+        戻り値: {"segments": [{"file", "month", "start", "end", "base", "size", "count"}, ...],
+                 "active": {"file", "month", "base"} または None}
+        """
+        if not os.path.exists(self.manifest_path):
+            return {"segments": [], "active": None}
+        with open(self.manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_manifest(self, manifest: dict):
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_path) or os.path.exists(self.legacy_log_path)
+
+    def _layout(self, manifest: dict) -> list[tuple[int, int, str, bool]]:
+        """
+        連結後の位置の順に並べたセグメント一覧 [(base, size, パス, 圧縮済みか), ...]
+        """
+        layout = [
+            (seg["base"], seg["size"], self._path(seg["file"]), True)
+            for seg in manifest["segments"]
+        ]
+        active = manifest["active"]
+        if active:
+            path = self._path(active["file"])
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            layout.append((active["base"], size, path, False))
+        return layout
+
+    @staticmethod
+    def _end_of(manifest: dict) -> int:
+        if manifest["active"]:
+            return manifest["active"]["base"]
+        if manifest["segments"]:
+            last = manifest["segments"][-1]
+            return last["base"] + last["size"]
+        return 0
+
+    def _rotate_locked(self, manifest: dict, month: str, save: bool = True) -> str | None:
+        """
+        アクティブセグメントを圧縮して閉じ、month の新しいアクティブセグメントを用意する
+        圧縮ファイル → マニフェスト → 元ファイル削除の順に行うため、途中で止まっても
+        マニフェストが指すファイルは常に揃っている
+        save=False の場合はマニフェストを保存せず、削除すべき元ファイルのパスを返す
+        """
+        active = manifest["active"]
+        closed_path = None
+        base = self._end_of(manifest)
+        if active:
+            path = self._path(active["file"])
+            data = b""
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    data = f.read()
+                # 改行で終わっていない末尾は書き込み途中で止まった行のため、閉じるセグメントに含めない
+                data = data[:data.rfind(b"\n") + 1]
+                closed_path = path
+            if data:
+                timestamps = [json.loads(line)["timestamp"] for line in data.splitlines()]
+                gz_name = active["file"] + ".gz"
+                tmp_path = self._path(f"{gz_name}.{os.getpid()}.tmp")
+                with gzip.open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, self._path(gz_name))
+                manifest["segments"].append({
+                    "file":  gz_name,
+                    "month": active["month"],
+                    "start": min(timestamps),
+                    "end":   max(timestamps),
+                    "base":  active["base"],
+                    "size":  len(data),
+                    "count": len(timestamps),
+                })
+            base = active["base"] + len(data)
+
+        seq = len(manifest["segments"])
+        generation = manifest.get("generation", 0)
+        manifest["active"] = {
+            "file":  f"{self.name}.{month}.g{generation}.{seq:04d}.jsonl",
+            "month": month,
+            "base":  base,
+        }
+        if not save:
+            return closed_path
+        self._save_manifest(manifest)
+        if closed_path:
+            os.remove(closed_path)
+        return None
+
+    def _iter_lines(self, offset: int = 0):
+        """
+        連結後の位置 offset 以降の行を (位置, 行のバイト列) で順に返す
+        改行で終わっていない行は書き込み途中のため返さない
+        """
+        for base, size, path, compressed in self._layout(self.load_manifest()):
+            if base + size <= offset or size == 0:
+                continue
+            if compressed:
+                data = _decompressed(path, os.path.getmtime(path))
+            else:
+                with open(path, "rb") as f:
+                    data = f.read()
+            pos = max(offset - base, 0)
+            while pos < len(data):
+                nl = data.find(b"\n", pos)
+                if nl < 0:
+                    return
+                yield base + pos, data[pos:nl + 1]
+                pos = nl + 1
+
+    # ----------------------------------------
+    # 書き込み
+    # ----------------------------------------
+    def append(self, row: dict):
+        """
+        1件を本体に追記し、索引に登録する
+        ロック中に追記位置を決め、1回の write で書くため、同時送信でも行が混ざらない
+        """
+        self.extend([row])
+
+    def extend(self, rows: list[dict]):
+        with file_lock(self.base_path):
+            # 前回の書き込みで索引が欠けていれば先に追いつかせる
+            self._sync_index_locked()
+            entries, _ = self._write_locked(rows)
+            with self._connect() as conn:
+                self._insert_entries(conn, entries)
+
+    def _write_locked(self, rows: list[dict], manifest: dict = None) -> tuple[list[tuple], list[str]]:
+        """
+        行を記録月ごとのセグメントに追記する。月が変わるとアクティブセグメントを閉じる
+        manifest を渡した場合（作り直し用）はマニフェストを保存せず、呼び出し側が保存する
+        戻り値: (索引に登録する項目, マニフェスト保存後に削除するファイル)
+        """
+        save = manifest is None
+        if save:
+            manifest = self.load_manifest()
+        # 入力が時刻順でなくても（CSV取り込みなど）1か月分を1回で書けるよう、月ごとにまとめる
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(row["timestamp"][:7], []).append(row)
+        entries, leftovers = [], []
+        for month, group in sorted(by_month.items()):
+            if manifest["active"] is None or manifest["active"]["month"] != month:
+                closed = self._rotate_locked(manifest, month, save)
+                if closed:
+                    leftovers.append(closed)
+            active = manifest["active"]
+            lines = [_encode(row) for row in group]
+            fd = os.open(
+                self._path(active["file"]),
+                os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o666
+            )
+            try:
+                offset = active["base"] + os.fstat(fd).st_size
+                os.write(fd, b"".join(lines))
+            finally:
+                os.close(fd)
+            for row, line in zip(group, lines):
+                entries.append(self._index_entry(row, offset, len(line)))
+                offset += len(line)
+        return entries, leftovers
+
+    def _rewrite_locked(self, rows: list[dict]):
+        """
+        本体を rows で作り直し、索引を張り直して世代番号を進める（移行用）
+        新しいセグメントは別の世代名で書き、マニフェストを置き換えてから古いファイルを消す
+        """
+        manifest = self.load_manifest()
+        old_files = [self._path(seg["file"]) for seg in manifest["segments"]]
+        if manifest["active"]:
+            old_files.append(self._path(manifest["active"]["file"]))
+
+        generation = manifest.get("generation", 0) + 1
+        # 前回の作り直しが途中で止まっていた場合の書きかけを消す
+        prefix, suffix = f"{self.name}.", f".g{generation}."
+        for file_name in os.listdir(self.dir or "."):
+            if file_name.startswith(prefix) and suffix in file_name:
+                os.remove(self._path(file_name))
+
+        fresh = {"generation": generation, "segments": [], "active": None}
+        entries, leftovers = self._write_locked(rows, fresh)
+        self._save_manifest(fresh)
+        for path in old_files + leftovers:
+            if os.path.exists(path):
+                os.remove(path)
+
+        with self._connect() as conn:
+            conn.execute("DELETE FROM facts")
+            self._insert_entries(conn, entries)
+            conn.execute("""
+                INSERT INTO meta (key, value) VALUES ('epoch', '1')
+                ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+            """)
+
+    def sync_index(self) -> int:
+        """
+        索引に載っていない本体の末尾を読み、索引に登録する
+        戻り値: 登録した件数
+        """
+        with file_lock(self.base_path):
+            return self._sync_index_locked()
+
+    def _sync_index_locked(self) -> int:
+        with self._connect() as conn:
+            # 本体は追記のみのため、最後に登録した行の終端が索引済みの範囲
+            last = conn.execute("SELECT offset + length FROM facts ORDER BY id DESC LIMIT 1").fetchone()
+            end = last[0] if last else 0
+            layout = self._layout(self.load_manifest())
+            if not layout or end >= layout[-1][0] + layout[-1][1]:
+                return 0
+            entries = [
+                self._index_entry(json.loads(line), offset, len(line))
+                for offset, line in self._iter_lines(end)
+            ]
+            self._insert_entries(conn, entries)
+        return len(entries)
+
+    def import_csv(self, csv_path: str) -> int:
+        """
+        旧形式のCSVログを取り込む（CSVごとに1回のみ。CSV自体は変更しない）
+        戻り値: 取り込んだ件数（取り込み済み・CSVなしの場合は0）
+        """
+        if not os.path.exists(csv_path):
+            return 0
+        key = "imported:" + os.path.basename(csv_path)
+        with self._connect() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+                return 0
+
+        with open(csv_path, encoding="utf-8-sig", newline="") as f:
+            rows = [
+                {col: row.get(col) or "" for col in LOG_COLUMNS}
+                for row in csv.DictReader(f)
+            ]
+
+        # 複数セッションが同時に起動しても二重に取り込まないよう、判定から書き込みまでロックする
+        with file_lock(self.base_path):
+            with self._connect() as conn:
+                if conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+                    return 0
+                existing = set(conn.execute("SELECT case_id, timestamp FROM facts").fetchall())
+            # 中断後の再実行に備え、同じ case_id・時刻で登録済みの行は除く
+            rows = [r for r in rows if (r["case_id"], r["timestamp"]) not in existing]
+            self._sync_index_locked()
+            entries, _ = self._write_locked(rows)
+            with self._connect() as conn:
+                self._insert_entries(conn, entries)
+                conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (key, str(len(rows))))
+        return len(rows)
+
+    def migrate_layout(self) -> int:
+        """
+        月別セグメント導入前の単一ファイル（<名前>.jsonl）を月ごとのセグメントに分ける
+        戻り値: 移した件数
+        """
+        if not os.path.exists(self.legacy_log_path):
+            return 0
+        with file_lock(self.base_path):
+            if not os.path.exists(self.legacy_log_path):
+                return 0
+            with open(self.legacy_log_path, "rb") as f:
+                rows = [json.loads(line) for line in f if line.endswith(b"\n")]
+            existing = [json.loads(line) for _, line in self._iter_lines()]
+            self._rewrite_locked(existing + rows)
+            os.remove(self.legacy_log_path)
+        return len(rows)
+
+    def migrate_case_ids(self) -> int:
+        """
+        旧形式の case_id を持つ行に、記録時刻から作ったULIDを振り直す（本体を1回だけ書き換える）
+        旧IDは legacy_id として残すため、get() では旧IDでも引ける
+        戻り値: 振り直した件数
+        """
+        with file_lock(self.base_path):
+            with self._connect() as conn:
+                if conn.execute("SELECT 1 FROM facts WHERE length(case_id) != 26 LIMIT 1").fetchone() is None:
+                    return 0
+
+            rows, count = [], 0
+            for _, line in self._iter_lines():
+                row = json.loads(line)
+                if not is_ulid(row["case_id"]):
+                    row["legacy_id"] = row["case_id"]
+                    row["case_id"] = new_case_id(_timestamp_ms(row["timestamp"]))
+                    count += 1
+                rows.append(row)
+            self._rewrite_locked(rows)
+        return count
+
+    # ----------------------------------------
+    # 読み出し
+    # ----------------------------------------
+    def read_entries(self, entries: list[tuple]) -> list[dict]:
+        """
+        (offset, length) の一覧から本体の行を読み、元の順序で返す
+        アクティブセグメントはメモリマップで、閉じたセグメントは展開した内容から切り出す
+        """
+        if not entries:
+            return []
+        try:
+            return self._read_entries(entries)
+        except FileNotFoundError:
+            # 読んでいる間に月替わりでアクティブセグメントが閉じられた場合は、マニフェストを読み直す
+            return self._read_entries(entries)
+
+    def _read_entries(self, entries: list[tuple]) -> list[dict]:
+        layout = self._layout(self.load_manifest())
+        bases = [base for base, _, _, _ in layout]
+        by_segment = {}
+        for offset, length in set(entries):
+            i = bisect.bisect_right(bases, offset) - 1
+            by_segment.setdefault(i, []).append((offset, length))
+
+        result = {}
+        for i, items in by_segment.items():
+            base, size, path, compressed = layout[i]
+            if compressed:
+                data = _decompressed(path, os.path.getmtime(path))
+                for offset, length in items:
+                    result[offset] = json.loads(data[offset - base:offset - base + length])
+            else:
+                with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    for offset, length in sorted(items):
+                        result[offset] = json.loads(mm[offset - base:offset - base + length])
+        return [result[offset] for offset, _ in entries]
+
+    def read_range(self, start: str = None, end: str = None):
+        """
+        索引を使わずに期間内の行を順に読む（集計・分析用）
+        マニフェストの期間が範囲外の閉じたセグメントは展開しない。アクティブセグメントはメモリマップで読む
+        start/end: timestamp の範囲（end は含まない）
+        読んでいる間にローテーションや作り直しでファイルが消えた場合は、マニフェストを読み直し、
+        既に返した行を飛ばして続きから読む
+        """
+        done = 0
+        for attempt in range(3):
+            try:
+                for i, row in enumerate(self._read_range(start, end)):
+                    if i >= done:
+                        done += 1
+                        yield row
+                return
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+
+    def _read_range(self, start: str, end: str):
+        manifest = self.load_manifest()
+        for seg in manifest["segments"]:
+            if (start and seg["end"] < start) or (end and seg["start"] >= end):
+                continue
+            path = self._path(seg["file"])
+            data = _decompressed(path, os.path.getmtime(path))
+            yield from self._filter_lines(data, start, end)
+
+        active = manifest["active"]
+        if active:
+            path = self._path(active["file"])
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    yield from self._filter_lines(mm, start, end)
+
+    @staticmethod
+    def _filter_lines(data, start: str, end: str):
+        pos = 0
+        while True:
+            nl = data.find(b"\n", pos)
+            if nl < 0:
+                return
+            row = json.loads(data[pos:nl])
+            pos = nl + 1
+            ts = row["timestamp"]
+            if (start and ts < start) or (end and ts >= end):
+                continue
+            yield row
+
+    def read_since(self, offset: int) -> tuple[list[tuple[int, dict]], int]:
+        """
+        連結後の位置 offset 以降に追記された行を読む（索引を使う側の差分更新用）
+        戻り値: ([(facts.id, 行), ...], 読み終えた位置のオフセット)
+        """
+        self.sync_index()
+        with self._connect() as conn:
+            entries = conn.execute(
+                "SELECT id, offset, length FROM facts WHERE offset >= ? ORDER BY offset",
+                (offset,)
+            ).fetchall()
+        if not entries:
+            return [], offset
+        rows = self.read_entries([(o, n) for _, o, n in entries])
+        _, last_offset, last_length = entries[-1]
+        return list(zip([fid for fid, _, _ in entries], rows)), last_offset + last_length
+
+    def locate(self, fact_ids: list[int]) -> list[tuple[int, int]]:
+        """
+        facts.id の一覧に対応する (offset, length) を同じ順序で返す
+        """
+        if not fact_ids:
+            return []
+        with self._connect() as conn:
+            found = {}
+            for i in range(0, len(fact_ids), 500):
+                chunk = fact_ids[i:i + 500]
+                found.update(
+                    (fid, (offset, length)) for fid, offset, length in conn.execute(
+                        f"SELECT id, offset, length FROM facts WHERE id IN ({','.join('?' * len(chunk))})",
+                        chunk
+                    )
+                )
+        return [found[fid] for fid in fact_ids]
+
+    def query(self, start: str = None, end: str = None, recorder_id: str = None,
+              case_id: str = None, limit: int = None, newest_first: bool = True) -> list[dict]:
+        """
+        索引で条件を絞り込み、該当する行を返す
+        start/end: timestamp の範囲（文字列比較。"2024-01-01" のような日付のみでも可、end は含まない）
+        """
+        conds, params = [], []
+        if start:
+            conds.append("timestamp >= ?")
+            params.append(start)
+        if end:
+            conds.append("timestamp < ?")
+            params.append(end)
+        if recorder_id:
+            conds.append("recorder_id = ?")
+            params.append(recorder_id)
+        if case_id:
+            conds.append("case_id = ?")
+            params.append(case_id)
+        where = " WHERE " + " AND ".join(conds) if conds else ""
+        order = "DESC" if newest_first else "ASC"
+        sql = f"SELECT offset, length FROM facts{where} ORDER BY timestamp {order}, id {order}"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._connect() as conn:
+            entries = conn.execute(sql, params).fetchall()
+        return self.read_entries(entries)
+
+    def get(self, case_id: str) -> dict | None:
+        """
+        case_id（ULID、または移行前の旧ID）から1件を引く
+        """
+        with self._connect() as conn:
+            entry = conn.execute(
+                "SELECT offset, length FROM facts WHERE case_id = ? OR legacy_id = ? LIMIT 1",
+                (case_id, case_id)
+            ).fetchone()
+        return self.read_entries([entry])[0] if entry else None
+
+    def count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM facts").fetchone()[0]
+
+    def export_csv(self, start: str = None, end: str = None) -> bytes:
+        """
+        Excel向けのCSV（BOM付きUTF-8・ヘッダーあり、古い順）を返す
+        """
+        rows = sorted(self.read_range(start, end), key=lambda r: r["timestamp"])
+        return format_rows(rows, header=True)
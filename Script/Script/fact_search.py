@@ -0,0 +1,177 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+from contextlib import contextmanager
+
+from ryuju.db import connect
+from fact_log import FactStore
+
+# BM25 のパラメータ
+BM25_K1 = 1.2
+BM25_B  = 0.75
+
+def normalize_text(text: str) -> str:
+    """
+    全角・半角の揺れと大文字小文字をそろえ、空白を除く
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return re.sub(r"\s+", "", text)
+
+def ngrams(text: str, n: int = 2) -> list[str]:
+    """
+    文字n-gramの一覧（重複あり）。n文字に満たない文字列はそのまま1件とする
+    """
+    if len(text) < n:
+        return [text] if text else []
+    return [text[i:i + n] for i in range(len(text) - n + 1)]
+
+class FactSearch:
+    """
+    事実ログ（raw_facts）の文字バイグラム転置索引
+    ・索引はログと同じ .index.db に置き、facts.id を文書IDとする
+    ・どこまで索引したかをログ本体のバイトオフセットで記録し、update() は追記分だけを読む
+    """
+
+    def __init__(self, store: FactStore):
+        self.store = store
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self):
+        """
+        索引DB（ログと同じ .index.db）への接続。プールから借り、終了時にコミットして返す
+        """
+        with connect(self.store.index_path) as conn:
+            if not self._initialized:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS search_postings (
+                        gram    TEXT    NOT NULL,
+                        fact_id INTEGER NOT NULL,
+                        tf      INTEGER NOT NULL,
+                        PRIMARY KEY (gram, fact_id)
+                    ) WITHOUT ROWID
+                """)
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS search_docs (
+                        fact_id INTEGER PRIMARY KEY,
+                        length  INTEGER NOT NULL
+                    )
+                """)
+                conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+                conn.commit()
+                self._initialized = True
+            yield conn
+
+    def update(self) -> int:
+        """
+        前回索引した位置以降に追記された行を索引に加える
+        戻り値: 追加した件数
+        """
+        epoch = str(self.store.epoch())
+        with self._connect() as conn:
+            # 本体が書き換えられていれば索引を作り直す
+            row = conn.execute("SELECT value FROM meta WHERE key = 'search_epoch'").fetchone()
+            if (row[0] if row else "0") != epoch:
+                conn.execute("DELETE FROM search_postings")
+                conn.execute("DELETE FROM search_docs")
+                conn.execute("DELETE FROM meta WHERE key = 'search_offset'")
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('search_epoch', ?)", (epoch,))
+                conn.commit()
+
+            row = conn.execute("SELECT value FROM meta WHERE key = 'search_offset'").fetchone()
+            new_rows, indexed_to = self.store.read_since(int(row[0]) if row else 0)
+            if not new_rows:
+                return 0
+
+            postings, docs = [], []
+            for fact_id, fact in new_rows:
+                grams = ngrams(normalize_text(fact["raw_facts"]))
+                postings.extend((g, fact_id, tf) for g, tf in Counter(grams).items())
+                docs.append((fact_id, len(grams)))
+
+            conn.executemany("INSERT OR REPLACE INTO search_postings VALUES (?, ?, ?)", postings)
+            conn.executemany("INSERT OR REPLACE INTO search_docs VALUES (?, ?)", docs)
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('search_offset', ?)",
+                (str(indexed_to),)
+            )
+            conn.commit()
+            return len(new_rows)
+
+    def search(self, query: str, limit: int = 20, start: str = None, end: str = None) -> list[dict]:
+        """
+        クエリのバイグラムをBM25で採点し、スコアの高い順に返す
+        1文字のクエリはその文字で始まるバイグラムを対象とする
+        start/end: timestamp の範囲（end は含まない）
+        戻り値: [{"case_id", "timestamp", "recorder_id", "raw_facts", "score", "matched"}, ...]
+        matched: クエリのバイグラムのうち文書に含まれた割合
+        """
+        q = normalize_text(query)
+        if not q:
+            return []
+        with self._connect() as conn:
+            n_docs, avg_len = conn.execute(
+                "SELECT COUNT(*), COALESCE(AVG(length), 0) FROM search_docs"
+            ).fetchone()
+            if n_docs == 0:
+                return []
+
+            # バイグラムごとの (fact_id, tf, 文書長)
+            if len(q) == 1:
+                gram_postings = {q: conn.execute("""
+                    SELECT p.fact_id, SUM(p.tf), d.length
+                    FROM search_postings p JOIN search_docs d USING (fact_id)
+                    WHERE p.gram >= ? AND p.gram < ?
+                    GROUP BY p.fact_id
+                """, (q, q + "\U0010ffff")).fetchall()}
+            else:
+                gram_postings = {
+                    g: conn.execute("""
+                        SELECT p.fact_id, p.tf, d.length
+                        FROM search_postings p JOIN search_docs d USING (fact_id)
+                        WHERE p.gram = ?
+                    """, (g,)).fetchall()
+                    for g in set(ngrams(q))
+                }
+
+            scores, matched = Counter(), Counter()
+            for postings in gram_postings.values():
+                df = len(postings)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for fid, tf, length in postings:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len)
+                    scores[fid] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+                    matched[fid] += 1
+
+            conds, params = [], []
+            if start:
+                conds.append("timestamp >= ?")
+                params.append(start)
+            if end:
+                conds.append("timestamp < ?")
+                params.append(end)
+            where = " AND " + " AND ".join(conds) if conds else ""
+            if not scores:
+                return []
+            ranked = [fid for fid, _ in scores.most_common()]
+            hits = []
+            # 期間で除外される分を見込んで多めに取り出す
+            for i in range(0, len(ranked), limit * 4):
+                chunk = ranked[i:i + limit * 4]
+                rows = conn.execute(
+                    f"SELECT id, offset, length FROM facts WHERE id IN ({','.join('?' * len(chunk))}){where}",
+                    chunk + params
+                ).fetchall()
+                found = {fid: (offset, length) for fid, offset, length in rows}
+                hits.extend((fid, found[fid]) for fid in chunk if fid in found)
+                if len(hits) >= limit:
+                    break
+            hits = hits[:limit]
+
+        records = self.store.read_entries([entry for _, entry in hits])
+        n_grams = len(gram_postings)
+        return [
+            {**rec, "score": scores[fid], "matched": matched[fid] / n_grams}
+            for (fid, _), rec in zip(hits, records)
+        ]
@@ -0,0 +1,140 @@
+import math
+import threading
+from array import array
+from collections import Counter
+
+from fact_log import FactStore
+from fact_search import normalize_text, ngrams
+
+# 類似事例として表示する最低の類似度（コサイン類似度）
+MIN_SIMILARITY = 0.15
+
+class SimilarCases:
+    """
+    事実ログの文字バイグラム TF-IDF による類似事例検索
+    ・文書×バイグラムの疎行列をCSR形式（indptr・indices・data）でメモリに持つ
+      data はサブリニアTF（1 + log tf）、IDF は検索時に現在の件数から求める
+    ・update() はログの追記分だけを行として足す（全件の作り直しはしない）
+    ・類似度は疎行列×クエリベクトルを np.bincount でまとめて計算する（scipy の csr @ q 相当）
+    """
+
+    def __init__(self, store: FactStore):
+        self.store = store
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.epoch = self.store.epoch()
+        self.vocab = {}                 # バイグラム -> 列番号
+        self.df = array("q")            # 列ごとの出現文書数
+        self.indptr = array("q", [0])
+        self.indices = array("q")
+        self.data = array("f")
+        self.fact_ids = []              # 行番号 -> facts.id
+        self.offset = 0                 # ログ本体のどこまで読み込んだか
+        self._arrays = None             # NumPy配列に変換した行列とノルム（追記があると作り直す）
+
+    def update(self) -> int:
+        """
+        前回以降に追記された事例を行列に加える
+        戻り値: 追加した件数
+        """
+        with self._lock:
+            # 本体が書き換えられていれば最初から読み直す
+            if self.store.epoch() != self.epoch:
+                self._reset()
+            new_rows, self.offset = self.store.read_since(self.offset)
+            for fact_id, fact in new_rows:
+                counts = Counter(ngrams(normalize_text(fact["raw_facts"])))
+                for gram, tf in counts.items():
+                    col = self.vocab.get(gram)
+                    if col is None:
+                        col = self.vocab[gram] = len(self.vocab)
+                        self.df.append(0)
+                    self.df[col] += 1
+                    self.indices.append(col)
+                    self.data.append(1 + math.log(tf))
+                self.indptr.append(len(self.indices))
+                self.fact_ids.append(fact_id)
+            if new_rows:
+                self._arrays = None
+            return len(new_rows)
+
+    def _matrix(self):
+        """
+        CSR行列・IDF・各行のノルムをNumPy配列で返す（追記がなければ前回の結果を使う）
+        """
+        import numpy as np
+
+        if self._arrays is None:
+            n_docs = len(self.fact_ids)
+            # 追記できるよう array 側のバッファは手放す（コピーを持つ）
+            indptr = np.frombuffer(self.indptr, dtype=np.int64).copy()
+            indices = np.frombuffer(self.indices, dtype=np.int64).copy()
+            data = np.frombuffer(self.data, dtype=np.float32).astype(np.float64)
+            df = np.frombuffer(self.df, dtype=np.int64).copy()
+            # scikit-learn の smooth_idf と同じ式
+            idf = np.log((1 + n_docs) / (1 + df)) + 1
+            rows = np.repeat(np.arange(n_docs), np.diff(indptr))
+            norms = np.sqrt(np.bincount(rows, weights=(data * idf[indices]) ** 2, minlength=n_docs))
+            self._arrays = (rows, indices, data, idf, norms)
+        return self._arrays
+
+    def query(self, text: str, k: int = 5, exclude_case_id: str = None) -> list[dict]:
+        """
+        text に類似した過去事例を類似度の高い順に最大 k 件返す
+        戻り値: [{"case_id", "timestamp", "recorder_id", "raw_facts", "similarity"}, ...]
+        """
+        import numpy as np
+
+        counts = Counter(ngrams(normalize_text(text)))
+        with self._lock:
+            if not self.fact_ids:
+                return []
+            rows, indices, data, idf, norms = self._matrix()
+            fact_ids = self.fact_ids[:len(norms)]
+            cols = [(self.vocab[g], tf) for g, tf in counts.items() if g in self.vocab]
+        if not cols:
+            return []
+
+        # クエリベクトル（語彙にないバイグラムは除く）
+        col_idx = np.array([c for c, _ in cols])
+        q = np.array([1 + math.log(tf) for _, tf in cols]) * idf[col_idx]
+        q_norm = np.sqrt((q ** 2).sum())
+        q_dense = np.zeros(len(idf))
+        q_dense[col_idx] = q * idf[col_idx]
+
+        dots = np.bincount(rows, weights=data * q_dense[indices], minlength=len(norms))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sims = np.where(norms > 0, dots / (norms * q_norm), 0.0)
+
+        # 自分自身（直前に保存した事例）を除く分を見込んで k + 1 件を取り出す
+        m = min(k + 1, len(sims))
+        top = np.argpartition(-sims, m - 1)[:m]
+        top = top[np.argsort(-sims[top])]
+        hits = [(fact_ids[i], float(sims[i])) for i in top if sims[i] >= MIN_SIMILARITY]
+        records = self.store.read_entries(self.store.locate([fid for fid, _ in hits]))
+        results = [
+            {**rec, "similarity": sim}
+            for (_, sim), rec in zip(hits, records)
+            if rec["case_id"] != exclude_case_id
+        ]
+        return results[:k]
+
+def format_similar_cases(cases: list[dict], max_chars: int = 300) -> str:
+    """
+    類似事例をプロンプトに差し込むための文章にする（長い事実は先頭のみ）
+    """
+    if not cases:
+        return ""
+    lines = [
+        "",
+        "## 参考：類似の過去事例（同じ原因の再発でないか、分析の際に照合してください）",
+    ]
+    for c in cases:
+        facts = c["raw_facts"].strip()
+        if len(facts) > max_chars:
+            facts = facts[:max_chars] + "…"
+        lines.append(f"### 事例ID: {c['case_id']}（{c['timestamp']}、類似度 {c['similarity']:.2f}）")
+        lines.append(facts)
+    return "\n".join(lines) + "\n"
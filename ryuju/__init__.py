@@ -0,0 +1,8 @@
+"""
+龍樹（RyuJu）各アプリ（P-FMEA・Safety・Quality・過去事例検索）の共通処理
+・auth:    ログイン認証
+・storage: データフォルダの作成・事実ログへの保存
+・master:  P-FMEAのマスタデータ
+・lazy:    重い依存（pandas・openpyxl・altair）の遅延読み込み
+起動を軽くするため、ここでは各モジュールを読み込まない
+"""
@@ -0,0 +1,59 @@
+import streamlit as st
+
+# TODO: 本番運用時はDB照合やハッシュ化を行うが、現在は簡易チェックとする
+CORRECT_PASSWORD = "wako0001"
+
+def check_password(title: str = "龍樹（RyuJu）") -> bool:
+    """
+    ログイン認証を行う関数。
+    セッションステートを使用してログイン状態を保持する（同じセッション内の全アプリで共有）。
+    title: ログイン画面の見出し（「〇〇 ログイン」と表示する）
+    """
+    # セッションステートの初期化（未定義ならFalseに設定）
+    if "logged_in" not in st.session_state:
+        st.session_state.logged_in = False
+
+    # ログイン済みなら何もしない（メイン処理へ進む）
+    if st.session_state.logged_in:
+        return True
+
+    # --- ログイン画面のUI ---
+    st.markdown(f"## 🔒 {title} ログイン")
+    st.info("社員番号とパスワードを入力してください。")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        # 社員番号入力（最大文字数を指定して誤入力を防ぐ）
+        input_emp_id = st.text_input("社員番号（数字4桁）", max_chars=4, placeholder="例：1234")
+    with col2:
+        # パスワード入力（type='password'で伏せ字にする）
+        input_password = st.text_input("パスワード", type="password")
+
+    if st.button("ログイン", type="primary"):
+        # バリデーション：数字4桁かチェック
+        if not input_emp_id.isdigit() or len(input_emp_id) != 4:
+            st.error("❌ 社員番号は「数字4桁」で入力してください。")
+            return False
+
+        # パスワードチェック
+        if input_password == CORRECT_PASSWORD:
+            st.session_state.logged_in = True
+            st.session_state.emp_id = input_emp_id  # 社員番号を記録（ログの記録者に使う）
+            st.success("ログイン成功")
+            st.rerun()  # 画面を再読み込みしてメインアプリを表示
+            return True
+        else:
+            st.error("❌ パスワードが違います。")
+            return False
+
+    return False
+
+def logout_button():
+    """
+    サイドバー用：ログイン中の社員番号とログアウトボタン
+    """
+    current_user = st.session_state.get("emp_id", "Unknown")
+    st.caption(f"ログイン中: 社員番号 {current_user}")
+    if st.button("ログアウト", type="secondary"):
+        st.session_state.logged_in = False
+        st.rerun()
@@ -0,0 +1,87 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# DBファイルごとに手元に残しておく接続の数（同時に使う数はこれを超えてもよい）
+POOL_SIZE = 4
+
+class ConnectionPool:
+    """
+    SQLite接続のプール（DBファイルごとに1つ、プロセス内で共有）
+    ・接続はスレッドをまたいで使い回す（check_same_thread=False）。1つの接続を同時に使うのは1スレッドのみ
+    ・正常終了でコミット、例外でロールバックしてからプールに返す。row_factory は返却時に元に戻す
+    ・プロセスが fork された場合やDBファイルが削除された場合は、手元の接続を捨てて開き直す
+    """
+
+    def __init__(self, path: str, size: int = POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _discard_idle(self, close: bool):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            if close:
+                conn.close()
+
+    def _acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            if os.getpid() != self._pid:
+                # fork 前の接続は子プロセスで使えない（閉じずに捨てる）
+                self._discard_idle(close=False)
+                self._pid = os.getpid()
+            elif not os.path.exists(self.path):
+                self._discard_idle(close=True)
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            return sqlite3.connect(self.path, check_same_thread=False)
+
+    def _release(self, conn: sqlite3.Connection):
+        conn.row_factory = None
+        if os.getpid() == self._pid and self._idle.qsize() < self.size:
+            self._idle.put(conn)
+        else:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                conn.close()
+                raise
+            self._release(conn)
+            raise
+        self._release(conn)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(path) -> ConnectionPool:
+    key = os.path.abspath(str(path))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(key)
+        return pool
+
+def connect(path):
+    """
+    プールから接続を借りる（with 文で使う。終了時にコミットしてプールへ返す）
+    例：with connect(DB_PATH) as conn: conn.execute(...)
+    """
+    return get_pool(path).connection()
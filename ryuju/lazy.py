@@ -0,0 +1,51 @@
+import importlib
+import importlib.util
+import sys
+import threading
+
+_lock = threading.Lock()
+
+class LazyModule:
+    """
+    最初に属性を参照した時点でモジュールを読み込む代理オブジェクト
+    読み込みはロック内で importlib.import_module により行うため、Streamlit のセッション（スレッド）から
+    同時に初めて参照しても、読み込み途中のモジュールを参照することはない
+    （importlib.util.LazyLoader は Python 3.12 より前ではスレッドセーフでないため使わない）
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            with _lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+                module = self._module
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+def lazy_import(name: str):
+    """
+    モジュールを、最初に属性を参照した時点で読み込む
+    例：pd = lazy_import("pandas") としておけば、pd.DataFrame を使うまで pandas を読み込まない
+    既に読み込み済みの場合はそのモジュールを返す
+    注意：型注釈で pd.DataFrame などを書く場合は from __future__ import annotations を併用する
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    return LazyModule(name)
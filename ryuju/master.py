@@ -0,0 +1,18 @@
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+
+MASTER_PATH = Path(__file__).resolve().parent.parent / "PFMEA" / "master_data.json"
+
+@lru_cache(maxsize=4)
+def _load(path: str, mtime: float) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def load_master(path: Path = MASTER_PATH) -> dict:
+    """
+    マスタデータ（master_data.json）を返す
+    プロセス内で共有し、ファイルが更新されたときだけ読み直す（呼び出し側で書き換えないこと）
+    """
+    return _load(str(path), os.path.getmtime(path))
@@ -0,0 +1,77 @@
+"""
+各アプリの読み込み時間と常駐メモリを測る
+使い方: python -m ryuju.measure_startup [--repeat 3]
+アプリごとに新しいプロセスでモジュールを読み込み（main() は実行しない）、
+最速の回の時間・最大常駐メモリ（RSS）と、pandas・openpyxl が読み込まれたかを表示する
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# (アプリのフォルダ, モジュール名)
+APPS = [
+    ("PFMEA",         "app_a"),
+    ("PFMEA",         "app_b"),
+    ("PFMEA",         "app_c"),
+    ("Script/Script", "RyuJu_Safety_App"),
+    ("Script/Script", "RyuJu_Quality_App"),
+    ("Script/Script", "RyuJu_Search_App"),
+]
+
+# 子プロセスで実行するコード（遅延読み込み中のモジュールは「読み込み済み」と数えない）
+PROBE = r'''
+import importlib, json, sys, time
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+elapsed = (time.perf_counter() - start) * 1000
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+except ImportError:
+    rss = None
+print(json.dumps({
+    "ms": elapsed,
+    "rss_mb": rss,
+    "pandas": "pandas.core.frame" in sys.modules,
+    "openpyxl": "openpyxl.workbook" in sys.modules,
+}))
+'''
+
+def measure(app_dir: str, module: str, repeat: int) -> dict | None:
+    """
+    戻り値: 最速の回の {"ms", "rss_mb", "pandas", "openpyxl"}（読み込みに失敗した場合は None）
+    """
+    runs = []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-c", PROBE, module],
+            cwd=ROOT_DIR / app_dir, env=os.environ.copy(),
+            capture_output=True, text=True
+        )
+        lines = [l for l in proc.stdout.splitlines() if l.startswith("{")]
+        if proc.returncode != 0 or not lines:
+            print(f"{module}: 読み込みに失敗しました\n{proc.stderr[-1000:]}", file=sys.stderr)
+            return None
+        runs.append(json.loads(lines[-1]))
+    return min(runs, key=lambda r: r["ms"])
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="各アプリの読み込み時間と常駐メモリを測る")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="アプリごとの測定回数（最速の回を表示）")
+    args = arg_parser.parse_args()
+
+    print(f"{'アプリ':<20}{'時間(ms)':>10}{'RSS(MB)':>10}  pandas  openpyxl")
+    for app_dir, module in APPS:
+        r = measure(app_dir, module, args.repeat)
+        if r is None:
+            continue
+        rss = f"{r['rss_mb']:.1f}" if r["rss_mb"] is not None else "-"
+        print(f"{module:<20}{r['ms']:>10.0f}{rss:>10}  {'○' if r['pandas'] else '-':^6}  {'○' if r['openpyxl'] else '-':^8}")
+
+if __name__ == "__main__":
+    main()
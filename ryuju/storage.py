@@ -0,0 +1,76 @@
+import datetime
+import os
+import shutil
+
+import streamlit as st
+
+def ensure_data_dir(data_dir: str) -> bool:
+    """
+    データ保存用のフォルダが存在するか確認し、なければ作成する。
+    現場のPC環境で権限エラー等が発生した場合に備え、例外処理を入れる。
+    戻り値: フォルダが使えるかどうか
+    """
+    if os.path.isdir(data_dir):
+        return True
+    try:
+        os.makedirs(data_dir, exist_ok=True)
+        return True
+    except Exception as e:
+        st.error(f"【システムエラー】フォルダ作成に失敗しました: {e}")
+        return False
+
+def save_fact(store, fact_text: str, case_id: str, similar=None) -> str | bool:
+    """
+    入力された事実を事実ログ（fact_log.FactStore）に保存する。
+    タイムスタンプ・事例ID・記録者（ログイン中の社員番号）を付与する。
+    similar: 類似事例検索（fact_similar.SimilarCases）。渡した場合は追記分をすぐ反映する
+    戻り値: 事例ID（失敗時は False）
+    """
+    if store.dir:
+        ensure_data_dir(store.dir)
+    new_data = {
+        "timestamp":   datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "case_id":     case_id,
+        "recorder_id": st.session_state.get("emp_id", "Unknown"),
+        "raw_facts":   fact_text,
+    }
+    try:
+        # ロックを取ってログ本体に追記し、日時・ID・記録者の索引にも登録する。
+        store.append(new_data)
+        if similar is not None:
+            similar.update()
+        return case_id
+    except Exception as e:
+        st.error(f"【ログ保存エラー】ログへの書き込みに失敗しました: {e}")
+        return False
+
+def migrate_legacy_data_dir(data_dir: str, prefixes: list[str]) -> list[str]:
+    """
+    旧保存先（起動時の作業フォルダ直下の data/）に残っているファイルを data_dir へ移す。
+    保存先をアプリのフォルダ基準に変える前は、アプリのフォルダ以外から起動すると
+    作業フォルダ側に保存されていたため、そのままでは過去のログ・DBが見えなくなる。
+    prefixes: 移すファイル名の接頭辞（例："safety_fact_log"・"analysis.db"）。接頭辞ごとにまとめて移す
+    移動先に同じ接頭辞のファイルが既にある場合は混ぜずに残し、警告を表示する。
+    戻り値: 移したファイル名
+    """
+    legacy_dir = os.path.abspath("data")
+    if os.path.normcase(legacy_dir) == os.path.normcase(os.path.abspath(data_dir)) or not os.path.isdir(legacy_dir):
+        return []
+    moved = []
+    for prefix in prefixes:
+        names = [n for n in os.listdir(legacy_dir) if n.startswith(prefix)]
+        if not names:
+            continue
+        existing = os.listdir(data_dir) if os.path.isdir(data_dir) else []
+        if any(n.startswith(prefix) for n in existing):
+            st.warning(
+                f"旧保存先 {legacy_dir} に「{prefix}」のデータが残っていますが、"
+                f"新しい保存先 {data_dir} にも同じデータがあるため移していません。"
+                "必要に応じて管理者が統合してください。"
+            )
+            continue
+        os.makedirs(data_dir, exist_ok=True)
+        for name in names:
+            shutil.move(os.path.join(legacy_dir, name), os.path.join(data_dir, name))
+            moved.append(name)
+    return moved
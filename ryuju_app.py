@@ -0,0 +1,41 @@
+import sys
+import streamlit as st
+from pathlib import Path
+
+# ==========================================
+# 龍樹（RyuJu）統合版：全アプリを1つの Streamlit サーバーで動かす
+# 起動: streamlit run ryuju_app.py
+# ・各アプリは従来どおり単独でも起動できる（streamlit run PFMEA/app_a.py など）
+# ・DB接続プール（ryuju.db）・マスタデータ（ryuju.master）・st.cache_resource の索引は
+#   プロセス内で1つを全アプリ・全セッションで共有する
+# ・ログイン状態はセッション内で共有する（どのアプリからでも1回のログインでよい）
+# ==========================================
+ROOT_DIR = Path(__file__).resolve().parent
+
+# 各アプリのモジュール（database・fact_log など）を読み込めるようにする
+for app_dir in (ROOT_DIR, ROOT_DIR / "PFMEA", ROOT_DIR / "Script" / "Script"):
+    if str(app_dir) not in sys.path:
+        sys.path.insert(0, str(app_dir))
+
+from ryuju.auth import check_password
+
+# ページ定義（url_path で各アプリを個別のURLとして開ける。例：http://server:8501/safety）
+PAGES = {
+    "P-FMEA": [
+        st.Page("PFMEA/app_a.py", title="洗い出し",   icon="🌳", url_path="pfmea_a", default=True),
+        st.Page("PFMEA/app_b.py", title="確認・出力", icon="📋", url_path="pfmea_b"),
+        st.Page("PFMEA/app_c.py", title="RPN分析",    icon="📊", url_path="pfmea_c"),
+    ],
+    "安全・品質": [
+        st.Page("Script/Script/RyuJu_Safety_App.py",  title="安全・ヒヤリハット分析", icon="⛑️", url_path="safety"),
+        st.Page("Script/Script/RyuJu_Quality_App.py", title="品質不具合分析",         icon="🔍", url_path="quality"),
+        st.Page("Script/Script/RyuJu_Search_App.py",  title="過去事例検索",           icon="🔎", url_path="search"),
+    ],
+}
+
+st.set_page_config(page_title="龍樹（RyuJu）", page_icon="🐉", layout="wide")
+
+# ログイン前はメニューを隠す（開こうとしたページはログイン後にそのまま表示する）
+page = st.navigation(PAGES, position="sidebar" if st.session_state.get("logged_in") else "hidden")
+if check_password("龍樹（RyuJu）"):
+    page.run()